@@ -0,0 +1,69 @@
+"""
+Usage: bench_gc_strategies.py FILE [options]
+
+Replay the GC activity recorded in a PYPYLOG against the custom GC
+strategies, sweeping their main parameters, and report the peak memory, the
+pause percentiles and the fraction of time spent in the GC for each of them.
+See pypytools.gc.simulator.
+
+Options:
+  --tsc-freq=FREQ   Convert the TSC counter to seconds with the specified
+                    frequency [default: auto]
+"""
+
+import sys
+import time
+from pypytools.pypylog import parse
+from pypytools.gc.custom import DefaultGc, BudgetedGc
+from pypytools.gc.uniform import UniformGc, UniformGcStrategy
+from pypytools.gc.simulator import Trace, simulate
+
+MB = 1024.0 * 1024.0
+
+def configure(cls, **params):
+    return type(cls.__name__, (cls,), params)
+
+def configure_uniform(**params):
+    strategy = configure(UniformGcStrategy, **params)
+    return configure(UniformGc,
+                     make_strategy=lambda self, mem: strategy(mem, self.clock))
+
+def configurations():
+    for growth in (1.2, 1.4, 2.0):
+        yield ('DefaultGc MAX_GROWTH=%s' % growth,
+               configure(DefaultGc, MAX_GROWTH=growth))
+    for budget in (0.0005, 0.002, 0.01):
+        yield ('BudgetedGc PAUSE_BUDGET=%s' % budget,
+               configure(BudgetedGc, PAUSE_BUDGET=budget))
+    for major_collect in (1.5, 1.82, 2.5):
+        yield ('UniformGc MAJOR_COLLECT=%s' % major_collect,
+               configure_uniform(MAJOR_COLLECT=major_collect))
+    for delay in (0.001, 0.01, 0.1):
+        yield ('UniformGc EMERGENCY_DELAY=%s' % delay,
+               configure_uniform(EMERGENCY_DELAY=delay))
+
+def main(argv=None):
+    import docopt
+    args = docopt.docopt(__doc__, argv=argv)
+    freq = parse.get_frequency(args['--tsc-freq'])
+    a = time.time()
+    trace = Trace.from_log(args['FILE'], freq)
+    print 'Trace: %d minor collections, %d major collections (%.2fs)' % (
+        len(trace.minors), len(trace.cycles), time.time() - a)
+    print
+    fmt = '%-32s %10s %10s %10s %10s %10s %8s %8s\n'
+    sys.stdout.write(fmt % ('', 'peak MB', 'p50 ms', 'p99 ms', 'p99.9 ms',
+                            'max ms', 'GC %', 'majors'))
+    for name, cls in configurations():
+        res = simulate(trace, cls).summary()
+        sys.stdout.write(fmt % (name,
+                                format(res['peak_mem'] / MB, '.1f'),
+                                format(res['p50'] * 1e3, '.3f'),
+                                format(res['p99'] * 1e3, '.3f'),
+                                format(res['p99.9'] * 1e3, '.3f'),
+                                format(res['max_pause'] * 1e3, '.3f'),
+                                format(res['gc_share'] * 100, '.2f'),
+                                res['n_majors']))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,132 @@
+"""
+Usage: bench_multihook.py [options]
+
+Measure the overhead of MultiHook for each minor collection, with 0, 1, 4
+and 16 hooks installed, comparing the old loop-based dispatch with the
+generated dispatcher. The hooks are fired directly, so it runs also on
+CPython; the interesting numbers are the ones on PyPy.
+
+Then, measure the cost of a GC event after all the hooks have been
+disabled: it should be the same as if no hook was ever installed. On PyPy,
+this is measured also on the real gc.collect_step and minor collections.
+
+Options:
+  -n N      Number of simulated minor collections [default: 1000000]
+  --real=N  Number of gc.collect_step and of 1MB allocations to run on PyPy
+            [default: 1000]
+"""
+
+import sys
+import time
+import types
+from pypytools import IS_PYPY
+from pypytools.gc import multihook
+from pypytools.gc.multihook import MultiHook, GcHooks
+
+class FakeGc(object):
+    class Hooks(object):
+        on_gc_minor = None
+        on_gc_collect_step = None
+        on_gc_collect = None
+
+    def __init__(self):
+        self.hooks = self.Hooks()
+
+    def fire_minor(self, stats):
+        # what the VM does at each minor collection
+        if self.hooks.on_gc_minor:
+            self.hooks.on_gc_minor(stats)
+
+class Counter(object):
+    def __init__(self):
+        self.count = 0
+
+    def on_gc_minor(self, stats):
+        self.count += 1
+
+class Hooks(GcHooks):
+    def on_gc_minor(self, stats):
+        pass
+
+    def on_gc_collect_step(self, stats):
+        pass
+
+    def on_gc_collect(self, stats):
+        pass
+
+# the implementation before the generated dispatcher, kept here for
+# comparison
+def old_on_gc_minor(self, stats):
+    for cb in self.minor_callbacks:
+        cb(stats)
+
+def bench(fn, n):
+    stats = object()
+    a = time.time()
+    for i in xrange(n):
+        fn(stats)
+    return (time.time() - a) / n
+
+def bench_dispatch(n):
+    print '%-8s %14s %14s' % ('hooks', 'loop (ns)', 'generated (ns)')
+    for nhooks in (0, 1, 4, 16):
+        multihook.gc = FakeGc() # don't touch the real gc.hooks
+        mh = MultiHook()
+        for i in range(nhooks):
+            mh.add(Counter())
+        t_old = bench(types.MethodType(old_on_gc_minor, mh), n)
+        t_new = bench(mh.on_gc_minor, n)
+        print '%-8d %14.1f %14.1f' % (nhooks, t_old * 1e9, t_new * 1e9)
+
+def bench_disabled(n):
+    print
+    print '%-24s %14s' % ('simulated minor', 'time (ns)')
+    fakegc = multihook.gc = FakeGc()
+    t_never = bench(fakegc.fire_minor, n)
+    mh = MultiHook()
+    counter = Counter()
+    mh.add(counter)
+    t_enabled = bench(fakegc.fire_minor, n)
+    mh.remove(counter)
+    t_disabled = bench(fakegc.fire_minor, n)
+    print '%-24s %14.1f' % ('never installed', t_never * 1e9)
+    print '%-24s %14.1f' % ('1 hook', t_enabled * 1e9)
+    print '%-24s %14.1f' % ('installed and removed', t_disabled * 1e9)
+
+def run_real(n):
+    import gc
+    a = time.time()
+    for i in xrange(n):
+        gc.collect_step()
+    t_steps = (time.time() - a) / n
+    a = time.time()
+    for i in xrange(n):
+        s = 'x' * (1024*1024) # trigger the minor collections
+    t_alloc = (time.time() - a) / n
+    return t_steps, t_alloc
+
+def bench_real(n):
+    print
+    print '%-24s %18s %18s' % ('real gc', 'collect_step (us)', 'alloc 1MB (us)')
+    multihook.gc = __import__('gc')
+    MultiHook._instance = None
+    results = [('never installed', run_real(n))]
+    h = Hooks()
+    h.enable()
+    results.append(('3 hooks', run_real(n)))
+    h.disable()
+    results.append(('installed and removed', run_real(n)))
+    for name, (t_steps, t_alloc) in results:
+        print '%-24s %18.2f %18.2f' % (name, t_steps * 1e6, t_alloc * 1e6)
+
+def main(argv=None):
+    import docopt
+    args = docopt.docopt(__doc__, argv=argv)
+    n = int(args['-n'])
+    bench_dispatch(n)
+    bench_disabled(n)
+    if IS_PYPY:
+        bench_real(int(args['--real']))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
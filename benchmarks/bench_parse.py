@@ -0,0 +1,109 @@
+"""
+Usage: bench_parse.py [options]
+
+Compare the line-by-line parser with the mmap fast path on a synthetic log.
+
+Options:
+  --size=MB     Approximate size of the generated log [default: 200]
+  --minors=N    Number of gc-minor sections for each JIT loop in the
+                generated log [default: 10]
+  --log=FILE    Use an existing log instead of generating one
+"""
+
+import os
+import sys
+import time
+import tempfile
+from pypytools.pypylog import parse
+
+GC_MINOR = """\
+[{0:x}] {{gc-minor
+[{1:x}] {{gc-minor-walkroots
+[{2:x}] gc-minor-walkroots}}
+minor collect, total memory used: 123456789
+number of pinned objects: 0
+total size of surviving objects: 1234
+[{3:x}] gc-minor}}
+"""
+
+JIT_LOOP_HEADER = """\
+[{0:x}] {{jit-log-opt-loop
+# Loop 42 (<code object f, file 'foo.py', line 1> #12 FOR_ITER) : loop with 200 ops
+[p0, p1, p2, i3, i4]
+"""
+
+JIT_LOOP_OP = """\
+debug_merge_point(0, 0, '<code object f. file 'foo.py'. line 1> #20 LOAD_FAST')
++150: i{0} = int_add(i4, 1)
++154: guard_no_overflow(descr=<Guard0x7f1234567890>) [p0, p1, p2, i{0}]
+"""
+
+JIT_LOOP_FOOTER = """\
++300: jump(p0, p1, p2, i3, i4, descr=TargetToken(140000000000))
++400: --end of the loop--
+[{0:x}] jit-log-opt-loop}}
+"""
+
+JIT_BACKEND_DUMP = """\
+[{0:x}] {{jit-backend-dump
+BACKEND x86_64
+SYS_EXECUTABLE python
+CODE_DUMP @7f1234560000 +0  {1}
+[{2:x}] jit-backend-dump}}
+"""
+
+def generate(fname, size, minors):
+    ts = 0x1000000
+    code = '4883EC08' * 2048
+    with open(fname, 'w') as f:
+        while f.tell() < size:
+            for i in range(minors):
+                f.write(GC_MINOR.format(ts, ts+10, ts+20, ts+100))
+                ts += 200
+            f.write(JIT_LOOP_HEADER.format(ts))
+            for i in range(500):
+                f.write(JIT_LOOP_OP.format(i))
+            f.write(JIT_LOOP_FOOTER.format(ts+10000))
+            f.write(JIT_BACKEND_DUMP.format(ts+10100, code, ts+10200))
+            ts += 20000
+
+def bench(name, fn):
+    a = time.time()
+    n = 0
+    for ev in fn():
+        n += 1
+    t = time.time() - a
+    print '%-12s %8.3f s  (%d events)' % (name, t, n)
+    return t
+
+def main(argv=None):
+    import docopt
+    args = docopt.docopt(__doc__, argv=argv)
+    fname = args['--log']
+    tmp = None
+    if fname is None:
+        size = int(args['--size']) * 1024 * 1024
+        fd, tmp = tempfile.mkstemp(suffix='.pypylog')
+        os.close(fd)
+        fname = tmp
+        generate(fname, size, int(args['--minors']))
+    try:
+        print 'Log size: %.1f MB' % (os.path.getsize(fname) / (1024.0*1024))
+        for cls in (parse.FlatParser, parse.GcParser):
+            print cls.__name__
+            def slow():
+                with open(fname) as f:
+                    for ev in cls(None).iter_events(f):
+                        yield ev
+            def fast():
+                return cls(None).iter_path(fname)
+            t_slow = bench('line-by-line', slow)
+            t_fast = bench('mmap', fast)
+            print '%-12s %8.2fx' % ('speedup', t_slow / t_fast)
+            print
+    finally:
+        if tmp is not None:
+            os.remove(tmp)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
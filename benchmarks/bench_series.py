@@ -0,0 +1,79 @@
+"""
+Usage: bench_series.py [options]
+
+Compare the old loop-based construction of Series and step charts with the
+vectorized one.
+
+Options:
+  -n N      Number of events [default: 1000000]
+"""
+
+import sys
+import time
+import numpy as np
+from pypytools.pypylog import model
+
+# the implementations before vectorization, kept here for comparison
+
+def old_from_points(points):
+    res = model.Series(len(points))
+    for i, (x, y) in enumerate(points):
+        res.X[i] = x
+        res.Y[i] = y
+    return res
+
+def old_from_events(events):
+    return old_from_points([ev.as_point() for ev in events])
+
+def old_make_step_chart(events):
+    n = len(events)
+    s = model.Series(n*6)
+    i = 0
+    for ev in events:
+        _, h = ev.as_point()
+        s[i+0] = (ev.start, 0)
+        s[i+1] = (ev.start, h)
+        s[i+2] = (ev.start, h)
+        s[i+3] = (ev.end, h)
+        s[i+4] = (ev.end, h)
+        s[i+5] = (ev.end, 0)
+        i += 6
+    return s
+
+def bench(name, fn, *args):
+    a = time.time()
+    fn(*args)
+    t = time.time() - a
+    print '%-36s %8.3f s' % (name, t)
+    return t
+
+def main(argv=None):
+    import docopt
+    args = docopt.docopt(__doc__, argv=argv)
+    n = int(args['-n'])
+    start = np.cumsum(np.random.uniform(0, 0.01, n))
+    end = start + np.random.uniform(0, 0.001, n)
+    events = [model.Event('%x' % i, 'gc-minor', float(a), float(b))
+              for i, (a, b) in enumerate(zip(start, end))]
+    log = model.ColumnarPyPyLog()
+    for ev in events:
+        log.add_event(ev)
+    columns = log.sections['gc-minor']
+    print '%d events' % n
+    print
+    t_old = bench('old from_events(list)', old_from_events, events)
+    t_list = bench('new from_events(list)', model.Series.from_events, events)
+    t_cols = bench('new from_events(EventColumns)',
+                   model.Series.from_events, columns)
+    print 'speedup: %.1fx (list), %.1fx (columns)' % (t_old / t_list,
+                                                       t_old / t_cols)
+    print
+    t_old = bench('old make_step_chart(list)', old_make_step_chart, events)
+    t_list = bench('new make_step_chart(list)', model.make_step_chart, events)
+    t_cols = bench('new make_step_chart(EventColumns)',
+                   model.make_step_chart, columns)
+    print 'speedup: %.1fx (list), %.1fx (columns)' % (t_old / t_list,
+                                                       t_old / t_cols)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -2,6 +2,7 @@ import sys
 import gc
 from contextlib import contextmanager
 from pypytools import IS_PYPY
+from pypytools.util import clock as default_clock
 from pypytools.gc.multihook import GcHooks
 
 KB = 1024.0
@@ -10,11 +11,31 @@ MB = KB * KB
 class CustomGc(GcHooks):    
     """
     GC with custom logic which is triggered by hooks. Override on_gc_minor to
-    implement your custom logic
+    implement your custom logic.
+
+    clock is the function used to measure the time, by default
+    pypytools.util.clock: it is monotonic on Python 3 and on PyPy2 (see
+    CLOCK_IS_MONOTONIC), while on CPython 2 it is the wall clock.
     """
 
-    def __init__(self):
+    def __init__(self, clock=None):
         self._isenabled = False
+        self.nogc_count = 0
+        if clock is None:
+            clock = default_clock
+        self.clock = clock
+
+    @contextmanager
+    def nogc(self):
+        """
+        Inside a nogc() section, on_gc_minor is supposed to do nothing: use it
+        to avoid running it recursively when it calls gc.collect_step
+        """
+        try:
+            self.nogc_count += 1
+            yield self
+        finally:
+            self.nogc_count -= 1
 
     def isenabled(self):
         return self._isenabled
@@ -44,26 +65,17 @@ class DefaultGc(CustomGc):
     MIN_THRESHOLD = 4*8 * MB  # same as PYPY_GC_MIN
     MAX_GROWTH = 1.4          # same as PYPY_GC_GROWTH
 
-    def __init__(self):
-        super(DefaultGc, self).__init__()
+    def __init__(self, clock=None):
+        super(DefaultGc, self).__init__(clock)
         self.major_in_progress = False
         self.threshold = 0
         self.update_threshold(0)
-        self.nogc_count = 0
 
     def update_threshold(self, mem):
         self.threshold = max(self.MIN_THRESHOLD,
                              min(mem * self.MAJOR_COLLECT,
                                  self.threshold * self.MAX_GROWTH))
 
-    @contextmanager
-    def nogc(self):
-        try:
-            self.nogc_count += 1
-            yield self
-        finally:
-            self.nogc_count -= 1
-
     def on_gc_minor(self, stats):
         if self.nogc_count > 0:
             return
@@ -87,3 +99,81 @@ class DefaultGc(CustomGc):
             elif stats.total_memory_used > self.threshold:
                 self.major_in_progress = True
                 gc.collect_step()
+
+
+class BudgetedGc(DefaultGc):
+    """
+    Like DefaultGc, but once a major collection is in progress, run as many
+    gc.collect_step as fit into PAUSE_BUDGET seconds at each minor
+    collection, instead of exactly one.
+
+    The cost of the next step is estimated with an exponential moving average
+    of the steps done in the same phase of the GC (e.g., marking steps are
+    usually much more expensive than sweeping ones). At least one step is
+    always done, to guarantee progress.
+
+    If MEMORY_CEILING is set and the memory used grows above it, the major
+    collection is finished immediately, regardless of the budget.
+    """
+
+    PAUSE_BUDGET = 0.002    # seconds per minor collection
+    MEMORY_CEILING = None   # bytes
+    STEP_COST_ALPHA = 0.3   # weight of the last step in the moving average
+    STATE_SCANNING = 0      # the value of stats.newstate at the end of a major
+
+    def __init__(self, clock=None):
+        super(BudgetedGc, self).__init__(clock)
+        self.phase = self.STATE_SCANNING # the phase of the next step
+        self.step_cost = {}              # phase -> estimated cost
+        self.last_step_cost = 0.0
+        self.last_pause = 0.0            # time spent in the last on_gc_minor
+
+    def estimate_step_cost(self, phase):
+        return self.step_cost.get(phase, self.last_step_cost)
+
+    def record_step_cost(self, phase, duration):
+        old = self.step_cost.get(phase)
+        if old is None:
+            self.step_cost[phase] = duration
+        else:
+            a = self.STEP_COST_ALPHA
+            self.step_cost[phase] = a * duration + (1 - a) * old
+        self.last_step_cost = duration
+
+    def on_gc_minor(self, stats):
+        if self.nogc_count > 0:
+            return
+
+        # see DefaultGc.on_gc_minor for why we need nogc()
+        with self.nogc():
+            mem = stats.total_memory_used
+            if self.MEMORY_CEILING is not None and mem > self.MEMORY_CEILING:
+                self.major_in_progress = True
+                self.run_steps(mem, budget=None)
+            elif self.major_in_progress or mem > self.threshold:
+                self.major_in_progress = True
+                self.run_steps(mem, budget=self.PAUSE_BUDGET)
+
+    def run_steps(self, mem, budget):
+        """
+        Run gc.collect_step until the end of the major collection, or until
+        the next step would not fit into the budget. If budget is None, finish
+        the major collection.
+        """
+        start = self.clock()
+        t0 = start
+        while True:
+            step_stats = gc.collect_step()
+            t1 = self.clock()
+            self.record_step_cost(self.phase, t1 - t0)
+            t0 = t1
+            if step_stats.major_is_done:
+                self.phase = self.STATE_SCANNING
+                self.major_in_progress = False
+                self.update_threshold(mem)
+                break
+            self.phase = step_stats.newstate
+            if (budget is not None and
+                t1 - start + self.estimate_step_cost(self.phase) > budget):
+                break
+        self.last_pause = t1 - start
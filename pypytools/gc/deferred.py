@@ -0,0 +1,168 @@
+"""
+GC hooks which do the minimum amount of work inside the GC: the stats are
+copied into a preallocated ring buffer, and delivered in batches later, from
+a background thread or when the user program calls flush().
+"""
+import threading
+from array import array
+from collections import namedtuple
+from pypytools.gc.multihook import GcHooks
+
+NaN = float('nan')
+
+# the fields of the stats passed by PyPy to the hooks
+MINOR_FIELDS = ('count', 'duration', 'duration_min', 'duration_max',
+                'total_memory_used', 'pinned_objects')
+STEP_FIELDS = ('count', 'duration', 'duration_min', 'duration_max',
+               'oldstate', 'newstate', 'major_is_done')
+COLLECT_FIELDS = ('count', 'num_major_collects', 'arenas_count_before',
+                  'arenas_count_after', 'arenas_bytes',
+                  'rawmalloc_bytes_before', 'rawmalloc_bytes_after')
+
+MinorRecord = namedtuple('MinorRecord', MINOR_FIELDS)
+StepRecord = namedtuple('StepRecord', STEP_FIELDS)
+CollectRecord = namedtuple('CollectRecord', COLLECT_FIELDS)
+
+
+class RingBuffer(object):
+    """
+    Store the given fields of up to capacity stats objects, as floats. If
+    the buffer is full, the oldest records are overwritten and counted in
+    self.dropped.
+
+    record() is called inside the GC hooks and drain() by the consumer,
+    possibly from another thread. They don't use locks: a GC hook can run in
+    the middle of drain(), in the very same thread, so a lock would
+    deadlock. Instead, record() only ever increases self.head, and drain()
+    discards the records which might have been overwritten while it was
+    copying them. There is one more slot than capacity, so that a record()
+    in progress never overwrites a record which has already been counted.
+    """
+
+    def __init__(self, record_class, capacity):
+        self.record_class = record_class
+        self.fields = record_class._fields
+        self.nfields = len(self.fields)
+        self.capacity = capacity
+        self.nslots = capacity + 1
+        self.data = array('d', [0.0]) * (self.nslots * self.nfields)
+        self.head = 0 # total number of records written
+        self.tail = 0 # total number of records consumed
+        self.dropped = 0
+
+    def record(self, stats):
+        i = (self.head % self.nslots) * self.nfields
+        data = self.data
+        for name in self.fields:
+            data[i] = getattr(stats, name, NaN)
+            i += 1
+        self.head += 1
+
+    def __len__(self):
+        return min(self.head - self.tail, self.capacity)
+
+    def drain(self):
+        """
+        Return the list of the records written since the last call, as
+        instances of record_class
+        """
+        head = self.head
+        start = max(self.tail, head - self.capacity)
+        values = []
+        for k in range(start, head):
+            i = (k % self.nslots) * self.nfields
+            values.append(self.data[i:i+self.nfields])
+        # the records which have been written in the meantime might have
+        # overwritten the oldest ones that we copied
+        first_valid = self.head - self.capacity
+        if first_valid > start:
+            values = values[first_valid - start:]
+            start = first_valid
+        self.dropped += start - self.tail
+        self.tail = head
+        return [self.record_class(*v) for v in values]
+
+
+class DeferredGcHooks(GcHooks):
+    """
+    Like GcHooks, but override on_gc_minor_batch, on_gc_collect_step_batch
+    and/or on_gc_collect_batch: they receive lists of MinorRecord,
+    StepRecord and CollectRecord. All the values are floats.
+
+    The records are delivered when calling flush(), or periodically by the
+    thread started by start_thread().
+    """
+
+    CAPACITY = 4096
+
+    on_gc_minor_batch = None
+    on_gc_collect_step_batch = None
+    on_gc_collect_batch = None
+
+    def __init__(self, capacity=None):
+        if capacity is None:
+            capacity = self.CAPACITY
+        self.minors = RingBuffer(MinorRecord, capacity)
+        self.steps = RingBuffer(StepRecord, capacity)
+        self.collects = RingBuffer(CollectRecord, capacity)
+        # install the hooks only for the events which we are interested in.
+        # The hooks are directly the bound methods of the buffers, to avoid
+        # an extra call
+        if self.on_gc_minor_batch:
+            self.on_gc_minor = self.minors.record
+        if self.on_gc_collect_step_batch:
+            self.on_gc_collect_step = self.steps.record
+        if self.on_gc_collect_batch:
+            self.on_gc_collect = self.collects.record
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def dropped(self):
+        return (self.minors.dropped + self.steps.dropped +
+                self.collects.dropped)
+
+    def flush(self):
+        """
+        Deliver the pending records to the *_batch methods. Return the number
+        of delivered records.
+        """
+        n = 0
+        for buf, handler in [(self.minors, self.on_gc_minor_batch),
+                             (self.steps, self.on_gc_collect_step_batch),
+                             (self.collects, self.on_gc_collect_batch)]:
+            if handler is None:
+                continue
+            records = buf.drain()
+            if records:
+                handler(records)
+                n += len(records)
+        return n
+
+    def start_thread(self, interval=1.0):
+        """
+        Start a daemon thread which calls flush() every interval seconds
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,),
+                                        name='DeferredGcHooks')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop_thread(self):
+        """
+        Stop the thread started by start_thread(), and deliver the records
+        which are still pending
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.flush()
@@ -0,0 +1,126 @@
+"""
+GC which runs the steps of the major collections while an event loop (e.g.
+asyncio) is idle, instead of inside the GC hooks, i.e. while the program is
+serving requests.
+"""
+from contextlib import contextmanager
+from pypytools.gc.uniform import UniformGc
+
+
+class IdleGc(UniformGc):
+    """
+    Run gc.collect_step from the event loop, when there are no ready
+    callbacks and no requests in flight. Wrap the handling of each request
+    into busy() to defer the GC work until it is done.
+
+    UniformGcStrategy is used to keep track of the memory: when the memory
+    allocated since the start of the current major collection approaches the
+    target, we cannot wait for the loop to be idle and we run the steps
+    directly in the hook, every EMERGENCY_DELAY seconds.
+
+    loop must implement call_later(); if it has the _ready deque of asyncio's
+    loops, it is used to check whether there are callbacks ready to run.
+    """
+
+    POLL_INTERVAL = 0.01    # how often to check if the loop is idle
+    IDLE_BUDGET = 0.005     # maximum time to spend in steps for each poll
+    IDLE_START_RATIO = 0.25 # start a major in idle time when the allocated
+                            # memory reaches this fraction of the target
+    EMERGENCY_RATIO = 0.9   # run the steps in the hook when the allocated
+                            # memory reaches this fraction of the target
+
+    def __init__(self, loop, clock=None):
+        super(IdleGc, self).__init__(clock)
+        self.loop = loop
+        self.in_flight = 0
+        self.major_in_progress = False
+        self.idle_steps = 0
+        self.emergency_steps = 0
+        self._handle = None
+
+    def enable(self):
+        super(IdleGc, self).enable()
+        if self._handle is None:
+            self._schedule(self.POLL_INTERVAL)
+
+    def disable(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        super(IdleGc, self).disable()
+
+    @contextmanager
+    def busy(self):
+        try:
+            self.in_flight += 1
+            yield self
+        finally:
+            self.in_flight -= 1
+
+    def is_idle(self):
+        return self.in_flight == 0 and not getattr(self.loop, '_ready', None)
+
+    def has_work(self):
+        s = self.strategy
+        if s is None:
+            return False
+        return (self.major_in_progress or
+                s.allocated_mem >= s.target_allocated_mem *
+                self.IDLE_START_RATIO)
+
+    def in_emergency(self):
+        s = self.strategy
+        return s.allocated_mem >= s.target_allocated_mem * self.EMERGENCY_RATIO
+
+    def on_gc_minor(self, stats):
+        if self.nogc_count > 0:
+            # see UniformGc.on_gc_minor
+            self.inner_mem = stats.total_memory_used
+            return
+
+        with self.nogc():
+            mem = stats.total_memory_used
+            if self.strategy is None:
+                self.strategy = self.make_strategy(mem)
+                return
+            s = self.strategy
+            s.tick(mem)
+            if (self.in_emergency() and
+                s.last_t >= s.gc_last_step_t + s.EMERGENCY_DELAY):
+                self.collect_step(mem)
+                self.emergency_steps += 1
+
+    def collect_step(self, mem):
+        step_stats = super(IdleGc, self).collect_step(mem)
+        self.major_in_progress = not step_stats.major_is_done
+        return step_stats
+
+    def run_idle_steps(self):
+        """
+        Run steps until the end of the major collection or until we spend
+        more than IDLE_BUDGET
+        """
+        with self.nogc():
+            start = self.clock()
+            while True:
+                step_stats = self.collect_step(self.strategy.last_mem)
+                self.idle_steps += 1
+                if step_stats.major_is_done:
+                    break
+                if self.clock() - start >= self.IDLE_BUDGET:
+                    break
+
+    def _schedule(self, delay):
+        self._handle = self.loop.call_later(delay, self._poll)
+
+    def _poll(self):
+        self._handle = None
+        if not self.isenabled():
+            return
+        if self.is_idle() and self.has_work():
+            self.run_idle_steps()
+            if self.major_in_progress:
+                # let the loop run the other callbacks, then continue
+                self._schedule(0)
+                return
+        self._schedule(self.POLL_INTERVAL)
@@ -2,6 +2,7 @@
 Improve PyPy's GC hooks and make it possible to have multiple callbacks
 """
 from pypytools import IS_PYPY
+from pypytools.codegen import Code
 import gc
 import types
 
@@ -92,26 +93,39 @@ class MultiHook(object):
             if cb:
                 self.collect_callbacks.append(cb)
 
-        if self.minor_callbacks:
-            gc.hooks.on_gc_minor = self.on_gc_minor
-
-        if self.collect_step_callbacks:
-            gc.hooks.on_gc_collect_step = self.on_gc_collect_step
-
-        if self.collect_callbacks:
-            gc.hooks.on_gc_collect = self.on_gc_collect
-    
-    def on_gc_minor(self, stats):
-        for cb in self.minor_callbacks:
-            cb(stats)
-
-    def on_gc_collect_step(self, stats):
-        for cb in self.collect_step_callbacks:
-            cb(stats)
-
-    def on_gc_collect(self, stats):
-        for cb in self.collect_callbacks:
-            cb(stats)
+        self.on_gc_minor = self._make_dispatcher(
+            'on_gc_minor', self.minor_callbacks)
+        self.on_gc_collect_step = self._make_dispatcher(
+            'on_gc_collect_step', self.collect_step_callbacks)
+        self.on_gc_collect = self._make_dispatcher(
+            'on_gc_collect', self.collect_callbacks)
+
+        # uninstall the hooks which have no callbacks: else the VM would
+        # still call into Python at every collection, for nothing
+        self._install('on_gc_minor', self.minor_callbacks)
+        self._install('on_gc_collect_step', self.collect_step_callbacks)
+        self._install('on_gc_collect', self.collect_callbacks)
+
+    def _install(self, name, callbacks):
+        if callbacks:
+            setattr(gc.hooks, name, getattr(self, name))
+        else:
+            setattr(gc.hooks, name, None)
+
+    def _make_dispatcher(self, name, callbacks):
+        """
+        Generate a method which calls all the callbacks one after the other,
+        without looping over the list: the hooks can run thousands of times
+        per second, and this way the JIT can inline the callbacks.
+        """
+        code = Code()
+        with code.def_(name, ['self', 'stats']) as ns:
+            for i, cb in enumerate(callbacks):
+                cbname = code.new_global('cb%d' % i, cb)
+                ns.w('{cb}(stats)', cb=cbname)
+        code.compile()
+        # bind it to self, so that _check_other_hooks recognizes it
+        return types.MethodType(code[name], self)
 
 
 class FakeMultiHook(object):
@@ -0,0 +1,473 @@
+"""
+Simulate a custom GC strategy against a trace recorded from a real program,
+under a virtual clock: it makes it possible to compare strategies and to
+tune their parameters offline, without deploying them.
+
+The trace is extracted from a PYPYLOG containing the gc-minor and
+gc-collect-step sections: for each minor collection it records how long the
+program ran before it, how much it allocated and how long the collection
+took; for each major collection, the duration of each of its steps. The
+simulation replays the minor collections, and whenever the strategy calls
+gc.collect_step it charges the cost of the corresponding recorded step.
+
+The memory model is simple: the program allocates the recorded amount at
+each minor collection, and at the end of a major collection the memory goes
+back to the live memory recorded after the corresponding major collection of
+the trace, plus what has been allocated in the meantime.
+"""
+import bisect
+import heapq
+import math
+from collections import namedtuple
+from contextlib import contextmanager
+from pypytools.gc import multihook
+from pypytools.gc import custom
+from pypytools.gc import uniform
+from pypytools.gc.multihook import MultiHook
+
+# the values of stats.oldstate/newstate, as in gc.GcCollectStepStats
+GC_STATES = ['SCANNING', 'MARKING', 'SWEEPING', 'FINALIZING']
+
+MinorSample = namedtuple('MinorSample', ['user_time', 'alloc', 'duration',
+                                         'live'])
+StepSample = namedtuple('StepSample', ['state', 'duration'])
+
+
+class Trace(object):
+    """
+    minors is a list of MinorSample, cycles a list of major collections,
+    each being a list of StepSample. MinorSample.live is the live memory
+    after the last major collection which was complete before the next minor
+    collection, or the memory reported by the minor collection if none was.
+    initial_mem is the memory used at the beginning of the trace.
+    """
+
+    def __init__(self, minors, cycles, initial_mem=0):
+        if not cycles:
+            raise ValueError('the trace does not contain any complete '
+                             'major collection')
+        self.minors = minors
+        self.cycles = cycles
+        self.initial_mem = initial_mem
+
+    @classmethod
+    def from_log(cls, fname, freq=1):
+        """
+        Parse the given PYPYLOG and extract the trace. The times are in
+        seconds if freq is the frequency of the TSC.
+        """
+        from pypytools.pypylog import parse
+        return cls.from_events(parse.iter_events(fname, freq))
+
+    @classmethod
+    def from_events(cls, events):
+        minors = []
+        steps = []
+        for ev in events:
+            if ev.section == 'gc-minor':
+                minors.append(ev)
+            elif ev.section == 'gc-collect-step':
+                steps.append(ev)
+        minors.sort(key=lambda ev: ev.start)
+        steps.sort(key=lambda ev: ev.start)
+        cycles, cycle_ends = cls._split_cycles(steps)
+        initial_mem = minors[0].memory if minors else 0
+        return cls(cls._make_minors(minors, steps, cycle_ends), cycles,
+                   initial_mem)
+
+    @staticmethod
+    def _split_cycles(steps):
+        """
+        Return (cycles, ends): the list of complete major collections, and
+        the time at which each of them ended
+        """
+        cycles = []
+        ends = []
+        current = []
+        last_phase = None
+        for ev in steps:
+            if current and ev.phase == 'SCANNING' and last_phase != 'SCANNING':
+                # the log does not report the end of the previous cycle
+                cycles.append(current)
+                ends.append(ev.start)
+                current = []
+            state = GC_STATES.index(ev.phase) if ev.phase in GC_STATES else 0
+            current.append(StepSample(state, ev.end - ev.start))
+            last_phase = ev.phase
+            if ev.end_phase == 'SCANNING':
+                cycles.append(current)
+                ends.append(ev.end)
+                current = []
+                last_phase = None
+        return cycles, ends
+
+    @staticmethod
+    def _make_minors(minors, steps, cycle_ends):
+        step_starts = [ev.start for ev in steps]
+        step_ends = [ev.end for ev in steps]
+        # the cumulative time spent in steps, to subtract it from the time
+        # between two minor collections
+        step_cumul = [0.0]
+        for ev in steps:
+            step_cumul.append(step_cumul[-1] + ev.end - ev.start)
+        #
+        def step_time_before(t):
+            return step_cumul[bisect.bisect_left(step_starts, t)]
+        #
+        def inside_step(ev):
+            i = bisect.bisect_right(step_starts, ev.start) - 1
+            return i >= 0 and ev.end <= step_ends[i]
+        #
+        # the live memory after each cycle is the memory reported by the
+        # first top-level minor collection after its end
+        top = [ev for ev in minors if not inside_step(ev)]
+        top_starts = [ev.start for ev in top]
+        lives = []
+        for t in cycle_ends:
+            i = bisect.bisect_left(top_starts, t)
+            if i < len(top):
+                lives.append(top[i].memory)
+        #
+        res = []
+        prev_mem = None
+        prev_end = None
+        # number of cycles complete before the next top-level minor: in the
+        # simulation, the steps done after a minor correspond to the ones
+        # recorded between it and the next one
+        k = 0
+        i = 0 # index of ev in top
+        for ev in minors:
+            if inside_step(ev):
+                prev_mem = ev.memory
+                continue
+            i += 1
+            next_start = top_starts[i] if i < len(top) else float('inf')
+            if prev_end is None:
+                user_time = 0.0
+                alloc = 0
+            else:
+                user_time = ((ev.start - prev_end) -
+                             (step_time_before(ev.start) -
+                              step_time_before(prev_end)))
+                alloc = max(0, ev.memory - prev_mem)
+            while k < len(cycle_ends) and cycle_ends[k] <= next_start:
+                k += 1
+            if k > 0 and lives:
+                live = lives[min(k, len(lives)) - 1]
+            else:
+                # no cycle is complete yet, so we don't know the live
+                # memory: using the one after the first cycle would give
+                # to the strategy information from the future. Assume that
+                # everything allocated so far is alive
+                live = ev.memory
+            res.append(MinorSample(max(0.0, user_time), alloc,
+                                   ev.end - ev.start, live))
+            prev_mem = ev.memory
+            prev_end = ev.end
+        return res
+
+
+class VirtualClock(object):
+    """
+    A clock which advances only when told to, to be passed as the clock of
+    the custom GCs and of UniformGcStrategy
+    """
+
+    def __init__(self, t=0.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+    def advance(self, dt):
+        self.t += dt
+
+
+class SimHandle(object):
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class SimLoop(object):
+    """
+    The subset of the asyncio loop API needed by the GCs driven by an event
+    loop, like IdleGc: the timers expire at the time of the virtual clock,
+    and the Simulator runs them while the program runs between two minor
+    collections.
+
+    The trace does not tell when the program was idle, so the simulation
+    assumes that it is whenever a timer expires: the time spent in the
+    callbacks delays the program, but it does not count as a pause.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.timers = [] # heap of (when, seq, handle)
+        self.seq = 0
+
+    def time(self):
+        return self.clock()
+
+    def call_later(self, delay, callback, *args):
+        handle = SimHandle(self.clock() + delay, callback, args)
+        heapq.heappush(self.timers, (handle.when, self.seq, handle))
+        self.seq += 1
+        return handle
+
+    def pop_timer(self, until):
+        """
+        Return the first timer which expires at or before until, or None
+        """
+        while self.timers:
+            when, _, handle = self.timers[0]
+            if handle.cancelled:
+                heapq.heappop(self.timers)
+            elif when <= until:
+                heapq.heappop(self.timers)
+                return handle
+            else:
+                break
+        return None
+
+
+class Stats(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class SimGc(object):
+    """
+    The subset of the gc module used by the custom GCs: collect_step charges
+    the cost of the recorded steps to the virtual clock
+    """
+
+    class Hooks(object):
+        on_gc_minor = None
+        on_gc_collect_step = None
+        on_gc_collect = None
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.hooks = self.Hooks()
+        self._enabled = True
+
+    def isenabled(self):
+        return self._enabled
+
+    def enable(self):
+        self._enabled = True
+
+    def disable(self):
+        self._enabled = False
+
+    def collect_step(self):
+        return self.sim.collect_step()
+
+
+class SimResult(object):
+
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self, duration, gc_time, peak_mem, pauses, n_steps,
+                 n_majors, loop_gc_time=0.0):
+        self.duration = duration
+        self.gc_time = gc_time
+        # the part of gc_time spent in the callbacks of the SimLoop
+        self.loop_gc_time = loop_gc_time
+        self.peak_mem = peak_mem
+        self.pauses = pauses
+        self.n_minors = len(pauses)
+        self.n_steps = n_steps
+        self.n_majors = n_majors
+
+    @property
+    def gc_share(self):
+        if not self.duration:
+            return 0.0
+        return self.gc_time / self.duration
+
+    def percentile(self, p):
+        """
+        Percentile of the pauses, with the nearest-rank method
+        """
+        if not self.pauses:
+            return 0.0
+        pauses = sorted(self.pauses)
+        rank = int(math.ceil(p * len(pauses) / 100.0))
+        return pauses[max(rank, 1) - 1]
+
+    def summary(self):
+        res = {
+            'duration': self.duration,
+            'gc_time': self.gc_time,
+            'loop_gc_time': self.loop_gc_time,
+            'gc_share': self.gc_share,
+            'peak_mem': self.peak_mem,
+            'n_minors': self.n_minors,
+            'n_steps': self.n_steps,
+            'n_majors': self.n_majors,
+            'max_pause': max(self.pauses) if self.pauses else 0.0,
+        }
+        for p in self.PERCENTILES:
+            res['p%s' % p] = self.percentile(p)
+        return res
+
+
+class Simulator(object):
+    """
+    Run a custom GC against a Trace. make_gc is a callable (typically a
+    CustomGc subclass) which returns the GC to simulate: it is called with
+    the virtual clock as the clock argument.
+
+    The GCs which need an event loop can be simulated by passing a SimLoop
+    on the same clock, and a factory which uses it, e.g.:
+
+        clock = VirtualClock()
+        loop = SimLoop(clock)
+        simulate(trace, lambda clock: IdleGc(loop, clock), clock, loop)
+
+    The gc module used by the custom GCs is replaced during the simulation,
+    so simulations cannot run concurrently in the same process.
+    """
+
+    def __init__(self, trace, make_gc, clock=None, loop=None):
+        if clock is None:
+            clock = VirtualClock()
+        if loop is not None and loop.clock is not clock:
+            raise ValueError('the loop must use the clock of the simulation')
+        self.trace = trace
+        self.make_gc = make_gc
+        self.clock = clock
+        self.loop = loop
+        self.gc = SimGc(self)
+
+    # the module attributes which we replace during the simulation
+    def _patches(self):
+        return [
+            (multihook, 'gc', self.gc),
+            (custom, 'gc', self.gc),
+            (uniform, 'gc', self.gc),
+            (MultiHook, '_instance', None),
+        ]
+
+    @contextmanager
+    def patched(self):
+        saved = []
+        try:
+            for obj, name, value in self._patches():
+                saved.append((obj, name, getattr(obj, name)))
+                setattr(obj, name, value)
+            yield
+        finally:
+            for obj, name, value in reversed(saved):
+                setattr(obj, name, value)
+
+    def run(self):
+        self.mem = self.trace.initial_mem
+        self.peak_mem = self.mem
+        self.live = 0
+        self.cycle = None      # the steps left in the current major
+        self.cycle_alloc = 0   # allocated since the start of the major
+        self.n_cycles = 0
+        self.n_steps = 0
+        self.loop_gc_time = 0.0
+        pauses = []
+        gc_time = 0.0
+        t0 = self.clock.t
+        with self.patched():
+            mygc = self.make_gc(clock=self.clock)
+            mygc.enable()
+            try:
+                for sample in self.trace.minors:
+                    self.run_program(sample.user_time)
+                    self.allocate(sample.alloc)
+                    self.live = sample.live
+                    start = self.clock.t
+                    self.clock.advance(sample.duration)
+                    self.fire_minor(sample.duration)
+                    pause = self.clock.t - start
+                    pauses.append(pause)
+                    gc_time += pause
+            finally:
+                mygc.disable()
+        gc_time += self.loop_gc_time
+        return SimResult(self.clock.t - t0, gc_time, self.peak_mem, pauses,
+                         self.n_steps, self.n_cycles, self.loop_gc_time)
+
+    def run_program(self, user_time):
+        """
+        Let the program run for user_time, and run the timers of the loop
+        which expire in the meantime: the time spent in them delays the
+        program
+        """
+        end = self.clock.t + user_time
+        while self.loop is not None:
+            handle = self.loop.pop_timer(end)
+            if handle is None:
+                break
+            if handle.when > self.clock.t:
+                self.clock.t = handle.when
+            start = self.clock.t
+            handle.callback(*handle.args)
+            spent = self.clock.t - start
+            self.loop_gc_time += spent
+            end += spent
+        self.clock.t = end
+
+    def allocate(self, n):
+        self.mem += n
+        if self.cycle is not None:
+            self.cycle_alloc += n
+        if self.mem > self.peak_mem:
+            self.peak_mem = self.mem
+
+    def fire_minor(self, duration):
+        hook = self.gc.hooks.on_gc_minor
+        if hook:
+            hook(Stats(count=1, duration=duration, duration_min=duration,
+                       duration_max=duration, total_memory_used=self.mem,
+                       pinned_objects=0))
+
+    def collect_step(self):
+        if self.cycle is None:
+            cycles = self.trace.cycles
+            self.cycle = list(cycles[self.n_cycles % len(cycles)])
+            self.cycle_alloc = 0
+        step = self.cycle.pop(0)
+        self.clock.advance(step.duration)
+        self.n_steps += 1
+        if not self.cycle:
+            # as in PyPy, the last step does not invoke the hooks
+            self.cycle = None
+            self.n_cycles += 1
+            self.mem = min(self.mem, self.live + self.cycle_alloc)
+            return Stats(count=1, duration=step.duration,
+                         duration_min=step.duration,
+                         duration_max=step.duration, oldstate=step.state,
+                         newstate=0, major_is_done=True)
+        newstate = self.cycle[0].state
+        stats = Stats(count=1, duration=step.duration,
+                      duration_min=step.duration, duration_max=step.duration,
+                      oldstate=step.state, newstate=newstate,
+                      major_is_done=False)
+        # in PyPy, gc.collect_step also does a minor collection
+        self.fire_minor(0.0)
+        hook = self.gc.hooks.on_gc_collect_step
+        if hook:
+            hook(stats)
+        return stats
+
+
+def simulate(trace, make_gc, clock=None, loop=None):
+    """
+    Run make_gc(clock=clock) against trace, and return a SimResult
+    """
+    return Simulator(trace, make_gc, clock, loop).run()
@@ -0,0 +1,290 @@
+"""
+Ready-made GC hooks which collect statistics about the GC activity: number
+of collections, histograms of the pause times, and memory high-water marks.
+The statistics can be retrieved with snapshot() or in the Prometheus text
+exposition format.
+
+The hooks only update preallocated arrays and counters, so they don't
+allocate (apart from the floats, which the JIT removes) and don't perturb
+the GC which they are measuring.
+"""
+import time
+from array import array
+from bisect import bisect_left
+from pypytools import IS_PYPY
+from pypytools.util import clock
+from pypytools.gc.multihook import GcHooks
+
+# the value of stats.newstate/oldstate when a major collection begins
+STATE_SCANNING = 0
+
+
+def make_bounds(min_value=1e-6, max_value=10.0, sub_buckets=8):
+    """
+    Return the upper bounds of the buckets, in the style of HdrHistogram:
+    each power of 2 starting from min_value is divided into sub_buckets
+    linear buckets, so that the relative error is at most 1/sub_buckets
+    """
+    bounds = []
+    base = float(min_value)
+    while base < max_value:
+        step = base / sub_buckets
+        for i in range(1, sub_buckets + 1):
+            bounds.append(base + step * i)
+        base *= 2
+    return array('d', [min_value] + bounds)
+
+
+def get_timestamp_scale(calibration_time=0.01):
+    """
+    Return the number of seconds per unit of the durations reported by the
+    GC hooks, i.e. of __pypy__.debug_read_timestamp(). If the unit is not
+    'ns' (e.g. it is 'tsc'), it is measured against util.clock during
+    calibration_time seconds. Outside PyPy, return 1.0.
+    """
+    if not IS_PYPY:
+        return 1.0
+    import __pypy__
+    if __pypy__.debug_get_timestamp_unit() == 'ns':
+        return 1e-9
+    t0 = clock()
+    ts0 = __pypy__.debug_read_timestamp()
+    time.sleep(calibration_time)
+    t1 = clock()
+    ts1 = __pypy__.debug_read_timestamp()
+    return (t1 - t0) / (ts1 - ts0)
+
+
+class Histogram(object):
+    """
+    Histogram with fixed buckets: counts[i] is the number of values which
+    are <= bounds[i] and > bounds[i-1]; the last bucket counts the values
+    which are bigger than all the bounds.
+    """
+
+    def __init__(self, bounds=None):
+        if bounds is None:
+            bounds = make_bounds()
+        self.bounds = bounds
+        self.counts = array('l', [0]) * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, value, n=1):
+        """
+        Record n values, all equal to value
+        """
+        self.counts[bisect_left(self.bounds, value)] += n
+        self.count += n
+        self.sum += value * n
+        if value > self.max:
+            self.max = value
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def percentile(self, p):
+        """
+        Return the upper bound of the bucket which contains the p-th
+        percentile, capped to the maximum recorded value
+        """
+        if self.count == 0:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                break
+        if i == len(self.bounds):
+            return self.max
+        return min(self.bounds[i], self.max)
+
+    def summary(self, percentiles=(50, 90, 99, 99.9)):
+        res = {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'max': self.max,
+        }
+        for p in percentiles:
+            res['p%s' % p] = self.percentile(p)
+        return res
+
+
+class GcTelemetry(GcHooks):
+    """
+    Collect statistics about the GC. Call enable() to start collecting.
+
+    The durations reported by the PyPy hooks are in the unit returned by
+    __pypy__.debug_get_timestamp_unit(): scale is the number of seconds per
+    unit, by default computed by get_timestamp_scale().
+
+    If the hooks report several steps at once (stats.count > 1), the report
+    can span the end of a major collection, and there is no way to know how
+    its duration is split: it is charged to the major collection in
+    progress. Similarly, if several major collections are reported at once,
+    they are recorded with their mean duration. n_inexact_majors counts the
+    major collections whose duration is approximate because of this.
+    """
+
+    def __init__(self, scale=None, bounds=None):
+        if scale is None:
+            scale = get_timestamp_scale()
+        self.scale = scale
+        self.minor = Histogram(bounds)
+        self.step = Histogram(bounds)
+        self.major = Histogram(bounds)
+        self.reset()
+
+    def reset(self):
+        self.minor.reset()
+        self.step.reset()
+        self.major.reset()
+        self.n_minors = 0
+        self.n_steps = 0
+        self.n_majors = 0
+        self.n_inexact_majors = 0
+        # time spent in the steps of the major collection in progress
+        self.cur_major_time = 0.0
+        self.cur_major_inexact = False
+        # memory high-water marks, in bytes
+        self.peak_memory = 0
+        self.peak_arenas_bytes = 0
+        self.peak_rawmalloc_bytes = 0
+        self.last_memory = 0
+
+    def on_gc_minor(self, stats):
+        # if the hooks are deferred, stats can describe more than one
+        # collection: record them all with their mean duration
+        n = stats.count
+        self.n_minors += n
+        self.minor.record(stats.duration * self.scale / n, n)
+        duration_max = stats.duration_max * self.scale
+        if duration_max > self.minor.max:
+            self.minor.max = duration_max
+        mem = stats.total_memory_used
+        self.last_memory = mem
+        if mem > self.peak_memory:
+            self.peak_memory = mem
+
+    def on_gc_collect_step(self, stats):
+        n = stats.count
+        duration = stats.duration * self.scale
+        self.n_steps += n
+        self.step.record(duration / n, n)
+        duration_max = stats.duration_max * self.scale
+        if duration_max > self.step.max:
+            self.step.max = duration_max
+        if n > 1:
+            # oldstate and newstate describe only the last step: the others
+            # might belong to the previous major collection
+            self.cur_major_inexact = True
+        elif stats.oldstate == STATE_SCANNING:
+            # a new major collection begins
+            self.cur_major_time = 0.0
+            self.cur_major_inexact = False
+        self.cur_major_time += duration
+
+    def on_gc_collect(self, stats):
+        n = stats.count
+        self.n_majors += n
+        if n > 1:
+            # the steps of all these majors have been charged to
+            # cur_major_time: record them with their mean duration
+            self.cur_major_inexact = True
+        self.major.record(self.cur_major_time / n, n)
+        if self.cur_major_inexact:
+            self.n_inexact_majors += n
+        self.cur_major_time = 0.0
+        self.cur_major_inexact = False
+        if stats.arenas_bytes > self.peak_arenas_bytes:
+            self.peak_arenas_bytes = stats.arenas_bytes
+        if stats.rawmalloc_bytes_before > self.peak_rawmalloc_bytes:
+            self.peak_rawmalloc_bytes = stats.rawmalloc_bytes_before
+
+    def snapshot(self):
+        """
+        Return a dict containing all the statistics
+        """
+        return {
+            'minor': self.minor.summary(),
+            'step': self.step.summary(),
+            'major': self.major.summary(),
+            'n_minors': self.n_minors,
+            'n_steps': self.n_steps,
+            'n_majors': self.n_majors,
+            'n_inexact_majors': self.n_inexact_majors,
+            'memory': self.last_memory,
+            'peak_memory': self.peak_memory,
+            'peak_arenas_bytes': self.peak_arenas_bytes,
+            'peak_rawmalloc_bytes': self.peak_rawmalloc_bytes,
+        }
+
+    def prometheus(self, prefix='pypy_gc'):
+        """
+        Return the statistics in the Prometheus text exposition format
+        """
+        lines = []
+        def metric(name, kind, help, value):
+            name = '%s_%s' % (prefix, name)
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, kind))
+            lines.append('%s %s' % (name, format_value(value)))
+
+        def histogram(name, help, hist):
+            name = '%s_%s' % (prefix, name)
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s histogram' % name)
+            cumul = 0
+            for bound, n in zip(hist.bounds, hist.counts):
+                cumul += n
+                lines.append('%s_bucket{le="%s"} %d' % (
+                    name, format_value(bound), cumul))
+            lines.append('%s_bucket{le="+Inf"} %d' % (name, hist.count))
+            lines.append('%s_sum %s' % (name, format_value(hist.sum)))
+            lines.append('%s_count %d' % (name, hist.count))
+
+        histogram('minor_duration_seconds',
+                  'Duration of the minor collections.', self.minor)
+        histogram('collect_step_duration_seconds',
+                  'Duration of the incremental steps of the major '
+                  'collections.', self.step)
+        histogram('major_duration_seconds',
+                  'Total time spent in the steps of each major collection.',
+                  self.major)
+        metric('minor_collections_total', 'counter',
+               'Number of minor collections.', self.n_minors)
+        metric('collect_steps_total', 'counter',
+               'Number of incremental steps of the major collections.',
+               self.n_steps)
+        metric('major_collections_total', 'counter',
+               'Number of major collections.', self.n_majors)
+        metric('major_collections_inexact_total', 'counter',
+               'Number of major collections whose duration is approximate '
+               'because of aggregated step reports.', self.n_inexact_majors)
+        metric('memory_bytes', 'gauge',
+               'Memory used, as reported by the last minor collection.',
+               self.last_memory)
+        metric('memory_peak_bytes', 'gauge',
+               'Maximum memory used, as reported by the minor collections.',
+               self.peak_memory)
+        metric('arenas_peak_bytes', 'gauge',
+               'Maximum memory used by the arenas.', self.peak_arenas_bytes)
+        metric('rawmalloc_peak_bytes', 'gauge',
+               'Maximum memory used by the raw-malloced objects.',
+               self.peak_rawmalloc_bytes)
+        return '\n'.join(lines) + '\n'
+
+
+def format_value(x):
+    # repr() gives the shortest representation which round-trips, as
+    # recommended by the Prometheus format
+    if isinstance(x, float):
+        return repr(x)
+    return str(x)
@@ -1,6 +1,6 @@
 import pytest
 from pypytools import IS_PYPY
-from pypytools.gc.custom import CustomGc, DefaultGc
+from pypytools.gc.custom import CustomGc, DefaultGc, BudgetedGc
 from pypytools.gc.testing.test_fakegc import fakegc, FakeMinorStats
 from pypytools.gc.testing.test_multihook import GcStatistics, mh
 
@@ -34,6 +34,25 @@ class TestCustomGc:
         fakegc.fire_minor('CCC')
         assert mygc.minors == ['BBB'] # CCC is not there
 
+    def test_nogc(self, fakegc):
+        class MyGc(CustomGc):
+            def __init__(self):
+                super(MyGc, self).__init__()
+                self.minors = []
+
+            def on_gc_minor(self, stats):
+                if self.nogc_count > 0:
+                    return
+                self.minors.append(stats)
+
+        mygc = MyGc()
+        mygc.enable()
+        fakegc.fire_minor('AAA')
+        with mygc.nogc():
+            fakegc.fire_minor('BBB')
+        fakegc.fire_minor('CCC')
+        assert mygc.minors == ['AAA', 'CCC']
+
 
 class TestDefaultGc:
 
@@ -169,3 +188,105 @@ class TestDefaultGc:
         mygc = DefaultGc()
         mygc.enable()
         assert gc.isenabled()
+
+
+class FakeClock(object):
+
+    def __init__(self, t=0.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+    def tick(self, dt):
+        self.t += dt
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+class TestBudgetedGc:
+
+    @pytest.fixture
+    def steps(self, fakegc, mh, clock, monkeypatch):
+        """
+        Make each fakegc.collect_step take COSTS[phase] seconds on the fake
+        clock, and return the list of the phases of the steps done
+        """
+        phases = []
+        collect_step = fakegc.collect_step
+        def fake_collect_step():
+            phases.append(fakegc._state)
+            clock.tick(self.COSTS.get(fakegc._state, 1))
+            return collect_step()
+        monkeypatch.setattr(fakegc, 'collect_step', fake_collect_step)
+        fakegc._steps_to_major = 6
+        return phases
+
+    COSTS = {0: 4, 1: 4, 2: 4}
+
+    class MyGc(BudgetedGc):
+        MAJOR_COLLECT = 2.0
+        MIN_THRESHOLD = 100
+        MAX_GROWTH = 100
+        PAUSE_BUDGET = 10
+
+    def test_step_cost(self):
+        mygc = self.MyGc()
+        assert mygc.estimate_step_cost(0) == 0
+        mygc.record_step_cost(0, 10)
+        mygc.record_step_cost(1, 2)
+        assert mygc.estimate_step_cost(0) == 10
+        assert mygc.estimate_step_cost(1) == 2
+        assert mygc.estimate_step_cost(2) == 2 # the last step
+        mygc.record_step_cost(0, 20)
+        assert mygc.estimate_step_cost(0) == 0.3*20 + 0.7*10
+
+    def test_budget(self, fakegc, steps, clock):
+        S = FakeMinorStats
+        mygc = self.MyGc(clock)
+        mygc.enable()
+        fakegc.fire_minor(S(total_memory_used=50))
+        assert steps == []
+        #
+        # the second step is estimated to cost as much as the first one,
+        # the third one would exceed the budget
+        fakegc.fire_minor(S(total_memory_used=101))
+        assert steps == [0, 1]
+        assert mygc.major_in_progress
+        assert mygc.last_pause == 8
+        #
+        # phase 3 is estimated to cost 4 (the last step), then we learn that
+        # the steps are cheaper and we finish the major collection
+        del steps[:]
+        fakegc.fire_minor(S(total_memory_used=102))
+        assert steps == [2, 3, 4, 5]
+        assert not mygc.major_in_progress
+        assert mygc.last_pause == 7
+        assert mygc.threshold == 204
+        assert mygc.phase == BudgetedGc.STATE_SCANNING
+
+    def test_at_least_one_step(self, fakegc, steps, clock):
+        class MyGc(self.MyGc):
+            PAUSE_BUDGET = 0
+        mygc = MyGc(clock)
+        mygc.enable()
+        fakegc.fire_minor(FakeMinorStats(total_memory_used=101))
+        assert steps == [0]
+        fakegc.fire_minor(FakeMinorStats(total_memory_used=101))
+        assert steps == [0, 1]
+
+    def test_memory_ceiling(self, fakegc, steps, clock):
+        class MyGc(self.MyGc):
+            PAUSE_BUDGET = 0
+            MEMORY_CEILING = 1000
+        mygc = MyGc(clock)
+        mygc.enable()
+        fakegc.fire_minor(FakeMinorStats(total_memory_used=101))
+        assert steps == [0]
+        # above the ceiling, finish the collection regardless of the budget
+        fakegc.fire_minor(FakeMinorStats(total_memory_used=1001))
+        assert steps == [0, 1, 2, 3, 4, 5]
+        assert not mygc.major_in_progress
+        assert mygc.threshold == 2002
@@ -0,0 +1,134 @@
+import time
+import pytest
+from pypytools.gc.deferred import (RingBuffer, DeferredGcHooks, MinorRecord,
+                                   StepRecord)
+from pypytools.gc.testing.test_fakegc import fakegc, FakeMinorStats
+from pypytools.gc.testing.test_multihook import mh
+
+class Stats(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def minor(count, mem):
+    return Stats(count=count, duration=0.5, duration_min=0.1,
+                 duration_max=0.4, total_memory_used=mem, pinned_objects=0)
+
+
+class TestRingBuffer(object):
+
+    def test_record_drain(self):
+        buf = RingBuffer(MinorRecord, 4)
+        buf.record(minor(1, 100))
+        buf.record(minor(2, 200))
+        assert len(buf) == 2
+        records = buf.drain()
+        assert records == [MinorRecord(1, 0.5, 0.1, 0.4, 100, 0),
+                           MinorRecord(2, 0.5, 0.1, 0.4, 200, 0)]
+        assert len(buf) == 0
+        assert buf.drain() == []
+        assert buf.dropped == 0
+
+    def test_overflow(self):
+        buf = RingBuffer(MinorRecord, 4)
+        for i in range(10):
+            buf.record(minor(i, i))
+        assert len(buf) == 4
+        records = buf.drain()
+        assert [r.count for r in records] == [6, 7, 8, 9]
+        assert buf.dropped == 6
+        buf.record(minor(10, 10))
+        assert [r.count for r in buf.drain()] == [10]
+        assert buf.dropped == 6
+
+    def test_missing_fields(self):
+        buf = RingBuffer(MinorRecord, 4)
+        buf.record(FakeMinorStats(total_memory_used=42))
+        rec, = buf.drain()
+        assert rec.total_memory_used == 42
+        assert rec.count != rec.count # NaN
+
+    def test_record_during_drain(self):
+        # simulate a GC hook which runs while drain() is copying the records
+        class Data(object):
+            def __init__(self, data):
+                self.data = data
+                self.fired = False
+            def __getitem__(self, key):
+                if not self.fired:
+                    self.fired = True
+                    for j in range(3):
+                        buf.record(minor(100 + j, 0))
+                return self.data[key]
+            def __getslice__(self, i, j):
+                return self[slice(i, j)]
+            def __setitem__(self, key, value):
+                self.data[key] = value
+
+        buf = RingBuffer(MinorRecord, 4)
+        for i in range(4):
+            buf.record(minor(i, 0))
+        buf.data = Data(buf.data)
+        records = buf.drain()
+        # 0, 1 and 2 have been overwritten by 100, 101 and 102
+        assert [r.count for r in records] == [3]
+        assert buf.dropped == 3
+        assert [r.count for r in buf.drain()] == [100, 101, 102]
+
+
+class MyHooks(DeferredGcHooks):
+
+    def __init__(self, *args, **kwargs):
+        self.batches = []
+        super(MyHooks, self).__init__(*args, **kwargs)
+
+    def on_gc_minor_batch(self, records):
+        self.batches.append([r.total_memory_used for r in records])
+
+
+class TestDeferredGcHooks(object):
+
+    def test_only_needed_hooks(self, fakegc, mh):
+        hooks = MyHooks()
+        hooks.enable()
+        assert fakegc.hooks.on_gc_minor is not None
+        assert fakegc.hooks.on_gc_collect_step is None
+        assert fakegc.hooks.on_gc_collect is None
+        hooks.disable()
+
+    def test_flush(self, fakegc, mh):
+        hooks = MyHooks()
+        hooks.enable()
+        fakegc.fire_minor(minor(1, 100))
+        fakegc.fire_minor(minor(2, 200))
+        assert hooks.batches == []
+        assert hooks.flush() == 2
+        assert hooks.batches == [[100, 200]]
+        assert hooks.flush() == 0
+        assert hooks.batches == [[100, 200]]
+        hooks.disable()
+
+    def test_dropped(self, fakegc, mh):
+        hooks = MyHooks(capacity=2)
+        hooks.enable()
+        for i in range(5):
+            fakegc.fire_minor(minor(i, i))
+        hooks.flush()
+        assert hooks.batches == [[3, 4]]
+        assert hooks.dropped == 3
+        hooks.disable()
+
+    def test_thread(self, fakegc, mh):
+        hooks = MyHooks()
+        hooks.enable()
+        hooks.start_thread(interval=0.01)
+        fakegc.fire_minor(minor(1, 100))
+        for i in range(500):
+            if hooks.batches:
+                break
+            time.sleep(0.01)
+        assert hooks.batches == [[100]]
+        fakegc.fire_minor(minor(2, 200))
+        hooks.stop_thread()
+        # stop_thread flushes the pending records
+        assert hooks.batches == [[100], [200]]
+        hooks.disable()
@@ -1,8 +1,9 @@
 import pytest
 from pypytools.gc import multihook
 from pypytools.gc import custom
+from pypytools.gc import uniform
 
-MODULES_TO_PATCH = [multihook, custom]
+MODULES_TO_PATCH = [multihook, custom, uniform]
 
 @pytest.fixture
 def fakegc(monkeypatch):
@@ -24,6 +25,7 @@ class FakeGc(object):
         self._enabled = True
         self._steps_to_major = 3 # number of collect_step to call before
                                  # finishing a major collection
+        self._state = 0          # the phase of the next step, 0 is SCANNING
 
     def isenabled(self):
         return self._enabled
@@ -35,14 +37,20 @@ class FakeGc(object):
         self._enabled = False
 
     def collect_step(self):
+        oldstate = self._state
         self._steps_to_major -= 1
         if self._steps_to_major == 0:
             # in PyPy, the last gc.collect_step does not invoke any GC hook,
             # because it runs the app-level finalizers
             self._steps_to_major = 3
-            return FakeCollectStepStats(major_is_done=True)
+            self._state = 0
+            return FakeCollectStepStats(major_is_done=True,
+                                        oldstate=oldstate, newstate=0)
         else:
-            stats = FakeCollectStepStats(major_is_done=False)
+            self._state += 1
+            stats = FakeCollectStepStats(major_is_done=False,
+                                         oldstate=oldstate,
+                                         newstate=self._state)
             # in PyPy, gc.collect_step also does a minor collection, so the effect
             self.fire_minor(FakeMinorStats(total_memory_used=42))
             self.fire_step(stats)
@@ -70,8 +78,10 @@ class FakeMinorStats(object):
 
 class FakeCollectStepStats(object):
 
-    def __init__(self, major_is_done):
+    def __init__(self, major_is_done, oldstate=None, newstate=None):
         self.major_is_done = major_is_done
+        self.oldstate = oldstate
+        self.newstate = newstate
 
 
 class TestFakeGc:
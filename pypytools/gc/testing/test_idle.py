@@ -0,0 +1,170 @@
+import pytest
+from collections import deque
+from pypytools.gc.idle import IdleGc
+from pypytools.gc.uniform import UniformGcStrategy
+from pypytools.gc.testing.test_fakegc import fakegc, FakeMinorStats
+from pypytools.gc.testing.test_multihook import mh
+from pypytools.gc.testing.test_custom import clock
+
+
+class FakeHandle(object):
+
+    def __init__(self, when, callback):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop(object):
+    """
+    The minimal subset of the asyncio loop API used by IdleGc
+    """
+
+    def __init__(self):
+        self.t = 0.0
+        self._ready = deque()
+        self.timers = []
+
+    def call_later(self, delay, callback):
+        h = FakeHandle(self.t + delay, callback)
+        self.timers.append(h)
+        return h
+
+    def pending(self):
+        return [h for h in self.timers if not h.cancelled]
+
+    def run_once(self):
+        """
+        Run the first timer
+        """
+        h = min(self.pending(), key=lambda h: h.when)
+        self.timers.remove(h)
+        self.t = h.when
+        h.callback()
+        return h
+
+
+class MyStrategy(UniformGcStrategy):
+    MIN_TARGET = 1000
+    EMERGENCY_DELAY = 0.01
+
+
+class MyIdleGc(IdleGc):
+    IDLE_BUDGET = 100
+
+    def make_strategy(self, mem):
+        return MyStrategy(mem, self.clock)
+
+
+class TestIdleGc(object):
+
+    def minor(self, fakegc, clock, mem, dt=0.001):
+        clock.tick(dt)
+        fakegc.fire_minor(FakeMinorStats(total_memory_used=mem))
+
+    def test_enable_disable(self, fakegc, mh):
+        loop = FakeLoop()
+        mygc = MyIdleGc(loop)
+        mygc.enable()
+        h, = loop.pending()
+        assert h.when == IdleGc.POLL_INTERVAL
+        loop.run_once()
+        h, = loop.pending()
+        assert h.when == 2 * IdleGc.POLL_INTERVAL
+        mygc.disable()
+        assert loop.pending() == []
+
+    def test_enable_twice(self, fakegc, mh):
+        loop = FakeLoop()
+        mygc = MyIdleGc(loop)
+        mygc.enable()
+        mygc.enable()
+        assert len(loop.pending()) == 1
+        mygc.disable()
+        assert loop.pending() == []
+
+    def test_poll_after_disable(self, fakegc, mh):
+        # if a poll runs after disable() (e.g. because the loop already
+        # popped its timer), it does not reschedule itself
+        loop = FakeLoop()
+        mygc = MyIdleGc(loop)
+        mygc.enable()
+        h, = loop.pending()
+        mygc.disable()
+        h.callback()
+        assert loop.pending() == []
+
+    def test_idle_steps(self, fakegc, mh, clock):
+        loop = FakeLoop()
+        mygc = MyIdleGc(loop, clock)
+        mygc.enable()
+        self.minor(fakegc, clock, 0) # create the strategy
+        self.minor(fakegc, clock, 100)
+        loop.run_once()
+        assert not mygc.has_work()
+        assert mygc.idle_steps == 0
+        #
+        self.minor(fakegc, clock, 300)
+        assert mygc.has_work()
+        # the loop has callbacks ready to run
+        loop._ready.append('callback')
+        loop.run_once()
+        assert mygc.idle_steps == 0
+        loop._ready.clear()
+        # there is a request in flight
+        with mygc.busy():
+            loop.run_once()
+        assert mygc.idle_steps == 0
+        #
+        # finally, we are idle
+        fakegc._steps_to_major = 3
+        loop.run_once()
+        assert mygc.idle_steps == 3
+        assert not mygc.major_in_progress
+        assert mygc.strategy.n_majors == 1
+        assert mygc.emergency_steps == 0
+        mygc.disable()
+
+    def test_idle_budget(self, fakegc, mh, clock, monkeypatch):
+        collect_step = fakegc.collect_step
+        def slow_collect_step():
+            clock.tick(0.003)
+            return collect_step()
+        monkeypatch.setattr(fakegc, 'collect_step', slow_collect_step)
+        loop = FakeLoop()
+        mygc = MyIdleGc(loop, clock)
+        mygc.IDLE_BUDGET = 0.005
+        mygc.enable()
+        self.minor(fakegc, clock, 0)
+        self.minor(fakegc, clock, 300)
+        fakegc._steps_to_major = 3
+        h = loop.run_once()
+        assert mygc.idle_steps == 2
+        assert mygc.major_in_progress
+        # the next poll is scheduled immediately, to finish the major
+        h2, = loop.pending()
+        assert h2.when == h.when
+        mygc.disable()
+
+    def test_emergency(self, fakegc, mh, clock):
+        loop = FakeLoop()
+        mygc = MyIdleGc(loop, clock)
+        mygc.enable()
+        self.minor(fakegc, clock, 0)
+        with mygc.busy():
+            self.minor(fakegc, clock, 800, dt=0.1)
+            assert mygc.emergency_steps == 0
+            # we are close to the target: run a step in the hook
+            self.minor(fakegc, clock, 950, dt=0.1)
+            assert mygc.emergency_steps == 1
+            assert mygc.major_in_progress
+            # but not more often than EMERGENCY_DELAY
+            self.minor(fakegc, clock, 960, dt=0.001)
+            assert mygc.emergency_steps == 1
+            self.minor(fakegc, clock, 970, dt=0.01)
+            assert mygc.emergency_steps == 2
+        assert mygc.idle_steps == 0
+        mygc.disable()
@@ -89,6 +89,58 @@ class TestMultiHook:
         fakegc.fire_minor('minor')
         assert a.minors == ['minor']
 
+    def test_dispatcher(self, fakegc):
+        import types
+        log = []
+        class A(object):
+            def __init__(self, name):
+                self.name = name
+            def on_gc_minor(self, stats):
+                log.append((self.name, stats))
+
+        mh = MultiHook()
+        mh.add(A('a'))
+        mh.add(A('b'))
+        mh.add(A('c'))
+        assert isinstance(mh.on_gc_minor, types.MethodType)
+        assert mh.on_gc_minor.__self__ is mh
+        assert fakegc.hooks.on_gc_minor == mh.on_gc_minor
+        fakegc.fire_minor('minor')
+        assert log == [('a', 'minor'), ('b', 'minor'), ('c', 'minor')]
+        # the dispatcher does not loop over the callbacks
+        co = mh.on_gc_minor.__func__.__code__
+        assert 'minor_callbacks' not in co.co_names
+        assert co.co_names == ('cb0', 'cb1', 'cb2')
+
+    def test_uninstall_unused_hooks(self, fakegc):
+        class A(object):
+            def on_gc_minor(self, stats):
+                pass
+            def on_gc_collect(self, stats):
+                pass
+
+        class B(object):
+            def on_gc_minor(self, stats):
+                pass
+
+        a = A()
+        b = B()
+        mh = MultiHook()
+        mh.add(a)
+        mh.add(b)
+        assert fakegc.hooks.on_gc_minor is not None
+        assert fakegc.hooks.on_gc_collect is not None
+        mh.remove(a)
+        assert fakegc.hooks.on_gc_minor is not None
+        assert fakegc.hooks.on_gc_collect is None
+        mh.remove(b)
+        assert fakegc.hooks.on_gc_minor is None
+        assert fakegc.hooks.on_gc_collect_step is None
+        assert fakegc.hooks.on_gc_collect is None
+        # and we can install them again
+        mh.add(b)
+        assert fakegc.hooks.on_gc_minor == mh.on_gc_minor
+
     def test_check_no_other_hooks(self, fakegc):
         # check that nobody else is messing with gc.hooks directly
         fakegc.hooks.on_gc_minor = lambda stats: None
@@ -128,6 +180,15 @@ class TestGcHooks(object):
         assert a1.minors == [1, 2]
         assert a2.minors == [2, 3]
 
+    def test_disable_uninstalls_hooks(self, fakegc, mh):
+        a = GcStatistics()
+        a.enable()
+        assert fakegc.hooks.on_gc_minor is not None
+        a.disable()
+        assert fakegc.hooks.on_gc_minor is None
+        assert fakegc.hooks.on_gc_collect_step is None
+        assert fakegc.hooks.on_gc_collect is None
+
     def test_real_hooks(self, mh):
         # note that:
         #   1. we are NOT using fakegc, so MultiHook uses the builtin real gc mod
@@ -0,0 +1,240 @@
+import gc
+import textwrap
+import pytest
+from pypytools.util import PY3
+from pypytools.gc import custom
+from pypytools.gc.custom import DefaultGc
+from pypytools.gc.uniform import UniformGc, UniformGcStrategy
+from pypytools.gc.idle import IdleGc
+from pypytools.gc.multihook import MultiHook
+from pypytools.gc.simulator import (Trace, MinorSample, StepSample,
+                                    Simulator, VirtualClock, SimLoop,
+                                    simulate)
+
+class Event(object):
+    # the simulator needs only these attributes of the pypylog events, and
+    # pypylog is Python 2 only
+    def __init__(self, section, start, end, **kwargs):
+        self.section = section
+        self.start = start
+        self.end = end
+        self.__dict__.update(kwargs)
+
+def minor(start, memory, duration=1):
+    return Event('gc-minor', start, start + duration, memory=memory)
+
+def step(start, end, phase, end_phase):
+    return Event('gc-collect-step', start, end, phase=phase,
+                 end_phase=end_phase)
+
+def make_events():
+    # a minor collection every 10 time units, and a major collection of 3
+    # steps after the minors at 30, 40 and 50
+    return [
+        minor(0, 100),
+        minor(10, 200),
+        minor(20, 300),
+        minor(30, 400),
+        step(31, 33, 'SCANNING', 'MARKING'),
+        minor(31.5, 400, duration=0.5), # done by the step
+        minor(40, 500),
+        step(41, 44, 'MARKING', 'SWEEPING'),
+        minor(50, 600),
+        step(51, 52, 'SWEEPING', 'SCANNING'),
+        minor(60, 300),
+        minor(70, 400),
+        minor(80, 500),
+        minor(90, 600),
+    ]
+
+
+class MyGc(DefaultGc):
+    MAJOR_COLLECT = 2.0
+    MIN_THRESHOLD = 350
+    MAX_GROWTH = 100
+
+
+class TestTrace(object):
+
+    def test_from_events(self):
+        trace = Trace.from_events(make_events())
+        assert trace.initial_mem == 100
+        assert trace.cycles == [[StepSample(0, 2), StepSample(1, 3),
+                                 StepSample(2, 1)]]
+        # before the cycle is complete we don't know the live memory, so
+        # it is the memory used
+        assert trace.minors == [
+            MinorSample(0, 0, 1, 100),
+            MinorSample(9, 100, 1, 200),
+            MinorSample(9, 100, 1, 300),
+            MinorSample(9, 100, 1, 400),
+            MinorSample(7, 100, 1, 500), # the step took 2
+            # the cycle ends before the next minor
+            MinorSample(6, 100, 1, 300), # the step took 3
+            MinorSample(8, 0, 1, 300),
+            MinorSample(9, 100, 1, 300),
+            MinorSample(9, 100, 1, 300),
+            MinorSample(9, 100, 1, 300),
+        ]
+
+    def test_no_major(self):
+        with pytest.raises(ValueError):
+            Trace.from_events([minor(0, 100), minor(10, 200)])
+
+    @pytest.mark.skipif(PY3, reason='pypylog is Python 2 only')
+    def test_from_log(self, tmpdir):
+        log = tmpdir.join('log')
+        log.write(textwrap.dedent("""
+        [0] {gc-minor
+        minor collect, total memory used: 100
+        [1] gc-minor}
+        [a] {gc-minor
+        minor collect, total memory used: 200
+        [b] gc-minor}
+        [c] {gc-collect-step
+        starting gc state:  SCANNING
+        stopping, now in gc state:  SCANNING
+        [e] gc-collect-step}
+        [14] {gc-minor
+        minor collect, total memory used: 150
+        [15] gc-minor}
+        """))
+        trace = Trace.from_log(str(log))
+        assert trace.cycles == [[StepSample(0, 2)]]
+        assert trace.minors == [
+            MinorSample(0, 0, 1, 100),
+            MinorSample(9, 100, 1, 150),
+            MinorSample(7, 0, 1, 150),
+        ]
+
+
+class TestSimulator(object):
+
+    def test_simulate(self):
+        trace = Trace.from_events(make_events())
+        res = simulate(trace, MyGc)
+        # the major starts at the minor at 30, when we reach 400 bytes, and
+        # it ends with 300 (the live memory) + 200 allocated in the
+        # meantime. Then we allocate 300 more
+        assert res.n_majors == 1
+        assert res.n_steps == 3
+        assert res.n_minors == 10
+        assert res.peak_mem == 800
+        assert res.pauses == [1, 1, 1, 3, 4, 2, 1, 1, 1, 1]
+        assert res.gc_time == 16
+        assert res.duration == 91
+        assert res.gc_share == 16 / 91.0
+        assert res.percentile(50) == 1
+        assert res.percentile(90) == 3
+        assert res.percentile(99) == 4
+        summary = res.summary()
+        assert summary['max_pause'] == 4
+        assert summary['p99.9'] == 4
+
+    def test_no_live_memory_from_the_future(self):
+        # a GC which does a whole major collection at the second minor,
+        # long before the recorded one ends: the live memory after the
+        # recorded collection (50) must not be used
+        class EagerGc(custom.CustomGc):
+            def on_gc_minor(self, stats):
+                if self.nogc_count or stats.total_memory_used != 200:
+                    return
+                with self.nogc():
+                    while not custom.gc.collect_step().major_is_done:
+                        pass
+        events = [
+            minor(0, 100),
+            minor(10, 200),
+            minor(20, 300),
+            minor(30, 400),
+            step(31, 33, 'SCANNING', 'SCANNING'),
+            minor(40, 50),
+        ]
+        trace = Trace.from_events(events)
+        assert [m.live for m in trace.minors] == [100, 200, 300, 50, 50]
+        res = simulate(trace, EagerGc)
+        assert res.n_majors == 1
+        # the memory does not drop, so it reaches 400 as in the trace
+        assert res.peak_mem == 400
+
+    def test_repeat_cycles(self):
+        # with a low threshold we do a step at every minor and more majors
+        # than in the trace: the recorded cycles are reused
+        class MyGc2(MyGc):
+            MIN_THRESHOLD = 0
+            MAJOR_COLLECT = 0
+        trace = Trace.from_events(make_events())
+        res = simulate(trace, MyGc2)
+        assert res.n_majors == 3
+        assert res.n_steps == 10
+
+    def test_restore_patches(self):
+        instance = MultiHook._instance
+        sim = Simulator(Trace.from_events(make_events()), MyGc)
+        with sim.patched():
+            assert custom.gc is sim.gc
+            assert MultiHook._instance is None
+        assert custom.gc is gc
+        assert MultiHook._instance is instance
+
+    def test_clock(self):
+        # the virtual clock is passed to the GC
+        clocks = []
+        class MyGc2(MyGc):
+            def __init__(self, clock=None):
+                super(MyGc2, self).__init__(clock)
+                clocks.append(clock)
+        clock = VirtualClock(100)
+        res = simulate(Trace.from_events(make_events()), MyGc2, clock)
+        assert clocks == [clock]
+        assert clock() == 191
+        assert res.duration == 91
+
+    def test_uniform_gc(self):
+        # UniformGcStrategy uses the virtual clock, so the simulation is
+        # deterministic
+        trace = Trace.from_events(make_events())
+        res1 = simulate(trace, UniformGc).summary()
+        res2 = simulate(trace, UniformGc).summary()
+        assert res1 == res2
+
+    def test_loop(self):
+        clock = VirtualClock()
+        loop = SimLoop(clock)
+        calls = []
+        loop.call_later(5, calls.append, 'a')
+        loop.call_later(15, calls.append, 'b').cancel()
+        loop.call_later(25, calls.append, 'c')
+        sim = Simulator(Trace.from_events(make_events()), MyGc, clock, loop)
+        sim.loop_gc_time = 0.0
+        sim.run_program(20)
+        assert calls == ['a']
+        assert clock() == 20
+        sim.run_program(10)
+        assert calls == ['a', 'c']
+        assert clock() == 30
+        with pytest.raises(ValueError):
+            Simulator(sim.trace, MyGc, VirtualClock(), loop)
+
+    def test_idle_gc(self):
+        # IdleGc runs the steps from the timers of the loop, so they are not
+        # pauses: they delay the program instead
+        class MyStrategy(UniformGcStrategy):
+            MIN_TARGET = 1000
+        class MyIdleGc(IdleGc):
+            POLL_INTERVAL = 5
+            IDLE_START_RATIO = 0.1
+            IDLE_BUDGET = 100
+            def make_strategy(self, mem):
+                return MyStrategy(mem, self.clock)
+        clock = VirtualClock()
+        loop = SimLoop(clock)
+        trace = Trace.from_events(make_events())
+        res = simulate(trace, lambda clock: MyIdleGc(loop, clock), clock,
+                       loop)
+        assert res.n_majors >= 1
+        assert res.pauses == [1] * 10
+        assert res.loop_gc_time == res.n_majors * 6
+        assert res.gc_time == 10 + res.loop_gc_time
+        # the program runs for 75 and the minors take 10
+        assert res.duration == 85 + res.loop_gc_time
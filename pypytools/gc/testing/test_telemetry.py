@@ -0,0 +1,187 @@
+import pytest
+from pypytools import IS_PYPY
+from pypytools.gc.telemetry import (make_bounds, Histogram, GcTelemetry,
+                                    STATE_SCANNING, get_timestamp_scale)
+from pypytools.gc.testing.test_fakegc import fakegc
+from pypytools.gc.testing.test_multihook import mh
+
+class Stats(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def minor(duration, mem, count=1, duration_max=None):
+    if duration_max is None:
+        duration_max = duration
+    return Stats(count=count, duration=duration, duration_min=0,
+                 duration_max=duration_max, total_memory_used=mem,
+                 pinned_objects=0)
+
+def step(duration, oldstate, newstate, count=1):
+    return Stats(count=count, duration=duration, duration_min=duration,
+                 duration_max=duration, oldstate=oldstate, newstate=newstate,
+                 major_is_done=False)
+
+def collect(arenas_bytes, rawmalloc_bytes, count=1):
+    return Stats(count=count, num_major_collects=1, arenas_count_before=0,
+                 arenas_count_after=0, arenas_bytes=arenas_bytes,
+                 rawmalloc_bytes_before=rawmalloc_bytes,
+                 rawmalloc_bytes_after=0)
+
+
+class TestHistogram(object):
+
+    def test_make_bounds(self):
+        bounds = make_bounds(1, 4, sub_buckets=2)
+        assert list(bounds) == [1, 1.5, 2, 3, 4]
+        bounds = make_bounds()
+        assert bounds[0] == 1e-6
+        assert bounds[-1] >= 10.0
+        assert list(bounds) == sorted(bounds)
+        # the relative width of the buckets is at most 1/sub_buckets
+        for a, b in zip(bounds, bounds[1:]):
+            assert (b - a) / a <= 1/8.0 + 1e-9
+
+    def test_record(self):
+        h = Histogram(make_bounds(1, 4, sub_buckets=2))
+        h.record(0.5)
+        h.record(1.0)
+        h.record(1.2)
+        h.record(3.0, n=2)
+        h.record(100)
+        assert list(h.counts) == [2, 1, 0, 2, 0, 1]
+        assert h.count == 6
+        assert h.sum == 0.5 + 1 + 1.2 + 6 + 100
+        assert h.max == 100
+        h.reset()
+        assert list(h.counts) == [0] * 6
+        assert h.count == h.sum == h.max == 0
+
+    def test_percentile(self):
+        h = Histogram(make_bounds(1, 4, sub_buckets=2))
+        assert h.percentile(50) == 0
+        for x in (1.2, 1.4, 2.5, 3.5):
+            h.record(x)
+        assert h.percentile(25) == 1.5
+        assert h.percentile(50) == 1.5
+        assert h.percentile(75) == 3
+        assert h.percentile(100) == 3.5 # capped to max
+        h.record(10)
+        assert h.percentile(100) == 10
+
+
+class TestGcTelemetry(object):
+
+    def test_minor(self):
+        t = GcTelemetry(scale=0.5)
+        t.on_gc_minor(minor(duration=4, mem=100))
+        t.on_gc_minor(minor(duration=6, mem=300, count=3, duration_max=3))
+        t.on_gc_minor(minor(duration=2, mem=200))
+        assert t.n_minors == 5
+        assert t.minor.count == 5
+        assert t.minor.sum == 2 + 3 + 1
+        assert t.minor.max == 2
+        assert t.peak_memory == 300
+        assert t.last_memory == 200
+
+    def test_major(self):
+        t = GcTelemetry(scale=1.0)
+        t.on_gc_collect_step(step(1, STATE_SCANNING, 1))
+        t.on_gc_collect_step(step(2, 1, 2))
+        t.on_gc_collect(collect(arenas_bytes=1000, rawmalloc_bytes=50))
+        t.on_gc_collect_step(step(4, STATE_SCANNING, 1))
+        t.on_gc_collect(collect(arenas_bytes=500, rawmalloc_bytes=70))
+        assert t.n_steps == 3
+        assert t.n_majors == 2
+        assert t.step.sum == 7
+        assert t.major.count == 2
+        assert t.major.sum == 7
+        assert t.major.max == 4
+        assert t.peak_arenas_bytes == 1000
+        assert t.peak_rawmalloc_bytes == 70
+
+    def test_major_aggregated_steps(self):
+        # a report of 3 steps whose last one starts a new major: we don't
+        # know which steps belonged to the previous major, so we charge all
+        # of them to the current one, and mark its duration as inexact
+        t = GcTelemetry(scale=1.0)
+        t.on_gc_collect_step(step(1, STATE_SCANNING, 1))
+        t.on_gc_collect_step(step(2, 1, 2))
+        t.on_gc_collect(collect(arenas_bytes=0, rawmalloc_bytes=0))
+        t.on_gc_collect_step(step(3, STATE_SCANNING, 1, count=3))
+        t.on_gc_collect_step(step(4, 1, 2))
+        t.on_gc_collect(collect(arenas_bytes=0, rawmalloc_bytes=0))
+        assert t.n_steps == 6
+        assert t.major.sum == 3 + 7
+        assert t.n_majors == 2
+        assert t.n_inexact_majors == 1
+        t.on_gc_collect_step(step(5, STATE_SCANNING, 1))
+        t.on_gc_collect(collect(arenas_bytes=0, rawmalloc_bytes=0))
+        assert t.n_inexact_majors == 1
+        assert t.snapshot()['n_inexact_majors'] == 1
+
+    def test_aggregated_majors(self):
+        t = GcTelemetry(scale=1.0)
+        # two majors reported at once: the histogram counts both of them,
+        # with the mean of the time charged to the current major
+        t.on_gc_collect_step(step(1, STATE_SCANNING, 1))
+        t.on_gc_collect_step(step(3, 1, 2, count=2))
+        t.on_gc_collect(collect(arenas_bytes=0, rawmalloc_bytes=0, count=2))
+        assert t.n_majors == 2
+        assert t.major.count == 2
+        assert t.major.sum == 4
+        assert t.major.max == 2
+        assert t.n_inexact_majors == 2
+        assert 'pypy_gc_major_duration_seconds_count 2' in t.prometheus()
+
+    def test_default_scale(self):
+        scale = get_timestamp_scale()
+        assert GcTelemetry().scale > 0
+        if IS_PYPY:
+            # whatever the unit, it is much less than a millisecond
+            assert 0 < scale < 1e-3
+        else:
+            assert scale == 1.0
+
+    def test_snapshot(self):
+        t = GcTelemetry(scale=1.0)
+        t.on_gc_minor(minor(duration=0.001, mem=100))
+        snap = t.snapshot()
+        assert snap['n_minors'] == 1
+        assert snap['minor']['count'] == 1
+        assert snap['minor']['max'] == 0.001
+        assert snap['major']['count'] == 0
+        assert snap['peak_memory'] == 100
+
+    def test_prometheus(self):
+        t = GcTelemetry(scale=1.0, bounds=make_bounds(1, 4, sub_buckets=2))
+        t.on_gc_minor(minor(duration=1.2, mem=100))
+        t.on_gc_minor(minor(duration=3.0, mem=200))
+        text = t.prometheus()
+        lines = text.splitlines()
+        i = lines.index('# TYPE pypy_gc_minor_duration_seconds histogram')
+        assert lines[i+1:i+9] == [
+            'pypy_gc_minor_duration_seconds_bucket{le="1.0"} 0',
+            'pypy_gc_minor_duration_seconds_bucket{le="1.5"} 1',
+            'pypy_gc_minor_duration_seconds_bucket{le="2.0"} 1',
+            'pypy_gc_minor_duration_seconds_bucket{le="3.0"} 2',
+            'pypy_gc_minor_duration_seconds_bucket{le="4.0"} 2',
+            'pypy_gc_minor_duration_seconds_bucket{le="+Inf"} 2',
+            'pypy_gc_minor_duration_seconds_sum 4.2',
+            'pypy_gc_minor_duration_seconds_count 2',
+        ]
+        assert '# TYPE pypy_gc_minor_collections_total counter' in lines
+        assert 'pypy_gc_minor_collections_total 2' in lines
+        assert 'pypy_gc_memory_peak_bytes 200' in lines
+        assert text.endswith('\n')
+
+    def test_hooks(self, fakegc, mh):
+        t = GcTelemetry(scale=1.0)
+        t.enable()
+        fakegc.fire_minor(minor(duration=0.001, mem=100))
+        fakegc.fire_step(step(0.002, STATE_SCANNING, 1))
+        fakegc.fire_collect(collect(arenas_bytes=10, rawmalloc_bytes=20))
+        t.disable()
+        fakegc.fire_minor(minor(duration=0.001, mem=100))
+        assert t.n_minors == 1
+        assert t.n_steps == 1
+        assert t.n_majors == 1
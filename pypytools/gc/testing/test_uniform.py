@@ -1,7 +1,8 @@
-import time
 from pytest import approx
-from freezegun import freeze_time
-from pypytools.gc.uniform import UniformGcStrategy
+from pypytools.gc.uniform import UniformGcStrategy, UniformGc
+from pypytools.gc.testing.test_fakegc import fakegc, FakeMinorStats
+from pypytools.gc.testing.test_multihook import mh
+from pypytools.gc.testing.test_custom import FakeClock, clock
 
 class FakeGcCollectStats(object):
 
@@ -10,12 +11,14 @@ class FakeGcCollectStats(object):
 
 class TestUniformGcStrategy(object):
 
-    def new(self, initial_mem=0, **kwds):
+    def new(self, initial_mem=0, clock=None, **kwds):
         # we call __new__ and __init__ separately so that we can patch **kwds
         # before they are used in the __init__ (e.g., MIN_TARGET)
+        if clock is None:
+            clock = FakeClock()
         s = UniformGcStrategy.__new__(UniformGcStrategy)
         s.__dict__.update(**kwds)
-        s.__init__(initial_mem)
+        s.__init__(initial_mem, clock)
         return s
 
     def fakestats(self, is_done=False):
@@ -44,26 +47,62 @@ class TestUniformGcStrategy(object):
         assert s.target_mem == 180
         assert s.gc_estimated_t == 1.8
 
-    def test_alloc_rate(self):
-        with freeze_time('2018-01-01') as freezer:
-            s = self.new(initial_mem=100)
-            freezer.tick(0.5)           # 0.5 second
-            s.tick(mem=150)             # delta_mem == 50
-            assert s.alloc_rate == 100  # 50/0.5 bytes/s
+    def test_alloc_rate(self, clock):
+        s = self.new(initial_mem=100, clock=clock)
+        clock.tick(0.5)             # 0.5 second
+        s.tick(mem=150)             # delta_mem == 50
+        assert s.alloc_rate == 100  # 50/0.5 bytes/s
 
-            freezer.tick(2)             # 2 seconds
-            s.tick(mem=250)             # delta_mem == 100
-            assert s.alloc_rate == 75   # because of the average
+        clock.tick(2)               # 2 seconds
+        s.tick(mem=250)             # delta_mem == 100
+        assert s.alloc_rate == 75   # because of the average
 
-            freezer.tick(1)
-            s.tick(mem=100)             # negative delta_mem
-            assert s.alloc_rate == 38   # capped at 1
+        clock.tick(1)
+        s.tick(mem=100)             # negative delta_mem
+        assert s.alloc_rate == 38   # capped at 1
 
-    def test_alloc_rate_nonzero(self):
-        s = self.new(initial_mem=100)
+    def test_alloc_rate_nonzero(self, clock):
+        s = self.new(initial_mem=100, clock=clock)
+        clock.tick(1)
         s.tick(mem=90)
         assert s.alloc_rate == 1
 
+    def test_zero_interval(self, clock):
+        # if the clock does not advance, we cannot compute the alloc_rate, but
+        # we still keep track of the allocated memory, and the next sample
+        # covers also what was allocated in the meantime
+        s = self.new(initial_mem=100, clock=clock)
+        assert not s.tick(mem=150)
+        assert s.alloc_rate is None
+        assert s.allocated_mem == 50
+        clock.tick(1)
+        s.tick(mem=250)
+        assert s.alloc_rate == 150
+        # if the clock goes back, we restart measuring from there
+        clock.tick(-0.5)
+        s.tick(mem=300)
+        assert s.alloc_rate == 150
+        assert s.allocated_mem == 200
+        clock.tick(1)
+        s.tick(mem=400)
+        assert s.alloc_rate == 125 # (150 + 100) / 2
+
+    def test_alloc_rate_coarse_clock(self):
+        # a clock with a granularity of 15ms, and a minor collection every ms
+        # which allocates 1MB: the alloc_rate must be 1000 MB/s
+        class QuantizedClock(FakeClock):
+            def __call__(self):
+                return (self.t // 0.015) * 0.015
+        MB = 1024.0 * 1024.0
+        clock = QuantizedClock(t=0.0005)
+        s = self.new(initial_mem=0, clock=clock)
+        mem = 0
+        for i in range(300):
+            clock.tick(0.001)
+            mem += MB
+            s.tick(mem=mem)
+        assert s.alloc_rate == approx(1000 * MB, rel=0.1)
+
     def test_get_time_for_next_step(self):
         s = self.new(initial_mem=0)
         # time to allocate 900 bytes:  9 s
@@ -122,56 +161,56 @@ class TestUniformGcStrategy(object):
         s.tick(mem=690) # mem is back at 690, +40 bytes
         assert s.allocated_mem == 240
 
-    def test_should_collect(self):
-        with freeze_time('2018-01-01') as freezer:
-            s = self.new(initial_mem=0)
-            # with the following params and an alloc_rate of 100 bytes/s, the
-            # GC takes an estimated 10% of the time
-            s.target_allocated_mem = 900.0
-            s.gc_estimated_t = 1
-            s.gc_last_step_duration = 0.01
-
-            # so, we expect to run 9 iterations before doing one step
-            mem = 0
-            i = 0
-            while True:
-                freezer.tick(0.01)
-                i += 1
-                mem += 1
-                should_collect = s.tick(mem=mem)
-                assert s.alloc_rate == approx(100) # floating point rounding :(
-                assert s.last_t == time.time()
-                assert s.last_mem == mem
-                if should_collect:
-                    break
-            assert i == 9
-
-    def test_record_gc_step(self):
-        with freeze_time('2018-01-01') as freezer:
-            s = self.new(initial_mem=0,
-                         MAJOR_COLLECT=1.8,
-                         MIN_TARGET=50)
-            assert s.n_majors == 0
-
-            t = time.time()
-            s.record_gc_step(100, 2, self.fakestats(is_done=False))
-            s.record_gc_step(110, 3, self.fakestats(is_done=False))
-            s.record_gc_step(120, 1, self.fakestats(is_done=False))
-            assert s.gc_cumul_t == 2+3+1
-            assert s.gc_steps == 3
-            assert s.last_mem == 120
-            assert s.last_t == t
-            assert s.gc_last_step_t == t
-
-            freezer.tick(1)
-            s.record_gc_step(80, 1, self.fakestats(is_done=True))
-            assert s.n_majors == 1
-            assert s.gc_cumul_t == 0
-            assert s.gc_steps == 0
-            assert s.last_mem == 80
-            assert s.last_t == t+1
-            assert s.gc_last_step_t == t+1
-            assert s.target_allocated_mem == 80*0.8
+    def test_should_collect(self, clock):
+        s = self.new(initial_mem=0, clock=clock)
+        # with the following params and an alloc_rate of 100 bytes/s, the
+        # GC takes an estimated 10% of the time
+        s.target_allocated_mem = 900.0
+        s.gc_estimated_t = 1
+        s.gc_last_step_duration = 0.01
+
+        # so, we expect to run 9 iterations before doing one step
+        mem = 0
+        i = 0
+        while True:
+            clock.tick(0.01)
+            i += 1
+            mem += 1
+            should_collect = s.tick(mem=mem)
+            assert s.alloc_rate == approx(100) # floating point rounding :(
+            assert s.last_t == clock()
+            assert s.last_mem == mem
+            if should_collect:
+                break
+        assert i == 9
+
+    def test_record_gc_step(self, clock):
+        s = self.new(initial_mem=0,
+                     clock=clock,
+                     MAJOR_COLLECT=1.8,
+                     MIN_TARGET=50)
+        assert s.n_majors == 0
+
+        t = clock()
+        s.record_gc_step(100, 2, self.fakestats(is_done=False))
+        s.record_gc_step(110, 3, self.fakestats(is_done=False))
+        s.record_gc_step(120, 1, self.fakestats(is_done=False))
+        assert s.gc_cumul_t == 2+3+1
+        assert s.gc_steps == 3
+        assert s.gc_last_step_duration == 1
+        assert s.last_mem == 120
+        assert s.last_t == t
+        assert s.gc_last_step_t == t
+
+        clock.tick(1)
+        s.record_gc_step(80, 1, self.fakestats(is_done=True))
+        assert s.n_majors == 1
+        assert s.gc_cumul_t == 0
+        assert s.gc_steps == 0
+        assert s.last_mem == 80
+        assert s.last_t == t+1
+        assert s.gc_last_step_t == t+1
+        assert s.target_allocated_mem == 80*0.8
 
     def test_adjust_gc_estimated_t(self):
         s = self.new(initial_mem=0, ESTIMATED_OVERFLOW_FACTOR=1.2)
@@ -190,3 +229,76 @@ class TestUniformGcStrategy(object):
         # gc_cumul_t ==> 14.5
         s.record_gc_step(mem=100, duration=4.5, stats=stats)
         assert s.gc_estimated_t == 12.0 * 1.2 * 1.2
+
+
+class FakeStrategy(object):
+
+    def __init__(self):
+        self.should_collect = False
+        self.ticks = []
+        self.steps = []
+
+    def tick(self, mem):
+        self.ticks.append(mem)
+        return self.should_collect
+
+    def record_gc_step(self, mem, duration, stats):
+        self.steps.append((mem, duration, stats.major_is_done))
+
+
+class TestUniformGc(object):
+
+    def test_create_strategy(self, fakegc, mh):
+        mygc = UniformGc()
+        mygc.enable()
+        assert mygc.strategy is None
+        assert mygc.get_estimates() == {}
+        fakegc.fire_minor(FakeMinorStats(total_memory_used=100))
+        assert mygc.strategy.last_mem == 100
+        mygc.disable()
+
+    def test_collect_step(self, fakegc, mh):
+        times = iter([10.0, 10.5, 20.0, 20.25])
+        mygc = UniformGc(clock=lambda: next(times))
+        mygc.strategy = s = FakeStrategy()
+        mygc.enable()
+        fakegc._steps_to_major = 2
+        fakegc.fire_minor(FakeMinorStats(total_memory_used=100))
+        assert s.ticks == [100]
+        assert s.steps == []
+        #
+        s.should_collect = True
+        fakegc.fire_minor(FakeMinorStats(total_memory_used=110))
+        # the step does a minor collection which reports 42 bytes: it is
+        # more up to date, so we pass it to the strategy
+        assert s.ticks == [100, 110]
+        assert s.steps == [(42, 0.5, False)]
+        #
+        # the last step of the major doesn't do any minor collection
+        fakegc.fire_minor(FakeMinorStats(total_memory_used=120))
+        assert s.ticks == [100, 110, 120]
+        assert s.steps == [(42, 0.5, False), (120, 0.25, True)]
+        mygc.disable()
+
+    def test_uniform_gc(self, fakegc, mh, clock):
+        MB = 1024*1024
+        mygc = UniformGc(clock)
+        mygc.enable()
+        mem = 0
+        for i in range(20):
+            clock.tick(0.01)
+            mem += MB
+            fakegc.fire_minor(FakeMinorStats(total_memory_used=mem))
+        mygc.disable()
+        assert mygc.strategy.clock is clock
+        est = mygc.get_estimates()
+        assert est['n_majors'] >= 1
+        # fakegc.collect_step always reports 42 bytes, so the estimated
+        # alloc_rate is not very meaningful
+        assert est['alloc_rate'] > 0
+        assert est['target_mem'] >= UniformGcStrategy.MIN_TARGET
+        assert est['estimated_cycle_time'] > 0
+        assert set(est) == set(['alloc_rate', 'mem', 'target_mem',
+                                'allocated_mem', 'target_allocated_mem',
+                                'estimated_cycle_time', 'cycle_time', 'steps',
+                                'last_step_duration', 'n_majors'])
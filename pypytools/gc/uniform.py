@@ -2,8 +2,10 @@
 The goal of this GC strategy is to spread the GC activity as evenly as
 possible.
 """
-import time
+import gc
 from collections import deque
+from pypytools.util import clock as default_clock
+from pypytools.gc.custom import CustomGc
 
 
 KB = 1024.0
@@ -33,10 +35,20 @@ class UniformGcStrategy(object):
     # adjust the estimated
     ESTIMATED_OVERFLOW_FACTOR = 1.1
 
-    def __init__(self, initial_mem):
+    def __init__(self, initial_mem, clock=None):
+        # clock should be monotonic: with a wall clock, the estimates would
+        # go crazy every time it is adjusted (but see util.CLOCK_IS_MONOTONIC)
+        if clock is None:
+            clock = default_clock
+        self.clock = clock
         self.last_mem = initial_mem   # last known value of used memory
-        self.last_t = time.time()     # time of the last tick
+        self.last_t = clock()         # time of the last tick
         self.alloc_rate = None        # estimated allocation rate, bytes/s
+        # the beginning of the interval over which we measure the next
+        # alloc_rate sample: it lags behind last_t/last_mem if the clock did
+        # not advance since then
+        self.rate_t = self.last_t
+        self.rate_mem = initial_mem
 
         # the memory allocated by the user program SINCE THE START of the
         # current collection.  Note that it is NOT equivalent to
@@ -71,22 +83,18 @@ class UniformGcStrategy(object):
         Regularly called by the user program. Return True if it is time to run a
         GC step.
         """
-        try:
-            cur_t = time.time()
-            self.update_alloc_stats(cur_t, mem)
-            if cur_t >= self.get_time_for_next_step():
-                return True
-            return False
-        finally:
-            self.record_mem(cur_t, mem)
+        cur_t = self.clock()
+        self.update_alloc_stats(cur_t, mem)
+        return cur_t >= self.get_time_for_next_step()
 
     def record_gc_step(self, mem, duration, stats):
         """
         Call this AFTER you call gc.collect_step
         """
-        cur_t = time.time()
+        cur_t = self.clock()
         self.record_mem(cur_t, mem)
         self.gc_cumul_t += duration
+        self.gc_last_step_duration = duration
 
         # if our estimate was too low, too bad. Just increase it. The
         # invariant is that gc_cumul_t < gc_estimated_t
@@ -103,12 +111,17 @@ class UniformGcStrategy(object):
     # ======================================================================
 
     def record_mem(self, cur_t, mem):
-        self.last_t = cur_t
-        self.last_mem = mem
+        self.last_t = self.rate_t = cur_t
+        self.last_mem = self.rate_mem = mem
 
     def start_another_major(self, mem):
-        # we estimate the time needed for a GC for a given target_mem
-        k_gc = self.gc_cumul_t / self.target_mem
+        # we estimate the time needed for a GC for a given target_mem. If we
+        # could not measure anything (e.g. because the clock is too coarse),
+        # we keep the previous estimate: an estimate of 0 would break the
+        # invariant gc_cumul_t < gc_estimated_t
+        if self.gc_cumul_t > 0:
+            self.k_gc = self.gc_cumul_t / self.target_mem
+        k_gc = self.k_gc
         self.n_majors += 1
         self.gc_cumul_t = 0
         self.gc_steps = 0
@@ -118,8 +131,21 @@ class UniformGcStrategy(object):
         self.gc_estimated_t = k_gc * self.target_mem
 
     def update_alloc_stats(self, cur_t, mem):
-        delta_t = cur_t - self.last_t
-        delta_mem = mem - self.last_mem
+        self.allocated_mem += mem - self.last_mem
+        self.last_t = cur_t
+        self.last_mem = mem
+        delta_t = cur_t - self.rate_t
+        if delta_t == 0:
+            # the clock is too coarse to measure the interval: keep rate_t
+            # and rate_mem, so that the next sample covers also the memory
+            # allocated in the meantime
+            return
+        delta_mem = mem - self.rate_mem
+        self.rate_t = cur_t
+        self.rate_mem = mem
+        if delta_t < 0:
+            # the clock went backwards: start measuring again from here
+            return
         cur_alloc_rate = delta_mem / delta_t # bytes/s
         cur_alloc_rate = max(1, cur_alloc_rate) # avoid ZeroDivisionError later
         if self.alloc_rate is None:
@@ -127,7 +153,6 @@ class UniformGcStrategy(object):
         else:
             # equivalent to an exponential moving average
             self.alloc_rate = (self.alloc_rate + cur_alloc_rate) / 2.0
-        self.allocated_mem += delta_mem
 
     def get_time_for_next_step(self):
         """
@@ -155,6 +180,10 @@ class UniformGcStrategy(object):
         if self.allocated_mem >= self.target_allocated_mem:
             return self.gc_last_step_t + self.EMERGENCY_DELAY
 
+        if self.alloc_rate is None:
+            # we could not measure any interval yet
+            return float('inf')
+
         # the invariant is that gc_cumul_t < gc_estimated_t; it is ensured in
         # record_gc_step
         gc_time_left = self.gc_estimated_t - self.gc_cumul_t
@@ -165,3 +194,67 @@ class UniformGcStrategy(object):
         p = gc_time_left / time_left
         wait_t = self.gc_last_step_duration * (1-p)/p
         return self.gc_last_step_t + wait_t
+
+
+class UniformGc(CustomGc):
+    """
+    Custom GC which uses UniformGcStrategy to decide when to run the steps of
+    the major collections: at each minor collection, it feeds the memory
+    usage to the strategy and runs a gc.collect_step if it is time.
+    """
+
+    def __init__(self, clock=None):
+        super(UniformGc, self).__init__(clock)
+        # we create the strategy at the first minor collection, when we know
+        # how much memory is used
+        self.strategy = None
+        self.inner_mem = None
+
+    def on_gc_minor(self, stats):
+        if self.nogc_count > 0:
+            # this is the minor collection done by gc.collect_step: take
+            # note of the memory, it is more up to date than ours
+            self.inner_mem = stats.total_memory_used
+            return
+
+        # see DefaultGc.on_gc_minor for why we need nogc()
+        with self.nogc():
+            mem = stats.total_memory_used
+            if self.strategy is None:
+                self.strategy = self.make_strategy(mem)
+            elif self.strategy.tick(mem):
+                self.collect_step(mem)
+
+    def make_strategy(self, mem):
+        return UniformGcStrategy(mem, self.clock)
+
+    def collect_step(self, mem):
+        self.inner_mem = None
+        t0 = self.clock()
+        step_stats = gc.collect_step()
+        duration = self.clock() - t0
+        if self.inner_mem is not None:
+            mem = self.inner_mem
+        self.strategy.record_gc_step(mem, duration, step_stats)
+        return step_stats
+
+    def get_estimates(self):
+        """
+        Return a dict with the current estimates of the strategy, for
+        monitoring
+        """
+        s = self.strategy
+        if s is None:
+            return {}
+        return {
+            'alloc_rate': s.alloc_rate,
+            'mem': s.last_mem,
+            'target_mem': s.target_mem,
+            'allocated_mem': s.allocated_mem,
+            'target_allocated_mem': s.target_allocated_mem,
+            'estimated_cycle_time': s.gc_estimated_t,
+            'cycle_time': s.gc_cumul_t,
+            'steps': s.gc_steps,
+            'last_step_duration': s.gc_last_step_duration,
+            'n_majors': s.n_majors,
+        }
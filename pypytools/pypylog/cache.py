@@ -0,0 +1,180 @@
+"""
+Persistent cache of parsed logs.
+
+The first time a log is parsed, the resulting ColumnarPyPyLog is saved in a
+sidecar directory next to it (one for each parser, so that e.g. the JIT and
+GC views of the same log don't invalidate each other's cache), which contains a meta.json and one .npy file
+for each array. The next time, the arrays are loaded with mmap, so that
+reopening a big log is instant.
+
+The cache is automatically invalidated if the path, size or mtime of the log
+change, or if it is parsed with a different frequency or parser.
+"""
+
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import importlib
+import numpy as np
+from pypytools.pypylog import parse
+from pypytools.pypylog import model
+
+VERSION = 4
+SUFFIX = '.pypytools-cache'
+
+def cache_dir(fname, parser=parse.GcParser):
+    return '%s.%s%s' % (fname, parser.__name__, SUFFIX)
+
+def make_key(fname, freq, parser):
+    st = os.stat(fname)
+    return {
+        'version': VERSION,
+        'path': os.path.abspath(fname),
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+        'freq': freq,
+        'parser': '%s.%s' % (parser.__module__, parser.__name__),
+    }
+
+def key_digest(key):
+    """
+    Return a hex digest of the key, to be stored in meta.json: comparing it
+    does not depend on how json round-trips the values (e.g. json.load
+    returns unicode for the byte-string paths, which don't compare equal if
+    they are not ASCII)
+    """
+    return hashlib.sha1(repr(sorted(key.items()))).hexdigest()
+
+def load(fname, freq=1, parser=parse.GcParser, use_cache=True):
+    """
+    Return a ColumnarPyPyLog for the given file, using the cache if it is
+    valid. Else, parse the file and write the cache for the next time.
+    """
+    if not use_cache:
+        return parser.from_file(fname, model.ColumnarPyPyLog(), freq)
+    key = make_key(fname, freq, parser)
+    log = read_cache(cache_dir(fname, parser), key)
+    if log is None:
+        log = parser.from_file(fname, model.ColumnarPyPyLog(), freq)
+        try:
+            write_cache(cache_dir(fname, parser), key, log)
+        except (IOError, OSError):
+            # e.g. the directory is not writable: too bad, we will parse it
+            # again next time
+            pass
+    return log
+
+def _class_name(cls):
+    if cls is None:
+        return None
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+def _import_class(name):
+    if name is None:
+        return None
+    modname, clsname = name.rsplit('.', 1)
+    mod = importlib.import_module(modname)
+    return getattr(mod, clsname)
+
+def write_cache(dirname, key, log):
+    """
+    Write the cache into a temporary directory, and rename it to dirname. An
+    existing cache is first renamed aside and then deleted: a concurrent
+    reader sees the old cache, the new one or no cache (and parses the log),
+    but never a partially written or deleted one. If another process
+    replaces the cache in the meantime, we keep its version.
+    """
+    parent = os.path.dirname(os.path.abspath(dirname))
+    tmpdir = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+    try:
+        sections = []
+        for i, name in enumerate(log.section_names):
+            cols = log.sections[name]
+            np.save(os.path.join(tmpdir, '%d.tsid.npy' % i), cols.tsid)
+            np.save(os.path.join(tmpdir, '%d.start.npy' % i), cols.start)
+            np.save(os.path.join(tmpdir, '%d.end.npy' % i), cols.end)
+            columns = {}
+            for j, (colname, col) in enumerate(sorted(cols.columns.items())):
+                fname = '%d.col%d.npy' % (i, j)
+                np.save(os.path.join(tmpdir, fname), col.data)
+                columns[colname] = {
+                    'file': fname,
+                    'kind': col.kind,
+                    'categories': col.categories,
+                }
+            sections.append({
+                'name': name,
+                'event_class': _class_name(cols.event_class),
+                'columns': columns,
+            })
+        np.save(os.path.join(tmpdir, 'section_id.npy'), log.section_id.data)
+        meta = {'key': key_digest(key), 'sections': sections}
+        with open(os.path.join(tmpdir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        #
+        old = None
+        if os.path.exists(dirname):
+            old = tempfile.mkdtemp(prefix='.old-', dir=parent)
+            try:
+                # rename() cannot replace a non-empty directory, so we move
+                # the old one inside the empty directory which we created
+                os.rename(dirname, os.path.join(old, 'cache'))
+            except OSError:
+                # another process removed or replaced it
+                pass
+        try:
+            os.rename(tmpdir, dirname)
+        except OSError:
+            # another process wrote the cache first
+            if not os.path.isdir(dirname):
+                raise
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+    except:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+
+def read_cache(dirname, key):
+    """
+    Return the cached log, or None if the cache does not exist or it is not
+    valid for the given key
+    """
+    try:
+        with open(os.path.join(dirname, 'meta.json')) as f:
+            meta = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if meta.get('key') != key_digest(key):
+        return None
+    #
+    def load_array(fname):
+        # fname is unicode if it comes from meta.json: make it a byte
+        # string, else joining it to a non-ASCII dirname fails
+        return np.load(os.path.join(dirname, str(fname)), mmap_mode='r')
+    #
+    try:
+        sections = []
+        for i, sect in enumerate(meta['sections']):
+            columns = {}
+            for colname, c in sect['columns'].iteritems():
+                kind = c['kind'] and str(c['kind'])
+                categories = [str(x) for x in c['categories']]
+                columns[str(colname)] = model.Column.from_data(
+                    kind, load_array(c['file']), categories)
+            cols = model.EventColumns.from_arrays(
+                str(sect['name']),
+                _import_class(sect['event_class']),
+                load_array('%d.tsid.npy' % i),
+                load_array('%d.start.npy' % i),
+                load_array('%d.end.npy' % i),
+                columns)
+            sections.append(cols)
+        section_id = load_array('section_id.npy')
+    except (IOError, OSError, ValueError, KeyError,
+            ImportError, AttributeError):
+        # corrupted or incomplete cache
+        return None
+    return model.ColumnarPyPyLog.from_sections(sections, section_id)
@@ -0,0 +1,34 @@
+"""
+Usage: pypylog <command> [<args>...]
+
+Commands:
+  report    Print a summary of the GC and JIT activity (no GUI needed)
+  export    Convert the log to Chrome trace/Perfetto format
+  diff      Compare two logs and detect regressions
+  stats     Compute statistics about the sections of the log
+  view      Open the interactive viewer (needs pyqtgraph)
+"""
+
+import sys
+
+COMMANDS = {
+    'report': 'pypytools.pypylog.report',
+    'export': 'pypytools.pypylog.export',
+    'diff': 'pypytools.pypylog.diff',
+    'stats': 'pypytools.pypylog.stats',
+    'view': 'pypytools.pypylog.view',
+}
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv or argv[0] not in COMMANDS:
+        print >> sys.stderr, __doc__.strip()
+        return 1
+    # import lazily, so that e.g. report works without Qt
+    modname = COMMANDS[argv[0]]
+    mod = __import__(modname, fromlist=['main'])
+    return mod.main(argv[1:])
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Usage: diff A B [options]
+
+Compare the GC and JIT behaviour of two PYPYLOGs, e.g. captured before and
+after upgrading PyPy or changing the PYPY_GC_* settings. For each metric,
+the distributions are compared with the Mann-Whitney U test: a metric
+regresses if B is significantly worse than A and its median grows more than
+the threshold. Exit with status 1 if there is any regression.
+
+Options:
+  --tsc-freq=FREQ   Convert the TSC counter to seconds with the specified
+                    frequency [default: auto]
+  --format=FMT      Output format: text or json [default: text]
+  --threshold=PCT   Minimum relative change of the median to report, in
+                    percent [default: 10]
+  --alpha=P         Significance level of the test [default: 0.01]
+  --window=SECONDS  Window used to compute the GC overhead [default: 1.0]
+  --no-cache        Don't use the cache of the parsed logs
+"""
+
+import sys
+import json
+import multiprocessing
+import numpy as np
+from pypytools.pypylog import parse
+from pypytools.pypylog import model
+from pypytools.pypylog import cache
+from pypytools.pypylog import stats
+
+# for all the metrics, lower is better
+METRICS = [
+    ('gc-minor', 'duration of gc-minor'),
+    ('gc-collect-step', 'duration of gc-collect-step'),
+    ('gc-major-cycle', 'duration of the major collections'),
+    ('gc-overhead', 'fraction of time spent in GC, per window'),
+    ('jit-compile', 'compile time of the loops and bridges'),
+]
+
+def compile_times(loops):
+    if isinstance(loops, model.EventColumns):
+        return (loops.column('tracing_time') + loops.column('optimize_time') +
+                loops.column('backend_time'))
+    return np.array([loop.compile_time for loop in loops], dtype=np.float64)
+
+def log_metrics(log, window=1.0):
+    """
+    Return a dict metric -> array of samples
+    """
+    res = {}
+    for name in ('gc-minor', 'gc-collect-step', 'gc-major-cycle'):
+        res[name] = stats.durations(log.sections.get(name, []))
+    res['gc-overhead'] = stats.gc_overhead(log, window)[1]
+    res['jit-compile'] = compile_times(log.sections.get('jit-loop', []))
+    return res
+
+def _load_metrics(args):
+    # this runs in the worker processes of load_both
+    fname, freq, use_cache, window = args
+    log = cache.load(fname, freq, parse.JitParser, use_cache)
+    return log_metrics(log, window)
+
+def load_both(fname_a, fname_b, freq=1, use_cache=True, window=1.0,
+              parallel=True):
+    """
+    Parse the two logs, in two processes if parallel is True, and return
+    their metrics
+    """
+    args = [(fname, freq, use_cache, window) for fname in (fname_a, fname_b)]
+    if not parallel:
+        return map(_load_metrics, args)
+    pool = multiprocessing.Pool(2)
+    try:
+        return pool.map(_load_metrics, args)
+    finally:
+        pool.close()
+        pool.join()
+
+def percentile(x, p):
+    if len(x) == 0:
+        return 0.0
+    return float(np.percentile(x, p))
+
+def relative_change(a, b):
+    """
+    Return (b - a) / a, or None if a is 0 and b is not: we don't return inf
+    because it is not valid JSON
+    """
+    if a == 0:
+        return 0.0 if b == 0 else None
+    return (b - a) / float(a)
+
+def compare(metrics_a, metrics_b, threshold=0.1, alpha=0.01):
+    """
+    Return a list of dicts, one for each metric
+    """
+    res = []
+    for name, descr in METRICS:
+        a = metrics_a[name]
+        b = metrics_b[name]
+        median_a = percentile(a, 50)
+        median_b = percentile(b, 50)
+        _, p = stats.mann_whitney(a, b)
+        change = relative_change(median_a, median_b)
+        if change is None:
+            # from 0 to something: the change is infinite
+            significant = p < alpha
+        else:
+            significant = p < alpha and abs(change) >= threshold
+        if not significant:
+            verdict = 'same'
+        elif median_b > median_a:
+            verdict = 'regression'
+        else:
+            verdict = 'improvement'
+        res.append({
+            'metric': name,
+            'description': descr,
+            'n_a': len(a),
+            'n_b': len(b),
+            'median_a': median_a,
+            'median_b': median_b,
+            'p99_a': percentile(a, 99),
+            'p99_b': percentile(b, 99),
+            'change': change,
+            'p_value': p,
+            'verdict': verdict,
+        })
+    return res
+
+def write_json(results, f):
+    json.dump(results, f, indent=2, sort_keys=True)
+    f.write('\n')
+
+def write_text(results, f):
+    fmt = '%-16s %8s %8s %10s %10s %9s %10s %10s %9s  %s\n'
+    f.write(fmt % ('metric', 'n A', 'n B', 'median A', 'median B', 'change',
+                   'p99 A', 'p99 B', 'p-value', ''))
+    for r in results:
+        f.write(fmt % (r['metric'], r['n_a'], r['n_b'],
+                       format(r['median_a'], '.6f'),
+                       format(r['median_b'], '.6f'),
+                       format_change(r['change']),
+                       format(r['p99_a'], '.6f'),
+                       format(r['p99_b'], '.6f'),
+                       format(r['p_value'], '.2g'),
+                       r['verdict'].upper() if r['verdict'] != 'same' else ''))
+
+def format_change(change):
+    if change is None:
+        return 'n/a'
+    return format(100 * change, '+.1f') + '%'
+
+WRITERS = {
+    'text': write_text,
+    'json': write_json,
+}
+
+def main(argv=None):
+    import docopt
+    args = docopt.docopt(__doc__, argv=argv)
+    fmt = args['--format']
+    if fmt not in WRITERS:
+        print >> sys.stderr, 'Unknown format: %s' % fmt
+        return 1
+    freq = parse.get_frequency(args['--tsc-freq'])
+    metrics_a, metrics_b = load_both(args['A'], args['B'], freq,
+                                     use_cache=not args['--no-cache'],
+                                     window=float(args['--window']))
+    results = compare(metrics_a, metrics_b,
+                      threshold=float(args['--threshold']) / 100.0,
+                      alpha=float(args['--alpha']))
+    WRITERS[fmt](results, sys.stdout)
+    if any(r['verdict'] == 'regression' for r in results):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""
+Usage: export FILE OUTPUT [options]
+
+Convert a PYPYLOG into a trace which can be loaded by Perfetto and
+chrome://tracing. The log is converted in streaming mode, so the memory
+usage does not depend on its size.
+
+Options:
+  --tsc-freq=FREQ   Convert the TSC counter to seconds with the specified
+                    frequency [default: auto]
+  --format=FMT      Output format: json (Chrome trace event format) or proto
+                    (Perfetto binary protobuf) [default: json]
+"""
+
+import sys
+import json
+import struct
+import attr
+from pypytools.pypylog import parse
+from pypytools.pypylog import model
+
+PID = 1
+TID_SECTIONS = 1
+TID_MAJOR_CYCLES = 2
+TID_JIT_LOOPS = 3
+THREAD_NAMES = {
+    TID_SECTIONS: 'sections',
+    TID_MAJOR_CYCLES: 'major cycles',
+    TID_JIT_LOOPS: 'loops',
+}
+
+# the events which don't correspond to a section of the log, but are
+# reconstructed by the parser: they overlap the sections and each other
+# without nesting, so each of them goes on a separate track
+DERIVED_SECTIONS = {
+    'gc-major-cycle': TID_MAJOR_CYCLES,
+    'jit-loop': TID_JIT_LOOPS,
+}
+
+_fields_cache = {}
+
+def event_args(ev):
+    """
+    Return a dict containing the extra fields of ev which are not None
+    """
+    cls = type(ev)
+    try:
+        names = _fields_cache[cls]
+    except KeyError:
+        names = [f.name for f in attr.fields(cls)
+                 if f.name not in model.EventColumns.BASE_FIELDS]
+        _fields_cache[cls] = names
+    args = {}
+    for name in names:
+        value = getattr(ev, name)
+        if value is not None:
+            args[name] = value
+    return args
+
+def category(section):
+    return section.split('-', 1)[0]
+
+def event_tid(ev):
+    return DERIVED_SECTIONS.get(ev.section, TID_SECTIONS)
+
+
+class ChromeTraceWriter(object):
+    """
+    Write the events in the JSON Chrome trace event format, as complete
+    ("X") events: the viewers reconstruct the nesting of the sections from
+    the timestamps. It implements add_event, so it can be passed as a log to
+    the parsers; call close() at the end.
+
+    scale is the factor to convert the times of the events to microseconds.
+    """
+
+    def __init__(self, f, scale=1e6):
+        self.f = f
+        self.scale = scale
+        self.f.write('[\n')
+        for tid, name in sorted(THREAD_NAMES.iteritems()):
+            self.f.write('{"name":"thread_name","ph":"M","pid":%d,"tid":%d,'
+                         '"args":{"name":"%s"}},\n' % (PID, tid, name))
+
+    def add_event(self, ev):
+        # section names can contain only [a-zA-Z0-9_-], so they don't need
+        # to be escaped
+        line = ('{"name":"%s","cat":"%s","ph":"X","ts":%.3f,"dur":%.3f,'
+                '"pid":%d,"tid":%d' % (
+                    ev.section, category(ev.section), ev.start * self.scale,
+                    (ev.end - ev.start) * self.scale, PID, event_tid(ev)))
+        args = event_args(ev)
+        if args:
+            line += ',"args":' + json.dumps(args, separators=(',', ':'))
+        self.f.write(line + '},\n')
+
+    def close(self):
+        # the trailing comma is not valid JSON, so we close the list with a
+        # last metadata event
+        self.f.write('{"name":"process_name","ph":"M","pid":%d,'
+                     '"args":{"name":"pypy"}}\n]\n' % PID)
+
+
+# ==============================================================
+# Perfetto protobuf
+# ==============================================================
+#
+# We encode by hand the few messages which we need, to avoid depending on
+# the protobuf library. The field numbers come from
+# protos/perfetto/trace/trace_packet.proto and track_event/*.proto in the
+# Perfetto sources.
+
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+
+# Trace
+TRACE_PACKET = 1
+# TracePacket
+PACKET_TIMESTAMP = 8
+PACKET_SEQUENCE_ID = 10
+PACKET_TRACK_EVENT = 11
+PACKET_TRACK_DESCRIPTOR = 60
+# TrackDescriptor
+TRACK_UUID = 1
+TRACK_NAME = 2
+# TrackEvent
+EVENT_DEBUG_ANNOTATIONS = 4
+EVENT_TYPE = 9
+EVENT_TRACK_UUID = 11
+EVENT_CATEGORIES = 22
+EVENT_NAME = 23
+TYPE_SLICE_BEGIN = 1
+TYPE_SLICE_END = 2
+# DebugAnnotation
+ANNOTATION_INT = 4
+ANNOTATION_DOUBLE = 5
+ANNOTATION_STRING = 6
+ANNOTATION_NAME = 10
+
+SEQUENCE_ID = 1
+
+def encode_varint(n):
+    if n < 0:
+        n &= (1 << 64) - 1 # two's complement, as int64 does
+    res = []
+    while n > 0x7f:
+        res.append(chr((n & 0x7f) | 0x80))
+        n >>= 7
+    res.append(chr(n))
+    return ''.join(res)
+
+def encode_tag(field, wire_type):
+    return encode_varint((field << 3) | wire_type)
+
+def encode_int(field, n):
+    return encode_tag(field, VARINT) + encode_varint(n)
+
+def encode_double(field, x):
+    return encode_tag(field, FIXED64) + struct.pack('<d', x)
+
+def encode_bytes(field, s):
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    return encode_tag(field, LENGTH_DELIMITED) + encode_varint(len(s)) + s
+
+def encode_annotation(name, value):
+    msg = encode_bytes(ANNOTATION_NAME, name)
+    if isinstance(value, basestring):
+        msg += encode_bytes(ANNOTATION_STRING, value)
+    elif isinstance(value, float):
+        msg += encode_double(ANNOTATION_DOUBLE, value)
+    else:
+        msg += encode_int(ANNOTATION_INT, value)
+    return encode_bytes(EVENT_DEBUG_ANNOTATIONS, msg)
+
+
+class PerfettoWriter(object):
+    """
+    Like ChromeTraceWriter, but write the binary protobuf format of
+    Perfetto, which is much more compact. Each event becomes a pair of
+    SLICE_BEGIN/SLICE_END packets: the packets are not sorted, trace
+    processor sorts them when loading the trace.
+
+    scale is the factor to convert the times of the events to nanoseconds.
+    """
+
+    def __init__(self, f, scale=1e9):
+        self.f = f
+        self.scale = scale
+        for tid, name in sorted(THREAD_NAMES.iteritems()):
+            descr = (encode_int(TRACK_UUID, tid) +
+                     encode_bytes(TRACK_NAME, name))
+            self.write_packet(encode_bytes(PACKET_TRACK_DESCRIPTOR, descr))
+
+    def write_packet(self, packet):
+        packet += encode_int(PACKET_SEQUENCE_ID, SEQUENCE_ID)
+        self.f.write(encode_bytes(TRACE_PACKET, packet))
+
+    def track_event(self, ts, track_event):
+        self.write_packet(encode_int(PACKET_TIMESTAMP, ts) +
+                          encode_bytes(PACKET_TRACK_EVENT, track_event))
+
+    def add_event(self, ev):
+        track = encode_int(EVENT_TRACK_UUID, event_tid(ev))
+        begin = (encode_int(EVENT_TYPE, TYPE_SLICE_BEGIN) + track +
+                 encode_bytes(EVENT_NAME, ev.section) +
+                 encode_bytes(EVENT_CATEGORIES, category(ev.section)))
+        for name, value in sorted(event_args(ev).iteritems()):
+            begin += encode_annotation(name, value)
+        end = encode_int(EVENT_TYPE, TYPE_SLICE_END) + track
+        self.track_event(int(round(ev.start * self.scale)), begin)
+        self.track_event(int(round(ev.end * self.scale)), end)
+
+    def close(self):
+        pass
+
+
+WRITERS = {
+    'json': (ChromeTraceWriter, 1e6),
+    'proto': (PerfettoWriter, 1e9),
+}
+
+def export(fname, out, fmt='json', freq=1, parser=parse.JitParser):
+    """
+    Convert the log fname and write it to the file object out. The times
+    are in seconds if freq is the frequency of the TSC.
+    """
+    cls, scale = WRITERS[fmt]
+    writer = cls(out, scale)
+    parser.from_file(fname, writer, freq)
+    writer.close()
+
+def main(argv=None):
+    import docopt
+    args = docopt.docopt(__doc__, argv=argv)
+    fmt = args['--format']
+    if fmt not in WRITERS:
+        print >> sys.stderr, 'Unknown format: %s' % fmt
+        return 1
+    freq = parse.get_frequency(args['--tsc-freq'])
+    with open(args['OUTPUT'], 'wb') as out:
+        export(args['FILE'], out, fmt, freq)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Level-of-detail decimation for scatter plots of millions of points.
+
+MinMaxPyramid precomputes, for increasingly bigger buckets of consecutive
+points, the index of the point with the minimum and maximum Y. To render a
+range, we pick the coarsest level which still has enough buckets for the
+screen, then keep only the min and max of each pixel column: the result
+looks the same as drawing all the points, but it contains at most
+2*npixels of them.
+
+query() returns indices into the original arrays, so that the caller can
+map a point on the screen back to the original event.
+"""
+
+import numpy as np
+
+def minmax_per_bucket(keys, Y, indices):
+    """
+    keys[i] is the bucket of indices[i]: for each bucket, keep only the
+    indices of the minimum and maximum Y
+    """
+    if len(indices) == 0:
+        return indices
+    order = np.lexsort((Y[indices], keys))
+    k = keys[order]
+    change = k[1:] != k[:-1]
+    first = np.concatenate(([True], change))
+    last = np.concatenate((change, [True]))
+    return indices[order[first | last]]
+
+
+class MinMaxPyramid(object):
+
+    # how many candidates per pixel we want from the pyramid, before the
+    # final per-pixel reduction
+    OVERSAMPLING = 4
+
+    def __init__(self, X, Y):
+        X = np.asarray(X, dtype=np.float64)
+        Y = np.asarray(Y, dtype=np.float64)
+        if len(X) > 1 and (np.diff(X) < 0).any():
+            self.order = np.argsort(X, kind='mergesort')
+            self.X = X[self.order]
+            self.Y = Y[self.order]
+        else:
+            self.order = None
+            self.X = X
+            self.Y = Y
+        # levels[k] contains the (argmin, argmax) of buckets of 2**k points;
+        # level 0 is implicit
+        self.levels = [None]
+        mins = maxs = np.arange(len(self.X))
+        while len(mins) > 1:
+            mins = self._reduce(mins, np.less_equal)
+            maxs = self._reduce(maxs, np.greater_equal)
+            self.levels.append((mins, maxs))
+
+    def _reduce(self, idx, cmp):
+        if len(idx) % 2:
+            idx = np.concatenate((idx, idx[-1:]))
+        a = idx[0::2]
+        b = idx[1::2]
+        return np.where(cmp(self.Y[a], self.Y[b]), a, b)
+
+    def __len__(self):
+        return len(self.X)
+
+    def query(self, x0, x1, npixels):
+        """
+        Return the sorted indices (into the original arrays) of the points to
+        draw in the range [x0, x1], on a screen which is npixels wide
+        """
+        npixels = max(int(npixels), 1)
+        i0 = np.searchsorted(self.X, x0, 'left')
+        i1 = np.searchsorted(self.X, x1, 'right')
+        n = i1 - i0
+        if n <= 2 * npixels:
+            indices = np.arange(i0, i1)
+        else:
+            # find the coarsest level which has at least
+            # OVERSAMPLING*npixels buckets in the range
+            k = 0
+            while (n >> (k+1)) >= self.OVERSAMPLING * npixels:
+                k += 1
+            if k == 0:
+                candidates = np.arange(i0, i1)
+            else:
+                mins, maxs = self.levels[k]
+                b0 = i0 >> k
+                b1 = ((i1 - 1) >> k) + 1
+                candidates = np.concatenate((mins[b0:b1], maxs[b0:b1]))
+                # the buckets at the border might contain points outside the
+                # range
+                candidates = candidates[(candidates >= i0) & (candidates < i1)]
+            width = float(x1 - x0) or 1.0
+            pixel = ((self.X[candidates] - x0) / width * npixels).astype(int)
+            indices = minmax_per_bucket(pixel, self.Y, candidates)
+            indices = np.unique(indices)
+        if self.order is not None:
+            indices = np.sort(self.order[indices])
+        return indices
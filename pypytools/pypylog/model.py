@@ -18,10 +18,76 @@ class Event(object):
 @attr.s
 class GcMinor(Event):
     memory = attr.ib(default=None)
+    pinned_objects = attr.ib(default=None)
+    surviving_size = attr.ib(default=None)
 
 @attr.s
 class GcCollectStep(Event):
     phase = attr.ib(default=None)
+    end_phase = attr.ib(default=None)
+
+@attr.s
+class GcCollectDone(Event):
+    arenas_before = attr.ib(default=None)
+    arenas_after = attr.ib(default=None)
+    arenas_bytes = attr.ib(default=None)
+    rawmalloced_before = attr.ib(default=None)
+    rawmalloced_after = attr.ib(default=None)
+    next_threshold = attr.ib(default=None)
+
+@attr.s
+class GcHardware(Event):
+    l2cache = attr.ib(default=None)
+
+@attr.s
+class JitLogOpt(Event):
+    kind = attr.ib(default=None) # 'loop', 'entry bridge' or 'bridge'
+    number = attr.ib(default=None) # loop number, or guard for bridges
+    n_ops = attr.ib(default=None)
+
+@attr.s
+class JitBackendAddr(Event):
+    number = attr.ib(default=None)
+    asm_start = attr.ib(default=None)
+    asm_end = attr.ib(default=None)
+
+@attr.s
+class JitLoop(Event):
+    """
+    A loop or bridge compiled by the JIT: start and end are the ones of the
+    jit-tracing section. It does not correspond to a section of the log:
+    JitParser reconstructs it out of the sections nested inside jit-tracing.
+    """
+    kind = attr.ib(default=None)
+    number = attr.ib(default=None)
+    n_ops = attr.ib(default=None)
+    tracing_time = attr.ib(default=0.0) # excluding optimize and backend
+    optimize_time = attr.ib(default=0.0)
+    backend_time = attr.ib(default=0.0)
+    asm_size = attr.ib(default=None)
+
+    @property
+    def compile_time(self):
+        return self.tracing_time + self.optimize_time + self.backend_time
+
+@attr.s
+class MajorCycle(Event):
+    """
+    A complete major collection, i.e. all the gc-collect-step from SCANNING
+    to the end of FINALIZING. It does not correspond to a section of the
+    log: GcParser reconstructs it out of the steps, and gives it the tsid of
+    the first one.
+    """
+    n_steps = attr.ib(default=0)
+    step_time = attr.ib(default=0.0) # time spent inside the steps
+    scanning_time = attr.ib(default=0.0)
+    marking_time = attr.ib(default=0.0)
+    sweeping_time = attr.ib(default=0.0)
+    finalizing_time = attr.ib(default=0.0)
+    # memory reported by the last gc-minor before the cycle and by the
+    # first one after it
+    mem_before = attr.ib(default=None)
+    mem_after = attr.ib(default=None)
 
 
 class PyPyLog(object):
@@ -40,39 +106,474 @@ class GroupedPyPyLog(object):
 
     def __init__(self):
         self.sections = defaultdict(list)
+        self._indexes = {} # section name -> SectionIndex
 
     def add_event(self, ev):
         self.sections[ev.section].append(ev)
 
-    def print_summary(self):
+    def get_index(self, name):
+        """
+        Return the SectionIndex of the given section, rebuilding it if
+        events have been added since the last time
+        """
+        events = self.sections.get(name, [])
+        index = self._indexes.get(name)
+        if index is None or len(index) != len(events):
+            start, end = event_arrays(events)
+            index = self._indexes[name] = SectionIndex(start, end)
+        return index
+
+    def query(self, sections=None, start=None, end=None, min_duration=None):
+        """
+        Return a dict section name -> events, containing the events which
+        overlap with [start, end] and last at least min_duration, sorted by
+        start time. For ColumnarPyPyLog the events are EventColumns, which
+        are views of the log when possible.
+        """
+        if sections is None:
+            sections = sorted(self.sections)
+        res = {}
+        for name in sections:
+            if name not in self.sections:
+                continue
+            idx = self.get_index(name).lookup(start, end, min_duration)
+            res[name] = select(self.sections[name], idx)
+        return res
+
+    def print_summary(self, start=None, end=None):
         fmt = '%-28s %6s %8s'
-        print fmt % ('section', 'n', 'delta')
+        print fmt % ('section', 'n', 'total')
         print '-'*44
-        for name, events in sorted(self.sections.iteritems()):
-            total = 0
-            for ev in events:
-                delta = ev.end - ev.start
-                assert delta >= 0
-                total += delta
-            print fmt % (name, len(events), format(delta, '.4f'))
+        sections = self.sections
+        if start is not None or end is not None:
+            sections = self.query(start=start, end=end)
+        for name, events in sorted(sections.iteritems()):
+            starts, ends = event_arrays(events)
+            delta = ends - starts
+            assert (delta >= 0).all()
+            print fmt % (name, len(events), format(delta.sum(), '.4f'))
+
+
+class GrowableArray(object):
+    """
+    A 1-dimensional numpy array which can be efficiently appended to. The
+    underlying buffer grows in chunks, and .data is a view (not a copy) of
+    the filled part.
+    """
+
+    CHUNK_SIZE = 4096
+
+    def __init__(self, dtype, data=None):
+        if data is None:
+            self._buf = np.empty(self.CHUNK_SIZE, dtype=dtype)
+            self.n = 0
+        else:
+            self._buf = data
+            self.n = len(data)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def data(self):
+        return self._buf[:self.n]
+
+    def append(self, x):
+        if self.n == len(self._buf):
+            self._grow()
+        self._buf[self.n] = x
+        self.n += 1
+
+    def _grow(self):
+        newsize = max(self.CHUNK_SIZE, len(self._buf) * 2)
+        buf = np.empty(newsize, dtype=self._buf.dtype)
+        buf[:self.n] = self._buf[:self.n]
+        self._buf = buf
+
+
+class Column(object):
+    """
+    Store the values of an extra field of an event class (e.g. GcMinor.memory)
+
+    The kind of the column is determined by the first value which is not
+    None:
+
+      - 'int' and 'float' are stored as float64, None is stored as NaN
+
+      - 'str' is stored as int32 codes which index self.categories, None is
+        stored as -1
+    """
+
+    def __init__(self):
+        self.kind = None
+        self.categories = []
+        self._codes = {}
+        self._array = None
+        self._n_none = 0 # number of None seen before we know the kind
+
+    @classmethod
+    def from_data(cls, kind, data, categories=()):
+        """
+        Build a column out of the values returned by .kind, .data and
+        .categories
+        """
+        col = cls()
+        if kind is None:
+            col._n_none = len(data)
+        else:
+            col.kind = kind
+            col.categories = list(categories)
+            col._codes = dict((x, i) for i, x in enumerate(col.categories))
+            col._array = GrowableArray(data.dtype, data)
+        return col
+
+    def __len__(self):
+        if self._array is None:
+            return self._n_none
+        return len(self._array)
+
+    def _init_array(self, value):
+        if isinstance(value, basestring):
+            self.kind = 'str'
+            self._array = GrowableArray(np.int32)
+            missing = -1
+        else:
+            self.kind = 'float' if isinstance(value, float) else 'int'
+            self._array = GrowableArray(np.float64)
+            missing = np.nan
+        for i in range(self._n_none):
+            self._array.append(missing)
+
+    def append(self, value):
+        if self.kind is None:
+            if value is None:
+                self._n_none += 1
+                return
+            self._init_array(value)
+        #
+        if self.kind == 'str':
+            if value is None:
+                code = -1
+            else:
+                code = self._codes.get(value)
+                if code is None:
+                    code = self._codes[value] = len(self.categories)
+                    self.categories.append(value)
+            self._array.append(code)
+        else:
+            self._array.append(np.nan if value is None else value)
+
+    def __getitem__(self, i):
+        if self._array is None:
+            if not -self._n_none <= i < self._n_none:
+                raise IndexError(i)
+            return None
+        x = self._array.data[i]
+        if self.kind == 'str':
+            return None if x == -1 else self.categories[x]
+        elif np.isnan(x):
+            return None
+        elif self.kind == 'int':
+            return int(x)
+        return float(x)
+
+    @property
+    def data(self):
+        """
+        The underlying array: float64 for numeric columns, int32 codes for
+        'str' columns
+        """
+        if self._array is None:
+            return np.full(self._n_none, np.nan)
+        return self._array.data
+
+
+class EventColumns(object):
+    """
+    Columnar storage for the events of a single section. Use .start, .end
+    and column() to get numpy views of the data, or use it as a sequence of
+    Event objects, which are created on the fly.
+    """
+
+    BASE_FIELDS = ('tsid', 'section', 'start', 'end')
+
+    def __init__(self, name):
+        self.name = name
+        self.event_class = None
+        self._tsid = GrowableArray('S16')
+        self._start = GrowableArray(np.float64)
+        self._end = GrowableArray(np.float64)
+        self.columns = {}
+
+    @classmethod
+    def from_arrays(cls, name, event_class, tsid, start, end, columns):
+        cols = cls(name)
+        cols.event_class = event_class
+        cols._tsid = GrowableArray(tsid.dtype, tsid)
+        cols._start = GrowableArray(start.dtype, start)
+        cols._end = GrowableArray(end.dtype, end)
+        cols.columns = columns
+        return cols
+
+    def append(self, ev):
+        if self.event_class is None:
+            self.event_class = type(ev)
+            for f in attr.fields(self.event_class):
+                if f.name not in self.BASE_FIELDS:
+                    self.columns[f.name] = Column()
+        elif type(ev) is not self.event_class:
+            raise TypeError("Cannot mix %s and %s in section %s" % (
+                self.event_class.__name__, type(ev).__name__, self.name))
+        self._tsid.append(ev.tsid)
+        self._start.append(ev.start)
+        self._end.append(ev.end)
+        for name, col in self.columns.iteritems():
+            col.append(getattr(ev, name))
+
+    @property
+    def tsid(self):
+        return self._tsid.data
+
+    @property
+    def start(self):
+        return self._start.data
+
+    @property
+    def end(self):
+        return self._end.data
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def select(self, idx):
+        """
+        Return a new EventColumns containing only the events selected by
+        idx, which can be a slice or an array of indices. With a slice, the
+        arrays are views of the original ones.
+        """
+        columns = {}
+        for name, col in self.columns.iteritems():
+            columns[name] = Column.from_data(col.kind, col.data[idx],
+                                             col.categories)
+        return EventColumns.from_arrays(self.name, self.event_class,
+                                        self.tsid[idx], self.start[idx],
+                                        self.end[idx], columns)
+
+    def column(self, name):
+        """
+        Return the array for the given extra field. If there is no such
+        field, return an array of NaNs
+        """
+        col = self.columns.get(name)
+        if col is None:
+            return np.full(len(self), np.nan)
+        return col.data
+
+    def __len__(self):
+        return len(self._start)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        kwargs = dict((name, col[i]) for name, col in self.columns.iteritems())
+        return self.event_class(self._tsid.data[i], self.name,
+                                float(self._start.data[i]),
+                                float(self._end.data[i]), **kwargs)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<EventColumns %s: %d events>' % (self.name, len(self))
+
+
+class SectionDict(dict):
+    """
+    Like defaultdict, but create the EventColumns through the log, which
+    assigns it a section id
+    """
+
+    def __init__(self, log):
+        dict.__init__(self)
+        self.log = log
+
+    def __missing__(self, name):
+        return self.log.get_section(name)
+
+
+class ColumnarPyPyLog(GroupedPyPyLog):
+    """
+    Like GroupedPyPyLog, but store the events of each section in numpy
+    arrays instead of lists of Event objects.
+    """
+
+    def __init__(self):
+        self.sections = SectionDict(self)
+        self._indexes = {}
+        self.section_names = []
+        self._section_ids = {}
+        self.section_id = GrowableArray(np.int32) # global order of the events
+
+    @classmethod
+    def from_sections(cls, sections, section_id):
+        """
+        Build a log out of a list of EventColumns and the array of the
+        section ids
+        """
+        log = cls()
+        for cols in sections:
+            log.sections[cols.name] = cols
+            log._section_ids[cols.name] = len(log.section_names)
+            log.section_names.append(cols.name)
+        log.section_id = GrowableArray(section_id.dtype, section_id)
+        return log
+
+    def get_section(self, name):
+        cols = self.sections.get(name) # note: .get() ignores __missing__
+        if cols is None:
+            cols = EventColumns(name)
+            self.sections[name] = cols
+            self._section_ids[name] = len(self.section_names)
+            self.section_names.append(name)
+        return cols
+
+    def add_event(self, ev):
+        self.get_section(ev.section).append(ev)
+        self.section_id.append(self._section_ids[ev.section])
+
+    def iter_events(self):
+        """
+        Yield all the events in the order in which they were added
+        """
+        sections = [self.sections[name] for name in self.section_names]
+        rows = [0] * len(sections)
+        for sid in self.section_id.data:
+            yield sections[sid][rows[sid]]
+            rows[sid] += 1
+
+    def all_events(self):
+        return list(self.iter_events())
+
+
+class SectionIndex(object):
+    """
+    The start and end times of the events of a section, sorted by start
+    time, to find the events in a given time range by binary search.
+    """
+
+    def __init__(self, start, end):
+        start = np.asarray(start, dtype=np.float64)
+        end = np.asarray(end, dtype=np.float64)
+        # the events are usually already sorted, unless they are nested
+        if len(start) > 1 and (np.diff(start) < 0).any():
+            self.order = np.argsort(start, kind='mergesort')
+            start = start[self.order]
+            end = end[self.order]
+        else:
+            self.order = None
+        self.start = start
+        self.end = end
+        if len(start):
+            self.max_duration = float((end - start).max())
+        else:
+            self.max_duration = 0.0
+
+    def __len__(self):
+        return len(self.start)
+
+    def lookup(self, t0=None, t1=None, min_duration=None):
+        """
+        Return the indices of the events which overlap with [t0, t1] and
+        last at least min_duration, sorted by start time. The result is a
+        slice if possible, else an array.
+        """
+        n = len(self.start)
+        i1 = n if t1 is None else np.searchsorted(self.start, t1, 'right')
+        if t0 is None:
+            i0 = j = 0
+            head = np.zeros(0, dtype=int)
+        else:
+            # the events which start before t0 overlap only if they end
+            # after it, and no event is longer than max_duration
+            j = np.searchsorted(self.start, t0, 'left')
+            i0 = np.searchsorted(self.start, t0 - self.max_duration, 'left')
+            head = i0 + np.flatnonzero(self.end[i0:j] >= t0)
+        j = min(j, i1)
+        head = head[head < i1]
+        if (self.order is None and min_duration is None and
+            (len(head) == 0 or head[0] == j - len(head))):
+            return slice(j - len(head), i1)
+        idx = np.concatenate((head, np.arange(j, i1)))
+        if min_duration is not None:
+            duration = self.end[idx] - self.start[idx]
+            idx = idx[duration >= min_duration]
+        if self.order is not None:
+            idx = self.order[idx]
+        return idx
+
+def select(events, idx):
+    """
+    Return the events selected by idx, as returned by SectionIndex.lookup
+    """
+    if isinstance(events, EventColumns):
+        return events.select(idx)
+    elif isinstance(idx, slice):
+        return events[idx]
+    return [events[i] for i in idx]
+
+def event_arrays(events):
+    """
+    Return two float64 arrays containing the start and end of the given
+    events. For EventColumns, they are views of the underlying storage.
+    """
+    if isinstance(events, EventColumns):
+        return events.start, events.end
+    n = len(events)
+    start = np.fromiter((ev.start for ev in events), np.float64, n)
+    end = np.fromiter((ev.end for ev in events), np.float64, n)
+    return start, end
+
 
 class Series(object):
+    """
+    X and Y coordinates of a list of points. The default dtype is float32,
+    which is what pyqtgraph likes most: use dtype='d' if you need more
+    precision, e.g. for timestamps of long runs.
+    """
 
     def __init__(self, n, dtype='f'):
         self.X = np.empty(n, dtype=dtype)
         self.Y = np.empty(n, dtype=dtype)
 
     @classmethod
-    def from_points(cls, points):
-        res = cls(len(points))
-        for i, (x, y) in enumerate(points):
-            res.X[i] = x
-            res.Y[i] = y
+    def from_arrays(cls, X, Y, dtype='f'):
+        assert len(X) == len(Y)
+        res = cls(len(X), dtype)
+        res.X[:] = X
+        res.Y[:] = Y
         return res
 
     @classmethod
-    def from_events(cls, events):
-        return cls.from_points([ev.as_point() for ev in events])
+    def from_points(cls, points, dtype='f'):
+        if len(points) == 0:
+            return cls(0, dtype)
+        a = np.array(points, dtype=np.float64)
+        return cls.from_arrays(a[:, 0], a[:, 1], dtype)
+
+    @classmethod
+    def from_events(cls, events, dtype='f'):
+        start, end = event_arrays(events)
+        return cls.from_arrays(start, end - start, dtype)
 
     def __len__(self):
         assert len(self.X) == len(self.Y)
@@ -90,26 +591,26 @@ class Series(object):
         self.X[i] = x
         self.Y[i] = y
 
-def make_step_chart(events):
+def make_step_chart(events, dtype='f'):
     """
     Construct a Series which appears like a step chart when you draw it using
     connect='pairs'
     """
-    # for each event we draw three lines, i.e. 6 points
-    n = len(events)
-    s = Series(n*6)
-    i = 0
-    for ev in events:
-        _, h = ev.as_point()
-        s[i+0] = (ev.start, 0)
-        s[i+1] = (ev.start, h)
-        #
-        s[i+2] = (ev.start, h)
-        s[i+3] = (ev.end, h)
-        #
-        s[i+4] = (ev.end, h)
-        s[i+5] = (ev.end, 0)
-        #
-        i += 6
-    #
-    return s
+    # for each event we draw three lines, i.e. 6 points:
+    #     (start, 0) (start, h)
+    #     (start, h) (end, h)
+    #     (end, h)   (end, 0)
+    start, end = event_arrays(events)
+    h = end - start
+    n = len(start)
+    X = np.empty((n, 6), dtype=dtype)
+    X[:, :3] = start[:, None]
+    X[:, 3:] = end[:, None]
+    Y = np.empty((n, 6), dtype=dtype)
+    Y[:, 0] = 0
+    Y[:, 1:5] = h[:, None]
+    Y[:, 5] = 0
+    res = Series(0, dtype)
+    res.X = X.ravel()
+    res.Y = Y.ravel()
+    return res
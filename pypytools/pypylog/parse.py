@@ -1,4 +1,9 @@
 import re
+import os
+import time
+import mmap
+import string
+import multiprocessing
 import attr
 from pypytools.pypylog import model
 
@@ -7,10 +12,102 @@ _color = "(?:\x1b.*?m)?"
 RE_START = re.compile(_color + r"\[([0-9a-fA-F]+)\] \{([\w-]+)" + _color + "$")
 RE_STOP  = re.compile(_color + r"\[([0-9a-fA-F]+)\] ([\w-]+)\}" + _color + "$")
 
+# used by parse_marker, which is the regex-free equivalent of RE_START and
+# RE_STOP for uncolored logs
+HEXDIGITS = string.hexdigits
+NAMECHARS = string.ascii_letters + string.digits + '_-'
+
 class ParseError(Exception):
     pass
 
 
+def parse_marker(line):
+    """
+    Fast check for lines in the form "[hex] {name" or "[hex] name}", without
+    the trailing newline. Return (kind, tsid, name), or None if the line is
+    not a marker. Colors are not supported.
+    """
+    close = line.find('] ', 1)
+    if close < 2 or line[0] != '[':
+        return None
+    tsid = line[1:close]
+    if tsid.strip(HEXDIGITS):
+        return None
+    rest = line[close+2:]
+    if rest[:1] == '{':
+        kind = 'start'
+        name = rest[1:]
+    elif rest[-1:] == '}':
+        kind = 'stop'
+        name = rest[:-1]
+    else:
+        return None
+    if not name or name.strip(NAMECHARS):
+        return None
+    return kind, tsid, name
+
+def is_colored(buf):
+    """
+    Return True if the markers of the log contain ANSI escape sequences, in
+    which case we cannot use the fast path. We look at the first marker,
+    which can come after an arbitrarily long preamble.
+    """
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        eol = buf.find('\n', pos)
+        if eol == -1:
+            eol = end
+        first = buf[pos:pos+1]
+        if first == '[' or first == '\x1b':
+            line = buf[pos:eol].rstrip('\r')
+            if first == '[' and parse_marker(line) is not None:
+                return False
+            if first == '\x1b' and (RE_START.match(line) or
+                                    RE_STOP.match(line)):
+                return True
+        pos = eol + 1
+    return False
+
+def iter_buffer_lines(buf, start=0, end=None):
+    pos = start
+    if end is None:
+        end = len(buf)
+    while pos < end:
+        eol = buf.find('\n', pos, end)
+        if eol == -1:
+            eol = end - 1
+        yield buf[pos:eol+1]
+        pos = eol + 1
+
+def split_buffer(buf, n):
+    """
+    Return a list of (start, end) offsets which split buf into at most n
+    chunks. Each chunk starts at the beginning of a line.
+    """
+    size = len(buf)
+    offsets = [0]
+    for i in range(1, n):
+        eol = buf.find('\n', size * i // n)
+        if eol == -1:
+            break
+        if eol + 1 > offsets[-1]:
+            offsets.append(eol + 1)
+    offsets.append(size)
+    return [(a, b) for a, b in zip(offsets, offsets[1:]) if a < b]
+
+def open_mmap(fname):
+    """
+    Return a read-only mmap of the given file, or None if the file is empty
+    """
+    with open(fname, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # mmap fails on empty files
+            return None
+
+
 @attr.s
 class Section(object):
     tsid = attr.ib()
@@ -19,27 +116,101 @@ class Section(object):
     stop = attr.ib(default=None)
     lines = attr.ib(default=attr.Factory(list))
 
+
+@attr.s
+class UnmatchedStop(object):
+    """
+    Used by parse_chunk: a stop marker whose start marker is in a previous
+    chunk. The lines are the ones which belong to the section but are found
+    in the current chunk.
+    """
+    tsid = attr.ib()
+    name = attr.ib()
+    stop = attr.ib()
+    lines = attr.ib(default=attr.Factory(list))
+
+
 class BaseParser(object):
     COLLECT_LINES = None
 
     def __init__(self, log, freq):
         self.log = log
         self.freq = freq
+        self.zero_ts = None
+        self.stack = []
+        # if not None, we are parsing a chunk: see parse_chunk
+        self.unmatched = None
+        self.pending_lines = None
 
     @classmethod
     def from_file(cls, fname, log=None, freq=1):
-        def parse_file(f):
-            p = cls(log, freq)
-            p.feed(f)
-            return log
-        #
         if log is None:
             log = model.PyPyLog()
+        p = cls(log, freq)
+        for ev in p._iter_fname_or_file(fname):
+            log.add_event(ev)
+        return log
+
+    @classmethod
+    def iter_file(cls, fname, freq=1):
+        """
+        Like from_file, but instead of building a log, yield the events as
+        soon as the corresponding sections are closed.
+        """
+        p = cls(None, freq)
+        return p._iter_fname_or_file(fname)
+
+    @classmethod
+    def from_file_parallel(cls, fname, log=None, freq=1, workers=None):
+        """
+        Like from_file, but split the file into chunks and parse them in
+        parallel using a multiprocessing pool. The result is the same as
+        from_file.
+        """
+        if log is None:
+            log = model.PyPyLog()
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        p = cls(log, freq)
+        buf = open_mmap(fname)
+        if buf is None:
+            return log
+        try:
+            p.zero_ts = p.find_zero_ts(buf)
+            chunks = split_buffer(buf, workers)
+        finally:
+            buf.close()
+        #
+        args = [(cls, fname, freq, p.zero_ts, start, end)
+                for (start, end) in chunks]
+        if len(args) == 1:
+            results = map(_parse_chunk, args)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(min(workers, len(args)))
+            results = pool.imap(_parse_chunk, args)
+        try:
+            # the stateful post-processing needs to see all the events in
+            # order, so it runs here and not in the workers
+            for ev in p.postprocess(p.merge_chunks(results)):
+                log.add_event(ev)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return log
+
+    def _iter_fname_or_file(self, fname):
         if isinstance(fname, basestring):
-            with open(fname) as f:
-                return parse_file(f)
+            return self.iter_path(fname)
         else:
-            return parse_file(fname)
+            return self.iter_events(fname)
+
+    def collect_lines(self, name):
+        """
+        Return True if we need to keep the inner lines of the section NAME
+        """
+        return bool(self.COLLECT_LINES)
 
     def parse_line(self, line):
         m = RE_START.match(line)
@@ -61,31 +232,248 @@ class BaseParser(object):
         return int(ts, 16) / self.freq
 
     def feed(self, f):
-        zero_ts = None
-        stack = []
+        for ev in self.iter_events(f):
+            self.log.add_event(ev)
+
+    def iter_events(self, f):
+        """
+        Parse the lines of f and yield the events produced by self.section()
+        and self.process().
+        """
+        return self.postprocess(self.iter_tokens(self.tokenize_lines(f)))
+
+    def iter_path(self, fname):
+        """
+        Like iter_events, but mmap the given file and use the fast path if
+        possible
+        """
+        buf = open_mmap(fname)
+        if buf is None:
+            return
+        try:
+            for ev in self.iter_buffer(buf):
+                yield ev
+        finally:
+            buf.close()
+
+    def iter_buffer(self, buf, start=0, end=None, final=True):
+        """
+        Like iter_events, but parse a string or a mmap object. If final is
+        False, more data is expected to follow and the events which are
+        still pending are not flushed: see Follower.
+        """
+        events = self.iter_tokens(self.tokenize(buf, start, end))
+        return self.postprocess(events, final)
+
+    def tokenize(self, buf, start=0, end=None):
+        if is_colored(buf):
+            return self.tokenize_lines(iter_buffer_lines(buf, start, end))
+        else:
+            return self.tokenize_buffer(buf, start, end)
+
+    def find_zero_ts(self, buf):
+        """
+        Return the timestamp of the first marker in buf
+        """
+        for kind, tsid, ts, name, text in self.tokenize(buf):
+            if ts is not None:
+                return ts
+        return None
+
+    def tokenize_lines(self, f):
+        """
+        Slow path: run the regexps on every line. Yield tuples (kind, tsid,
+        ts, name, text), where kind is None for the payload lines
+        """
         for line in f:
             if line == '\n':
                 continue
             kind, tsid, ts, name = self.parse_line(line)
-            if zero_ts is None:
-                zero_ts = ts
+            if kind is None:
+                yield None, None, None, None, line
+            else:
+                yield kind, tsid, ts, name, None
+
+    def tokenize_buffer(self, buf, start=0, end=None):
+        """
+        Fast path: like tokenize_lines, but jump directly from a line
+        starting with '[' to the next one. The payload between two markers is
+        yielded as a single chunk of text.
+
+        start and end delimit the portion of buf to tokenize: start must be
+        at the beginning of a line.
+        """
+        find = buf.find
+        if end is None:
+            end = len(buf)
+        pos = start          # where to start searching for the next candidate
+        text_start = start   # beginning of the payload not yet yielded
+        bol = start if buf[start:start+1] == '[' else -1
+        while True:
+            if bol == -1:
+                i = find('\n[', pos, end)
+                if i == -1:
+                    break
+                bol = i + 1
+            eol = find('\n', bol, end)
+            if eol == -1:
+                eol = end
+            marker = parse_marker(buf[bol:eol])
+            if marker is not None:
+                if text_start < bol:
+                    yield None, None, None, None, buf[text_start:bol]
+                kind, tsid, name = marker
+                yield kind, tsid, self.parse_timestamp(tsid), name, None
+                text_start = eol + 1
+            pos = eol
+            bol = -1
+        if text_start < end:
+            yield None, None, None, None, buf[text_start:end]
+
+    def iter_tokens(self, tokens):
+        """
+        Build the sections out of the tokens and yield the events produced by
+        self.section().
+
+        Only the currently open sections are kept alive, so the memory usage
+        is bounded by the nesting depth and not by the size of the log.
+        """
+        stack = self.stack
+        for kind, tsid, ts, name, text in tokens:
+            if self.zero_ts is None:
+                self.zero_ts = ts
             if kind == 'start':
-                stack.append(Section(tsid, name, start=ts-zero_ts))
+                lines = [] if self.collect_lines(name) else None
+                s = Section(tsid, name, start=ts-self.zero_ts, lines=lines)
+                stack.append(s)
             elif kind == 'stop':
+                if not stack:
+                    if self.unmatched is None:
+                        msg = "End section without start: %s"
+                        raise ParseError(msg % name)
+                    # the start marker is in a previous chunk
+                    self.unmatched.append(UnmatchedStop(tsid, name,
+                                                        ts-self.zero_ts))
+                    yield self.unmatched[-1]
+                    continue
                 if name != stack[-1].name:
                     msg = "End section does not match start: expected %s, got %s"
                     raise ParseError(msg % (stack[-1].name, name))
-                stack[-1].stop = ts - zero_ts
-                self.section(stack[-1])
-                stack.pop()
+                s = stack.pop()
+                s.stop = ts - self.zero_ts
+                ev = self.section(s)
+                if ev is not None:
+                    yield ev
             elif kind is None:
-                if self.COLLECT_LINES:
-                    stack[-1].lines.append(line)
+                if stack:
+                    lines = stack[-1].lines
+                elif self.unmatched is not None:
+                    # these lines belong to a section which was opened in a
+                    # previous chunk: we collect them in the *next*
+                    # UnmatchedStop, see parse_chunk
+                    lines = self.pending_lines
+                else:
+                    lines = None
+                if lines is not None:
+                    lines.extend(line for line in text.splitlines(True)
+                                 if line != '\n')
             else:
                 assert False
 
     def section(self, s):
-        pass
+        """
+        Called whenever a section is closed. Return an event, or None
+        """
+        return None
+
+    def process(self, ev):
+        """
+        Called for each event in log order, after section(). Return the
+        list of events to emit: subclasses can override it to derive events
+        which span multiple sections.
+        """
+        return [ev]
+
+    def finish(self):
+        """
+        Called at the end of the log: return the list of events which are
+        still pending in process()
+        """
+        return []
+
+    def postprocess(self, events, final=True):
+        for ev in events:
+            for ev2 in self.process(ev):
+                yield ev2
+        if final:
+            for ev in self.finish():
+                yield ev
+
+    def parse_chunk(self, fname, zero_ts, start, end):
+        """
+        Parse the portion of the file between start and end, which might
+        contain stop markers whose start marker is in a previous chunk, and
+        start markers which are closed in a following chunk.
+
+        Return a tuple (items, pending_lines, stack) where:
+
+          - items is the list of events and UnmatchedStop, in order
+
+          - pending_lines are the lines after the last UnmatchedStop which
+            belong to a section opened in a previous chunk
+
+          - stack is the list of sections which are still open
+        """
+        self.zero_ts = zero_ts
+        self.unmatched = []
+        self.pending_lines = []
+        items = []
+        buf = open_mmap(fname)
+        try:
+            # note: no postprocess() here, merge_chunks's caller does it
+            for item in self.iter_tokens(self.tokenize(buf, start, end)):
+                if isinstance(item, UnmatchedStop):
+                    item.lines = self.pending_lines
+                    self.pending_lines = []
+                items.append(item)
+        finally:
+            buf.close()
+        return items, self.pending_lines, self.stack
+
+    def merge_chunks(self, results):
+        """
+        Take the results of parse_chunk for consecutive chunks, and yield
+        the events in the same order as iter_events would do
+        """
+        stack = self.stack
+        for items, pending_lines, chunk_stack in results:
+            for item in items:
+                if not isinstance(item, UnmatchedStop):
+                    yield item
+                    continue
+                if not stack:
+                    msg = "End section without start: %s"
+                    raise ParseError(msg % item.name)
+                s = stack.pop()
+                if item.name != s.name:
+                    msg = "End section does not match start: expected %s, got %s"
+                    raise ParseError(msg % (s.name, item.name))
+                if s.lines is not None:
+                    s.lines.extend(item.lines)
+                s.stop = item.stop
+                ev = self.section(s)
+                if ev is not None:
+                    yield ev
+            if stack and stack[-1].lines is not None:
+                stack[-1].lines.extend(pending_lines)
+            stack.extend(chunk_stack)
+
+
+def _parse_chunk(args):
+    # this runs in the worker processes of BaseParser.from_file_parallel
+    cls, fname, freq, zero_ts, start, end = args
+    p = cls(None, freq)
+    return p.parse_chunk(fname, zero_ts, start, end)
 
 
 class FlatParser(BaseParser):
@@ -94,45 +482,463 @@ class FlatParser(BaseParser):
         BaseParser.__init__(self, log, freq)
 
     def section(self, s):
-        ev = model.Event(s.tsid, s.name, s.start, s.stop)
-        self.log.add_event(ev)
+        return model.Event(s.tsid, s.name, s.start, s.stop)
+
+
+class PayloadParser(object):
+    """
+    Table-driven parser for the payload of a section. The table is a list of
+    (pattern, fields), where pattern matches a whole line and contains one
+    group for each of the fields, which are tuples (name, convert).
+
+    The patterns are combined into a single regexp, so that each line is
+    matched only once; the index of the last group which matched tells us
+    which pattern it was.
+    """
+
+    def __init__(self, event_class, table):
+        self.event_class = event_class
+        self.alternatives = {} # lastindex -> (first group, fields)
+        parts = []
+        ngroups = 0
+        for pattern, fields in table:
+            n = re.compile(pattern).groups
+            assert n == len(fields) > 0, pattern
+            parts.append('(?:%s)' % pattern)
+            self.alternatives[ngroups + n] = (ngroups + 1, fields)
+            ngroups += n
+        self.regex = re.compile('|'.join(parts))
+
+    def parse(self, lines):
+        """
+        Return a dict containing the values found in the given lines
+        """
+        match = self.regex.match
+        alternatives = self.alternatives
+        res = {}
+        for line in lines:
+            m = match(line)
+            if m is None:
+                continue
+            first, fields = alternatives[m.lastindex]
+            for i, (name, convert) in enumerate(fields):
+                res[name] = convert(m.group(first + i).strip())
+        return res
+
+    def make_event(self, s):
+        return self.event_class(s.tsid, s.name, s.start, s.stop,
+                                **self.parse(s.lines))
+
+
+class MajorCycleBuilder(object):
+    """
+    Reconstruct the major collections out of the stream of gc-minor and
+    gc-collect-step events, in a single pass.
+
+    A cycle ends with the step which stops in the SCANNING state; for logs
+    which don't report it, we also close it when a step in SCANNING follows
+    a step in another phase. A complete cycle is kept pending until we see
+    the next gc-minor, which gives mem_after. The last cycle of the log is
+    discarded if it is not complete.
+    """
+
+    PHASE_FIELDS = {
+        'SCANNING': 'scanning_time',
+        'MARKING': 'marking_time',
+        'SWEEPING': 'sweeping_time',
+        'FINALIZING': 'finalizing_time',
+    }
+
+    def __init__(self):
+        self.minors = []       # (start, memory) of the last two gc-minor
+        self.current = None    # the cycle in progress
+        self.last_phase = None
+        self.done = None       # a complete cycle waiting for mem_after
+
+    def feed(self, ev):
+        """
+        Return the list of cycles which are complete after ev
+        """
+        res = []
+        if ev.section == 'gc-minor':
+            self.minors = self.minors[-1:] + [(ev.start, ev.memory)]
+            if self.done is not None and ev.start >= self.done.end:
+                self.done.mem_after = ev.memory
+                res.append(self.done)
+                self.done = None
+        elif ev.section == 'gc-collect-step':
+            if (self.current is not None and ev.phase == 'SCANNING' and
+                self.last_phase != 'SCANNING'):
+                res += self._close()
+            if self.current is None:
+                self.current = self._new_cycle(ev)
+            self._add_step(ev)
+            if ev.end_phase == 'SCANNING':
+                res += self._close()
+        return res
+
+    def flush(self):
+        if self.done is None:
+            return []
+        res = [self.done]
+        self.done = None
+        return res
+
+    def _new_cycle(self, ev):
+        mem_before = None
+        for start, memory in self.minors:
+            # skip the gc-minor which is nested inside the step
+            if start < ev.start:
+                mem_before = memory
+        return model.MajorCycle(ev.tsid, 'gc-major-cycle', ev.start, ev.end,
+                                mem_before=mem_before)
+
+    def _add_step(self, ev):
+        cycle = self.current
+        duration = ev.end - ev.start
+        cycle.end = ev.end
+        cycle.n_steps += 1
+        cycle.step_time += duration
+        field = self.PHASE_FIELDS.get(ev.phase)
+        if field is not None:
+            setattr(cycle, field, getattr(cycle, field) + duration)
+        self.last_phase = ev.phase
+
+    def _close(self):
+        res = self.flush()
+        cycle = self.current
+        self.current = None
+        self.last_phase = None
+        if self.minors and self.minors[-1][0] >= cycle.end:
+            cycle.mem_after = self.minors[-1][1]
+            res.append(cycle)
+        else:
+            self.done = cycle
+        return res
 
 
 class GcParser(FlatParser):
-    COLLECT_LINES = True
+    # kept for backwards compatibility: the payloads are now parsed by
+    # PAYLOADS, see _scan_for_regex
     RE_MINOR = re.compile('minor collect, total memory used: ([0-9]*)')
     RE_STEP = re.compile('starting gc state: (.*)')
+    RE_STEP_END = re.compile('stopping, now in gc state: (.*)')
+
+    # the payloads of these sections are parsed by PayloadParser; the other
+    # sections can still have a specialized on_<name> method
+    PAYLOADS = {
+        'gc-minor': PayloadParser(model.GcMinor, [
+            (r'minor collect, total memory used: *(\d+)',
+             [('memory', int)]),
+            (r'number of pinned objects: *(\d+)',
+             [('pinned_objects', int)]),
+            (r'total size of surviving objects: *(\d+)',
+             [('surviving_size', int)]),
+        ]),
+        'gc-collect-step': PayloadParser(model.GcCollectStep, [
+            (r'starting gc state: *(\w+)', [('phase', str)]),
+            (r'stopping, now in gc state: *(\w+)', [('end_phase', str)]),
+        ]),
+        'gc-collect-done': PayloadParser(model.GcCollectDone, [
+            (r'arenas: *(\d+) *=> *(\d+)',
+             [('arenas_before', int), ('arenas_after', int)]),
+            (r'bytes used in arenas: *(\d+)',
+             [('arenas_bytes', int)]),
+            (r'bytes raw-malloced: *(\d+) *=> *(\d+)',
+             [('rawmalloced_before', int), ('rawmalloced_after', int)]),
+            (r'next major collection threshold: *(\d+)',
+             [('next_threshold', int)]),
+        ]),
+        'gc-hardware': PayloadParser(model.GcHardware, [
+            (r'L2cache *= *(\d+)', [('l2cache', int)]),
+        ]),
+    }
+
+    def __init__(self, log, freq=1):
+        FlatParser.__init__(self, log, freq)
+        self._handlers = {}
+        self.cycles = MajorCycleBuilder()
+
+    def get_handler(self, name):
+        try:
+            return self._handlers[name]
+        except KeyError:
+            meth = getattr(self, 'on_%s' % (name.replace('-', '_')), None)
+            if meth is None and name in self.PAYLOADS:
+                meth = self.PAYLOADS[name].make_event
+            self._handlers[name] = meth
+            return meth
+
+    def collect_lines(self, name):
+        # we need the inner lines only for the sections which have a
+        # specialized handler
+        return self.get_handler(name) is not None
 
     def section(self, s):
-        name = 'on_%s' % (s.name.replace('-', '_'))
-        meth = getattr(self, name, None)
+        meth = self.get_handler(s.name)
         if meth:
-            meth(s)
+            return meth(s)
         else:
-            FlatParser.section(self, s)
+            return FlatParser.section(self, s)
+
+    # on_gc_minor and on_gc_collect_step are kept for the subclasses which
+    # override or call them: they route to PAYLOADS
+
+    def on_gc_minor(self, s):
+        return self.PAYLOADS['gc-minor'].make_event(s)
+
+    def on_gc_collect_step(self, s):
+        return self.PAYLOADS['gc-collect-step'].make_event(s)
 
     def _scan_for_regex(self, regex, lines):
+        # not used by GcParser anymore, kept for backwards compatibility
         for line in lines:
             m = regex.match(line)
             if m:
                 return m.group(1).strip()
         return None
 
-    def on_gc_minor(self, s):
-        memory = self._scan_for_regex(self.RE_MINOR, s.lines)
-        if memory:
-            memory = int(memory)
-        ev = model.GcMinor(s.tsid, s.name, s.start, s.stop, memory=memory)
-        self.log.add_event(ev)
+    def process(self, ev):
+        if ev.section in ('gc-minor', 'gc-collect-step'):
+            # the cycles completed by ev happened before it
+            return self.cycles.feed(ev) + [ev]
+        return [ev]
+
+    def finish(self):
+        return self.cycles.flush()
+
+
+def hexint(s):
+    return int(s, 16)
 
-    def on_gc_collect_step(self, s):
-        phase = self._scan_for_regex(self.RE_STEP, s.lines)
-        ev = model.GcCollectStep(s.tsid, s.name, s.start, s.stop, phase=phase)
-        self.log.add_event(ev)
 
+class JitLoopBuilder(object):
+    """
+    Attribute the time spent in the JIT to the loops and bridges, out of the
+    stream of events. The sections nested inside a jit-tracing are closed
+    before it, so we collect them until we see the jit-tracing which
+    contains them. The compilation steps which happen outside jit-tracing
+    are split into compilations, each of which becomes a JitLoop of its own,
+    with no tracing time.
+    """
+
+    SECTIONS = ('jit-optimize', 'jit-backend', 'jit-log-opt-loop',
+                'jit-log-opt-bridge', 'jit-backend-addr')
+
+    def __init__(self):
+        self.pending = [] # the events which are not attributed yet
+
+    def feed(self, ev):
+        """
+        Return the list of loops which are complete after ev
+        """
+        if ev.section in self.SECTIONS:
+            self.pending.append(ev)
+            return []
+        elif ev.section != 'jit-tracing':
+            return []
+        inside = [x for x in self.pending if x.start >= ev.start]
+        outside = [x for x in self.pending if x.start < ev.start]
+        self.pending = []
+        res = self.flush_events(outside)
+        loop = self.make_loop(ev, inside)
+        if loop is not None:
+            res.append(loop)
+        return res
+
+    def flush(self):
+        res = self.flush_events(self.pending)
+        self.pending = []
+        return res
+
+    def flush_events(self, events):
+        res = []
+        for group in self.split_compilations(events):
+            loop = self.make_loop(None, group)
+            if loop is not None:
+                res.append(loop)
+        return res
+
+    @staticmethod
+    def split_compilations(events):
+        """
+        Split the given events into groups, one for each compilation: a new
+        compilation begins with a jit-optimize or a jit-backend which comes
+        after the jit-backend of the current one (or with a jit-backend-addr
+        if the log does not contain the jit-backend sections)
+        """
+        groups = []
+        current = None
+        seen = set()
+        for ev in sorted(events, key=lambda ev: ev.start):
+            if current is not None:
+                if ev.section in ('jit-optimize', 'jit-backend'):
+                    new = 'jit-backend' in seen
+                elif ev.section == 'jit-backend-addr':
+                    new = ('jit-backend-addr' in seen and
+                           'jit-backend' not in seen)
+                else:
+                    new = False
+                if new:
+                    current = None
+            if current is None:
+                current = []
+                seen = set()
+                groups.append(current)
+            current.append(ev)
+            seen.add(ev.section)
+        return groups
+
+    def make_loop(self, tracing, events):
+        """
+        Return the JitLoop for the given events, or None if we don't know
+        which loop it is (e.g. because the tracing was aborted)
+        """
+        if tracing is None:
+            # the outer sections are closed last
+            first = min(events, key=lambda ev: ev.start)
+            loop = model.JitLoop(first.tsid, 'jit-loop', first.start,
+                                 max(ev.end for ev in events))
+        else:
+            loop = model.JitLoop(tracing.tsid, 'jit-loop', tracing.start,
+                                 tracing.end)
+        for ev in events:
+            duration = ev.end - ev.start
+            if ev.section == 'jit-optimize':
+                loop.optimize_time += duration
+            elif ev.section == 'jit-backend':
+                loop.backend_time += duration
+            elif ev.section in ('jit-log-opt-loop', 'jit-log-opt-bridge'):
+                if ev.number is not None:
+                    loop.kind = ev.kind
+                    loop.number = ev.number
+                    loop.n_ops = ev.n_ops
+            elif ev.section == 'jit-backend-addr':
+                if loop.number is None:
+                    loop.number = ev.number
+                if ev.asm_start is not None:
+                    loop.asm_size = ev.asm_end - ev.asm_start
+        if loop.number is None:
+            return None
+        if tracing is not None:
+            own = (tracing.end - tracing.start - loop.optimize_time -
+                   loop.backend_time)
+            loop.tracing_time = max(own, 0.0)
+        return loop
+
+
+class JitParser(GcParser):
+    """
+    Like GcParser, but also parse the headers of the JIT sections and emit a
+    JitLoop (section jit-loop) for each loop and bridge
+    """
+
+    PAYLOADS = GcParser.PAYLOADS.copy()
+    PAYLOADS.update({
+        'jit-log-opt-loop': PayloadParser(model.JitLogOpt, [
+            (r'# Loop (\d+)(?: \(.*\))? : (.*) with (\d+) ops',
+             [('number', str), ('kind', str), ('n_ops', int)]),
+        ]),
+        'jit-log-opt-bridge': PayloadParser(model.JitLogOpt, [
+            (r'# (bridge) out of Guard (\w+) with (\d+) ops',
+             [('kind', str), ('number', str), ('n_ops', int)]),
+        ]),
+        'jit-backend-addr': PayloadParser(model.JitBackendAddr, [
+            (r'Loop (\d+)(?: \(.*\))? has address (\w+) to (\w+)',
+             [('number', str), ('asm_start', hexint), ('asm_end', hexint)]),
+            (r'bridge out of Guard (\w+) has address (\w+) to (\w+)',
+             [('number', str), ('asm_start', hexint), ('asm_end', hexint)]),
+        ]),
+    })
+
+    def __init__(self, log, freq=1):
+        GcParser.__init__(self, log, freq)
+        self.loops = JitLoopBuilder()
+
+    def process(self, ev):
+        return GcParser.process(self, ev) + self.loops.feed(ev)
+
+    def finish(self):
+        return GcParser.finish(self) + self.loops.flush()
+
+
+class Follower(object):
+    """
+    Incrementally parse a log which is still being written, e.g. by a
+    running PyPy process. Each call to poll() parses the data appended since
+    the previous call and passes the new events to the callback. The parser
+    state (open sections, zero timestamp) is kept between calls, and a
+    partially written trailing line is kept until it is complete.
+    """
+
+    BLOCK_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, fname, callback, freq=1, parser=None):
+        if parser is None:
+            parser = GcParser
+        self.fname = fname
+        self.callback = callback
+        self.freq = freq
+        self.parser_class = parser
+        self.reset()
+
+    def reset(self):
+        self.parser = self.parser_class(None, self.freq)
+        self.offset = 0
+        self.partial = ''
+
+    def poll(self):
+        """
+        Parse the new data, if any. Return the number of new events.
+        """
+        try:
+            size = os.path.getsize(self.fname)
+        except OSError:
+            return 0
+        if size < self.offset:
+            # the file has been truncated or replaced: start from scratch
+            self.reset()
+        n = 0
+        with open(self.fname, 'rb') as f:
+            f.seek(self.offset)
+            while True:
+                data = f.read(self.BLOCK_SIZE)
+                if not data:
+                    break
+                self.offset += len(data)
+                n += self.feed(data)
+        return n
+
+    def feed(self, data):
+        data = self.partial + data
+        eol = data.rfind('\n')
+        self.partial = data[eol+1:]
+        if eol == -1:
+            return 0
+        n = 0
+        for ev in self.parser.iter_buffer(data, 0, eol+1, final=False):
+            self.callback(ev)
+            n += 1
+        return n
+
+    def follow(self, interval=1.0, stop=None):
+        """
+        Poll the file every interval seconds, until stop() returns True
+        """
+        while stop is None or not stop():
+            self.poll()
+            time.sleep(interval)
+
+
+def follow(fname, callback, freq=1, interval=1.0, stop=None, parser=None):
+    Follower(fname, callback, freq, parser).follow(interval, stop)
 
 flat = FlatParser.from_file
 gc = GcParser.from_file
+jit = JitParser.from_file
+iter_flat = FlatParser.iter_file
+iter_events = GcParser.iter_file
+parallel = GcParser.from_file_parallel
 
 def parse_frequency(s):
     """
@@ -155,3 +961,15 @@ def parse_frequency(s):
     if factor != 1:
         s = s[:-1]
     return float(s) * factor
+
+def get_frequency(freq):
+    """
+    Like parse_frequency, but 'auto' means the advertised frequency of the
+    current CPU
+    """
+    if freq == 'auto':
+        import cpuinfo
+        freq = cpuinfo.get_cpu_info()['hz_advertised_raw'][0] # Hz
+        return float(freq)
+    else:
+        return parse_frequency(freq)
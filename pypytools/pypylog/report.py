@@ -0,0 +1,200 @@
+"""
+Usage: report FILE [options]
+
+Print a summary of the GC and JIT activity recorded in a PYPYLOG. The log
+is parsed in streaming mode, so the memory usage does not depend on its
+size.
+
+Options:
+  --tsc-freq=FREQ   Convert the TSC counter to seconds with the specified
+                    frequency [default: auto]
+  --format=FMT      Output format: text or json [default: text]
+  --worst=N         Number of worst pauses and most expensive loops to
+                    report [default: 10]
+"""
+
+import sys
+import json
+import heapq
+from pypytools.pypylog import parse
+from pypytools.pypylog import stats
+
+GC_SECTIONS = stats.GC_SECTIONS
+JIT_SECTIONS = ('jit-tracing', 'jit-optimize', 'jit-backend')
+
+
+class Accumulator(object):
+    """
+    Streaming statistics about a sequence of durations
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.hist = stats.LogHistogram()
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.hist.add(duration)
+
+    def summary(self):
+        res = {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.hist.max or 0.0,
+        }
+        for p in stats.PERCENTILES:
+            res['p%s' % p] = self.hist.percentile(p)
+        return res
+
+
+class Report(object):
+    """
+    Collect the statistics which are needed for the report. It implements
+    add_event, so it can be passed as a log to the parsers.
+    """
+
+    def __init__(self, worst=10):
+        self.n_worst = worst
+        self.worst = [] # heap of (duration, start, section)
+        self.sections = {}
+        # statistics about the gc-major-cycle events
+        self.cycles = Accumulator()      # wall-clock duration of the cycles
+        self.step_time = Accumulator()   # time spent inside the steps
+        self.steps = Accumulator()       # number of steps per cycle
+        self.loops = [] # heap of (compile_time, start, JitLoop)
+        self.end_time = 0.0
+
+    def add_event(self, ev):
+        duration = ev.end - ev.start
+        if ev.section == 'gc-major-cycle':
+            self.cycles.add(duration)
+            self.step_time.add(ev.step_time)
+            self.steps.add(ev.n_steps)
+            return
+        elif ev.section == 'jit-loop':
+            self._push(self.loops, (ev.compile_time, ev.start, ev))
+            return
+        acc = self.sections.get(ev.section)
+        if acc is None:
+            acc = self.sections[ev.section] = Accumulator()
+        acc.add(duration)
+        self.end_time = max(self.end_time, ev.end)
+        if ev.section in GC_SECTIONS:
+            self._push(self.worst, (duration, ev.start, ev.section))
+
+    def _push(self, heap, item):
+        if len(heap) < self.n_worst:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heappushpop(heap, item)
+
+    def summary(self):
+        def section_summary(names):
+            return dict((name, self.sections[name].summary())
+                        for name in names if name in self.sections)
+        #
+        gc_time = sum(self.sections[name].total
+                      for name in GC_SECTIONS if name in self.sections)
+        return {
+            'duration': self.end_time,
+            'gc': section_summary(GC_SECTIONS),
+            'gc_time': gc_time,
+            'worst_pauses': [
+                {'section': section, 'start': start, 'duration': duration}
+                for duration, start, section in sorted(self.worst,
+                                                       reverse=True)],
+            'major_cycles': {
+                'duration': self.cycles.summary(),
+                'step_time': self.step_time.summary(),
+                'steps': self.steps.summary(),
+            },
+            'jit': section_summary(JIT_SECTIONS),
+            'jit_loops': [
+                {'kind': loop.kind, 'number': loop.number,
+                 'start': loop.start, 'n_ops': loop.n_ops,
+                 'asm_size': loop.asm_size,
+                 'compile_time': loop.compile_time,
+                 'tracing_time': loop.tracing_time,
+                 'optimize_time': loop.optimize_time,
+                 'backend_time': loop.backend_time}
+                for _, _, loop in sorted(self.loops, reverse=True)],
+        }
+
+def write_json(summary, f):
+    json.dump(summary, f, indent=2, sort_keys=True)
+    f.write('\n')
+
+def write_text(summary, f):
+    def stats_table(title, rows):
+        f.write('%s\n' % title)
+        fmt = '    %-20s %8s' + ' %10s' * 6 + '\n'
+        f.write(fmt % ('', 'count', 'total', 'mean', 'p50', 'p99', 'p99.9',
+                       'max'))
+        for name, st in rows:
+            f.write(fmt % (name, st['count'],
+                           format(st['total'], '.6f'),
+                           format(st['mean'], '.6f'),
+                           format(st['p50'], '.6f'),
+                           format(st['p99'], '.6f'),
+                           format(st['p99.9'], '.6f'),
+                           format(st['max'], '.6f')))
+        f.write('\n')
+    #
+    duration = summary['duration']
+    f.write('Total duration: %.6f\n' % duration)
+    if duration:
+        f.write('GC time: %.6f (%.2f%%)\n' % (
+            summary['gc_time'], 100.0 * summary['gc_time'] / duration))
+    f.write('\n')
+    stats_table('GC pauses', sorted(summary['gc'].items()))
+    majors = summary['major_cycles']
+    stats_table('Major collection cycles', [
+        ('duration', majors['duration']),
+        ('time in steps', majors['step_time']),
+        ('steps', majors['steps']),
+    ])
+    f.write('Worst pauses\n')
+    for p in summary['worst_pauses']:
+        f.write('    %-20s at %.6f: %.6f\n' % (p['section'], p['start'],
+                                               p['duration']))
+    f.write('\n')
+    stats_table('JIT', sorted(summary['jit'].items()))
+    f.write('Most expensive loops\n')
+    fmt = '    %-28s %8s %10s %10s %10s %10s %10s\n'
+    f.write(fmt % ('', 'ops', 'asm size', 'compile', 'tracing', 'optimize',
+                   'backend'))
+    for loop in summary['jit_loops']:
+        name = '%s %s' % (loop['kind'] or 'loop', loop['number'])
+        f.write(fmt % (name, loop['n_ops'], loop['asm_size'],
+                       format(loop['compile_time'], '.6f'),
+                       format(loop['tracing_time'], '.6f'),
+                       format(loop['optimize_time'], '.6f'),
+                       format(loop['backend_time'], '.6f')))
+
+WRITERS = {
+    'text': write_text,
+    'json': write_json,
+}
+
+def make_report(fname, freq=1, worst=10):
+    report = Report(worst)
+    parse.jit(fname, report, freq)
+    return report
+
+def main(argv=None):
+    import docopt
+    args = docopt.docopt(__doc__, argv=argv)
+    fmt = args['--format']
+    if fmt not in WRITERS:
+        print >> sys.stderr, 'Unknown format: %s' % fmt
+        return 1
+    freq = parse.get_frequency(args['--tsc-freq'])
+    report = make_report(args['FILE'], freq, int(args['--worst']))
+    WRITERS[fmt](report.summary(), sys.stdout)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
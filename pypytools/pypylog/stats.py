@@ -0,0 +1,302 @@
+"""
+Usage: stats FILE [options]
+
+Compute statistics about the sections of a PYPYLOG.
+
+Options:
+  --tsc-freq=FREQ   Convert the TSC counter to seconds with the specified
+                    frequency [default: auto]
+  --format=FMT      Output format: text, json or csv [default: text]
+  --window=SECONDS  Window used to compute the GC overhead and the
+                    minor-collection throughput [default: 1.0]
+  --no-cache        Don't use the cache of the parsed log
+"""
+
+import sys
+import csv
+import json
+import math
+import numpy as np
+from pypytools.pypylog import model
+from pypytools.pypylog import parse
+from pypytools.pypylog import cache
+
+PERCENTILES = (50, 90, 99, 99.9)
+STAT_NAMES = (['count', 'total', 'mean'] +
+              ['p%s' % p for p in PERCENTILES] +
+              ['max'])
+
+# the sections which count as GC time. Note that they can be nested, e.g. a
+# gc-collect-step usually contains a gc-minor
+GC_SECTIONS = ('gc-minor', 'gc-collect-step')
+
+class LogHistogram(object):
+    """
+    Streaming histogram with logarithmic buckets: it can estimate the
+    percentiles with the given relative precision, using memory
+    proportional to the dynamic range of the values instead of their
+    number.
+    """
+
+    def __init__(self, precision=0.01, min_value=1e-9):
+        self.log_base = math.log(1 + precision)
+        self.min_value = min_value
+        self.buckets = {}
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        if x < self.min_value:
+            i = None
+        else:
+            i = int(math.log(x / self.min_value) / self.log_base)
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+        self.count += 1
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    def _bucket_value(self, i):
+        if i is None:
+            return 0.0
+        # geometric mean of the bucket boundaries
+        return self.min_value * math.exp((i + 0.5) * self.log_base)
+
+    def percentile(self, p):
+        if self.count == 0:
+            return 0.0
+        if p >= 100:
+            return self.max
+        rank = p / 100.0 * self.count
+        seen = 0
+        keys = sorted(self.buckets, key=lambda i: -1 if i is None else i)
+        for i in keys:
+            seen += self.buckets[i]
+            if seen >= rank:
+                break
+        return min(max(self._bucket_value(i), self.min), self.max)
+
+
+def rankdata(x):
+    """
+    Return (ranks, tie_sizes): the ranks of the values of x start from 1,
+    and ties get the average of the ranks they span. tie_sizes contains the
+    number of elements of each group of equal values.
+    """
+    x = np.asarray(x)
+    order = np.argsort(x, kind='mergesort')
+    xs = x[order]
+    # the beginning of each group of equal values
+    is_first = np.concatenate(([True], xs[1:] != xs[:-1]))
+    group = np.cumsum(is_first) - 1
+    first = np.flatnonzero(is_first)
+    last = np.concatenate((first[1:], [len(x)])) - 1
+    avg = (first + last) / 2.0 + 1
+    ranks = np.empty(len(x))
+    ranks[order] = avg[group]
+    return ranks, last - first + 1
+
+def mann_whitney(a, b):
+    """
+    Two-sided Mann-Whitney U test, using the normal approximation with tie
+    correction, which is accurate for samples of more than ~20 elements.
+    Return (U, p), where U is the statistic of a.
+    """
+    n1 = len(a)
+    n2 = len(b)
+    if n1 == 0 or n2 == 0:
+        return 0.0, 1.0
+    ranks, tie_sizes = rankdata(np.concatenate((a, b)))
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2.0
+    n = n1 + n2
+    ties = (tie_sizes ** 3 - tie_sizes).sum()
+    var = n1 * n2 / 12.0 * ((n + 1) - ties / float(n * (n - 1)))
+    if var <= 0:
+        # all the values are equal
+        return u, 1.0
+    z = (abs(u - n1 * n2 / 2.0) - 0.5) / math.sqrt(var) # with continuity
+    p = math.erfc(max(z, 0) / math.sqrt(2))
+    return u, min(p, 1.0)
+
+def durations(events):
+    start, end = model.event_arrays(events)
+    return end - start
+
+def section_stats(events):
+    """
+    Return a dict containing count, total, mean, percentiles and max of the
+    durations of the given events
+    """
+    d = durations(events)
+    res = {'count': len(d)}
+    if len(d) == 0:
+        for name in STAT_NAMES[1:]:
+            res[name] = 0.0
+        return res
+    res['total'] = float(d.sum())
+    res['mean'] = float(d.mean())
+    for p, value in zip(PERCENTILES, np.percentile(d, PERCENTILES)):
+        res['p%s' % p] = float(value)
+    res['max'] = float(d.max())
+    return res
+
+def pause_histogram(events, bins=None):
+    """
+    Return (counts, edges) of the durations of the given events. By default,
+    use logarithmic bins between 1us and 10s.
+    """
+    if bins is None:
+        bins = np.logspace(-6, 1, 36)
+    return np.histogram(durations(events), bins)
+
+def merge_intervals(start, end):
+    """
+    Return the union of the given intervals, as two sorted arrays of
+    non-overlapping intervals
+    """
+    if len(start) == 0:
+        return start, end
+    order = np.argsort(start, kind='mergesort')
+    start = start[order]
+    end = np.maximum.accumulate(end[order])
+    # a new interval begins whenever start is after all the previous ends
+    is_new = np.concatenate(([True], start[1:] > end[:-1]))
+    is_last = np.concatenate((is_new[1:], [True]))
+    return start[is_new], end[is_last]
+
+def busy_time(start, end, t):
+    """
+    Given sorted non-overlapping intervals, return the total time spent
+    inside them before each of the times in t
+    """
+    cumdur = np.concatenate(([0.0], np.cumsum(end - start)))
+    k = np.searchsorted(start, t, 'right')
+    # the k-th interval might still be in progress at time t
+    last_end = np.concatenate(([-np.inf], end))[k]
+    return cumdur[k] - np.maximum(0, last_end - t)
+
+def gc_overhead(log, window=1.0, sections=GC_SECTIONS):
+    """
+    Return (times, overhead), where overhead[i] is the fraction of
+    [times[i], times[i]+window] spent in the given sections
+    """
+    starts = []
+    ends = []
+    for name in sections:
+        if name in log.sections:
+            start, end = model.event_arrays(log.sections[name])
+            starts.append(start)
+            ends.append(end)
+    if not starts or sum(map(len, starts)) == 0:
+        return np.zeros(0), np.zeros(0)
+    start, end = merge_intervals(np.concatenate(starts), np.concatenate(ends))
+    t0 = np.floor(start[0] / window) * window
+    n = int(np.ceil((end[-1] - t0) / window)) or 1
+    edges = t0 + np.arange(n + 1) * window
+    busy = busy_time(start, end, edges)
+    return edges[:-1], np.diff(busy) / window
+
+def minor_throughput(log, window=1.0):
+    """
+    Return (times, minors, growth), where minors[i] is the number of minor
+    collections which started in [times[i], times[i]+window], and growth[i]
+    is the rate (in bytes/s) at which the memory reported by them grew
+    """
+    events = log.sections.get('gc-minor', [])
+    if len(events) == 0:
+        return np.zeros(0), np.zeros(0, dtype=int), np.zeros(0)
+    start, _ = model.event_arrays(events)
+    if isinstance(events, model.EventColumns):
+        memory = events.column('memory')
+    else:
+        memory = np.array([ev.memory for ev in events], dtype=np.float64)
+    t0 = np.floor(start.min() / window) * window
+    idx = ((start - t0) // window).astype(int)
+    n = idx.max() + 1
+    minors = np.bincount(idx, minlength=n)
+    delta = np.diff(memory)
+    delta = np.where(delta > 0, delta, 0) # ignore NaN and negative values
+    growth = np.bincount(idx[1:], weights=delta, minlength=n) / window
+    return t0 + np.arange(n) * window, minors, growth
+
+def summarize(log, window=1.0):
+    """
+    Return a dict containing all the statistics, suitable to be dumped as
+    JSON
+    """
+    sections = {}
+    histograms = {}
+    for name, events in sorted(log.sections.iteritems()):
+        sections[name] = section_stats(events)
+        if name in GC_SECTIONS:
+            counts, edges = pause_histogram(events)
+            histograms[name] = {'counts': counts.tolist(),
+                                'edges': edges.tolist()}
+    times, overhead = gc_overhead(log, window)
+    mtimes, minors, growth = minor_throughput(log, window)
+    return {
+        'sections': sections,
+        'histograms': histograms,
+        'gc_overhead': {
+            'window': window,
+            'times': times.tolist(),
+            'overhead': overhead.tolist(),
+        },
+        'minor_throughput': {
+            'window': window,
+            'times': mtimes.tolist(),
+            'minors': minors.tolist(),
+            'growth': growth.tolist(),
+        },
+    }
+
+def write_json(summary, f):
+    json.dump(summary, f, indent=2, sort_keys=True)
+    f.write('\n')
+
+def write_csv(summary, f):
+    """
+    Write one row for each section
+    """
+    writer = csv.writer(f)
+    writer.writerow(['section'] + STAT_NAMES)
+    for name, st in sorted(summary['sections'].iteritems()):
+        writer.writerow([name] + [st[key] for key in STAT_NAMES])
+
+def write_text(summary, f):
+    fmt = '%-28s %8s' + ' %10s' * (len(STAT_NAMES) - 1) + '\n'
+    f.write(fmt % (('section',) + tuple(STAT_NAMES)))
+    f.write('-' * (37 + 11 * (len(STAT_NAMES) - 1)) + '\n')
+    for name, st in sorted(summary['sections'].iteritems()):
+        values = [format(st[key], '.6f') for key in STAT_NAMES[1:]]
+        f.write(fmt % tuple([name, st['count']] + values))
+    overhead = summary['gc_overhead']['overhead']
+    if overhead:
+        f.write('\n')
+        f.write('GC overhead (window %ss): mean %.2f%%, max %.2f%%\n' % (
+            summary['gc_overhead']['window'],
+            100.0 * np.mean(overhead), 100.0 * np.max(overhead)))
+
+WRITERS = {
+    'text': write_text,
+    'json': write_json,
+    'csv': write_csv,
+}
+
+def main(argv=None):
+    import docopt
+    args = docopt.docopt(__doc__, argv=argv)
+    fmt = args['--format']
+    if fmt not in WRITERS:
+        print >> sys.stderr, 'Unknown format: %s' % fmt
+        return 1
+    freq = parse.get_frequency(args['--tsc-freq'])
+    log = cache.load(args['FILE'], freq, use_cache=not args['--no-cache'])
+    summary = summarize(log, float(args['--window']))
+    WRITERS[fmt](summary, sys.stdout)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
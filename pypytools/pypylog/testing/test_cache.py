@@ -0,0 +1,172 @@
+import os
+import textwrap
+import pytest
+import numpy as np
+from pypytools.pypylog import cache
+from pypytools.pypylog import parse
+from pypytools.pypylog import model
+from pypytools.pypylog.model import GcMinor, GcCollectStep
+
+TEXT = textwrap.dedent("""
+[ff000] {gc-minor
+[ff001] {gc-minor-walkroots
+[ff002] gc-minor-walkroots}
+minor collect, total memory used: 1000
+[ff100] gc-minor}
+[ff200] {gc-collect-step
+starting gc state:  SCANNING
+[ff300] gc-collect-step}
+[ff400] {gc-minor
+[ff500] gc-minor}
+""")
+
+class TestCache(object):
+
+    @pytest.fixture
+    def fname(self, tmpdir):
+        fname = tmpdir.join('log')
+        fname.write(TEXT)
+        return str(fname)
+
+    def test_roundtrip(self, fname):
+        log1 = cache.load(fname)
+        assert os.path.isdir(cache.cache_dir(fname))
+        log2 = cache.load(fname)
+        assert log2.section_names == log1.section_names
+        assert log2.all_events() == log1.all_events()
+        assert log2.all_events() == parse.gc(fname).all_events()
+        minors = log2.sections['gc-minor']
+        assert isinstance(minors.start, np.memmap)
+        assert minors == [
+            GcMinor('ff000', 'gc-minor', 0x000, 0x100, memory=1000),
+            GcMinor('ff400', 'gc-minor', 0x400, 0x500, memory=None),
+        ]
+        steps = log2.sections['gc-collect-step']
+        assert steps[0] == GcCollectStep('ff200', 'gc-collect-step',
+                                         0x200, 0x300, phase='SCANNING')
+
+    def test_use_cache(self, fname, monkeypatch):
+        cache.load(fname)
+        # the second time we don't parse the file
+        def from_file(*args):
+            assert False, 'should not be called'
+        monkeypatch.setattr(parse.GcParser, 'from_file', from_file)
+        log = cache.load(fname)
+        assert len(log.sections['gc-minor']) == 2
+
+    def test_non_ascii_path(self, tmpdir, monkeypatch):
+        fname = str(tmpdir.join('log-\xc3\xa0'))
+        with open(fname, 'w') as f:
+            f.write(TEXT)
+        cache.load(fname)
+        def from_file(*args):
+            assert False, 'should not be called'
+        monkeypatch.setattr(parse.GcParser, 'from_file', from_file)
+        log = cache.load(fname)
+        assert len(log.sections['gc-minor']) == 2
+
+    def test_one_cache_per_parser(self, fname, monkeypatch):
+        cache.load(fname)
+        cache.load(fname, parser=parse.JitParser)
+        assert os.path.isdir(cache.cache_dir(fname))
+        assert os.path.isdir(cache.cache_dir(fname, parse.JitParser))
+        # loading with one parser does not invalidate the other cache
+        def from_file(*args):
+            assert False, 'should not be called'
+        monkeypatch.setattr(parse.GcParser, 'from_file', from_file)
+        monkeypatch.setattr(parse.JitParser, 'from_file', from_file)
+        cache.load(fname)
+        cache.load(fname, parser=parse.JitParser)
+
+    def test_replace_cache(self, fname, tmpdir):
+        cache.load(fname)
+        dirname = cache.cache_dir(fname)
+        key = cache.make_key(fname, 1, parse.GcParser)
+        log = parse.gc(fname, model.ColumnarPyPyLog())
+        cache.write_cache(dirname, key, log)
+        # no leftover temporary directories
+        assert sorted(os.listdir(str(tmpdir))) == ['log',
+                                                   os.path.basename(dirname)]
+        assert cache.read_cache(dirname, key) is not None
+
+    def test_concurrent_writers(self, fname, tmpdir, monkeypatch):
+        # another process writes the cache just before we rename ours: we
+        # keep its version
+        dirname = cache.cache_dir(fname)
+        key = cache.make_key(fname, 1, parse.GcParser)
+        log = parse.gc(fname, model.ColumnarPyPyLog())
+        rename = os.rename
+        def concurrent_rename(src, dst):
+            if dst == dirname and not os.path.exists(dirname):
+                monkeypatch.setattr(cache.os, 'rename', rename)
+                cache.write_cache(dirname, key, log)
+            return rename(src, dst)
+        monkeypatch.setattr(cache.os, 'rename', concurrent_rename)
+        cache.write_cache(dirname, key, log)
+        assert cache.read_cache(dirname, key) is not None
+        assert sorted(os.listdir(str(tmpdir))) == ['log',
+                                                   os.path.basename(dirname)]
+
+    def test_append_to_cached_log(self, fname):
+        cache.load(fname)
+        log = cache.load(fname)
+        log.add_event(GcMinor('ff600', 'gc-minor', 0x600, 0x700, memory=5))
+        minors = log.sections['gc-minor']
+        assert len(minors) == 3
+        assert minors[2].memory == 5
+        assert list(log.section_id.data)[-1] == 1
+
+    def test_invalidate(self, fname):
+        log = cache.load(fname)
+        assert len(log.sections['gc-minor']) == 2
+        with open(fname, 'a') as f:
+            f.write('[ff600] {gc-minor\n[ff700] gc-minor}\n')
+        log = cache.load(fname)
+        assert len(log.sections['gc-minor']) == 3
+        #
+        # same size, different mtime
+        st = os.stat(fname)
+        with open(fname, 'r+') as f:
+            f.write(TEXT.replace('1000', '2000'))
+        os.utime(fname, (st.st_atime, st.st_mtime + 10))
+        log = cache.load(fname)
+        assert log.sections['gc-minor'][0].memory == 2000
+
+    def test_invalidate_freq(self, fname):
+        log = cache.load(fname, freq=1)
+        assert log.sections['gc-minor'][0].end == 0x100
+        log = cache.load(fname, freq=2.0)
+        assert log.sections['gc-minor'][0].end == 0x100 / 2.0
+
+    def test_corrupted_cache(self, fname):
+        cache.load(fname)
+        os.remove(os.path.join(cache.cache_dir(fname), 'section_id.npy'))
+        log = cache.load(fname)
+        assert len(log.sections['gc-minor']) == 2
+        # the cache has been rewritten
+        assert os.path.exists(os.path.join(cache.cache_dir(fname),
+                                           'section_id.npy'))
+
+    def test_no_cache(self, fname):
+        log = cache.load(fname, use_cache=False)
+        assert len(log.sections['gc-minor']) == 2
+        assert not os.path.exists(cache.cache_dir(fname))
+
+    def test_readonly_dir(self, fname, monkeypatch):
+        def write_cache(*args):
+            raise OSError('read-only')
+        monkeypatch.setattr(cache, 'write_cache', write_cache)
+        log = cache.load(fname)
+        assert len(log.sections['gc-minor']) == 2
+
+    def test_empty_section(self, tmpdir):
+        log = model.ColumnarPyPyLog()
+        log.add_event(GcMinor('a', 'gc-minor', 0, 1, memory=None))
+        log.sections['foo'] # create an empty section
+        dirname = str(tmpdir.join('cache'))
+        cache.write_cache(dirname, {'x': 1}, log)
+        log2 = cache.read_cache(dirname, {'x': 1})
+        assert log2.section_names == ['gc-minor', 'foo']
+        assert len(log2.sections['foo']) == 0
+        assert log2.sections['gc-minor'][0].memory is None
+        assert cache.read_cache(dirname, {'x': 2}) is None
@@ -0,0 +1,100 @@
+import json
+from cStringIO import StringIO
+import numpy as np
+import pytest
+from pypytools.pypylog import diff
+from pypytools.pypylog import model
+from pypytools.pypylog.model import GcMinor, JitLoop
+
+def write_log(tmpdir, name, minor_duration, n=200):
+    # gc-minor every 0x100 ticks, with the given duration
+    lines = []
+    for i in range(n):
+        t = i * 0x100
+        lines.append('[%x] {gc-minor' % t)
+        lines.append('minor collect, total memory used: %d' % (1000 + i))
+        lines.append('[%x] gc-minor}' % (t + minor_duration + i % 3))
+    fname = tmpdir.join(name)
+    fname.write('\n'.join(lines) + '\n')
+    return str(fname)
+
+def test_log_metrics():
+    log = model.ColumnarPyPyLog()
+    log.add_event(GcMinor('a', 'gc-minor', 0, 0.5))
+    log.add_event(GcMinor('b', 'gc-minor', 1, 1.25))
+    log.add_event(JitLoop('c', 'jit-loop', 2, 3, number='0',
+                          tracing_time=0.5, backend_time=0.25))
+    metrics = diff.log_metrics(log)
+    assert list(metrics['gc-minor']) == [0.5, 0.25]
+    assert len(metrics['gc-major-cycle']) == 0
+    assert list(metrics['jit-compile']) == [0.75]
+    assert list(metrics['gc-overhead']) == [0.5, 0.25]
+
+def test_compare():
+    rnd = np.random.RandomState(42)
+    empty = np.zeros(0)
+    a = {'gc-minor': rnd.exponential(1, 500),
+         'gc-collect-step': rnd.exponential(1, 500),
+         'gc-major-cycle': empty,
+         'gc-overhead': rnd.uniform(0, 0.1, 100),
+         'jit-compile': rnd.exponential(1, 100)}
+    b = {'gc-minor': rnd.exponential(2, 500),     # regression
+         'gc-collect-step': rnd.exponential(0.5, 500), # improvement
+         'gc-major-cycle': empty,
+         'gc-overhead': rnd.uniform(0, 0.1, 100), # same
+         'jit-compile': rnd.exponential(1.05, 100)} # too small to matter
+    results = dict((r['metric'], r) for r in diff.compare(a, b))
+    assert results['gc-minor']['verdict'] == 'regression'
+    assert results['gc-minor']['change'] > 0.5
+    assert results['gc-collect-step']['verdict'] == 'improvement'
+    assert results['gc-major-cycle']['verdict'] == 'same'
+    assert results['gc-overhead']['verdict'] == 'same'
+    assert results['jit-compile']['verdict'] == 'same'
+
+def test_compare_from_zero():
+    a = {'gc-minor': np.zeros(100)}
+    b = {'gc-minor': np.ones(100)}
+    for name, descr in diff.METRICS:
+        a.setdefault(name, np.zeros(0))
+        b.setdefault(name, np.zeros(0))
+    results = dict((r['metric'], r) for r in diff.compare(a, b))
+    assert results['gc-minor']['change'] is None
+    assert results['gc-minor']['verdict'] == 'regression'
+    assert diff.relative_change(0, 0) == 0.0
+    assert diff.relative_change(2, 3) == 0.5
+    # the output is strict JSON
+    out = StringIO()
+    diff.write_json(list(results.values()), out)
+    assert 'Infinity' not in out.getvalue()
+    assert json.loads(out.getvalue())
+    out = StringIO()
+    diff.write_text(list(results.values()), out)
+    assert 'n/a' in out.getvalue()
+
+@pytest.mark.parametrize('parallel', [False, True])
+def test_load_both(tmpdir, parallel):
+    a = write_log(tmpdir, 'a', 0x10)
+    b = write_log(tmpdir, 'b', 0x20)
+    metrics_a, metrics_b = diff.load_both(a, b, use_cache=False,
+                                          window=0x1000, parallel=parallel)
+    assert len(metrics_a['gc-minor']) == 200
+    assert metrics_a['gc-minor'].max() == 0x12
+    assert metrics_b['gc-minor'].max() == 0x22
+
+def test_main(tmpdir, capsys):
+    a = write_log(tmpdir, 'a', 0x10)
+    b = write_log(tmpdir, 'b', 0x20)
+    argv = ['--tsc-freq=1', '--no-cache', '--window=4096']
+    assert diff.main([a, a] + argv) == 0
+    out, err = capsys.readouterr()
+    assert 'REGRESSION' not in out
+    #
+    assert diff.main([a, b] + argv) == 1
+    out, err = capsys.readouterr()
+    lines = [line for line in out.splitlines() if 'REGRESSION' in line]
+    assert [line.split()[0] for line in lines] == ['gc-minor', 'gc-overhead']
+    #
+    assert diff.main([b, a, '--format=json'] + argv) == 0
+    out, err = capsys.readouterr()
+    results = json.loads(out)
+    assert results[0]['verdict'] == 'improvement'
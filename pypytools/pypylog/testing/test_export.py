@@ -0,0 +1,174 @@
+import json
+import struct
+import textwrap
+from cStringIO import StringIO
+import pytest
+from pypytools.pypylog import export
+from pypytools.pypylog import cli
+from pypytools.pypylog.model import Event, GcMinor, JitLoop
+
+TEXT = textwrap.dedent("""
+[0] {gc-minor
+[1] {gc-minor-walkroots
+[2] gc-minor-walkroots}
+minor collect, total memory used: 1000
+[4] gc-minor}
+[5] {gc-collect-step
+starting gc state:  FINALIZING
+stopping, now in gc state:  SCANNING
+[7] gc-collect-step}
+""")
+
+@pytest.fixture
+def fname(tmpdir):
+    fname = tmpdir.join('log')
+    fname.write(TEXT)
+    return str(fname)
+
+def test_event_args():
+    assert export.event_args(Event('a', 'foo', 0, 1)) == {}
+    ev = GcMinor('a', 'gc-minor', 0, 1, memory=42)
+    assert export.event_args(ev) == {'memory': 42}
+
+
+class TestChromeTrace(object):
+
+    def test_export(self, fname):
+        f = StringIO()
+        export.export(fname, f, 'json', freq=1e6) # 1 tick == 1 us
+        trace = json.loads(f.getvalue())
+        events = [ev for ev in trace if ev['ph'] == 'X']
+        assert [(ev['name'], ev['ts'], ev['dur'], ev['tid'])
+                for ev in events] == [
+            ('gc-minor-walkroots', 1, 1, 1),
+            ('gc-minor', 0, 4, 1),
+            ('gc-collect-step', 5, 2, 1),
+            ('gc-major-cycle', 5, 2, 2),
+        ]
+        minor = events[1]
+        assert minor['cat'] == 'gc'
+        assert minor['args'] == {'memory': 1000}
+        assert 'args' not in events[0]
+        meta = [ev for ev in trace if ev['ph'] == 'M']
+        assert len(meta) == 4
+
+    def test_main(self, fname, tmpdir):
+        out = tmpdir.join('trace.json')
+        ret = cli.main(['export', fname, str(out), '--tsc-freq=1MHz'])
+        assert ret == 0
+        trace = json.loads(out.read())
+        assert len(trace) == 8
+
+
+def decode_varint(buf, pos):
+    n = shift = 0
+    while True:
+        b = ord(buf[pos])
+        pos += 1
+        n |= (b & 0x7f) << shift
+        shift += 7
+        if not b & 0x80:
+            return n, pos
+
+def decode(buf):
+    """
+    Decode a protobuf message into a list of (field, value)
+    """
+    res = []
+    pos = 0
+    while pos < len(buf):
+        tag, pos = decode_varint(buf, pos)
+        field, wire_type = tag >> 3, tag & 7
+        if wire_type == export.VARINT:
+            value, pos = decode_varint(buf, pos)
+        elif wire_type == export.FIXED64:
+            value, = struct.unpack('<d', buf[pos:pos+8])
+            pos += 8
+        elif wire_type == export.LENGTH_DELIMITED:
+            n, pos = decode_varint(buf, pos)
+            value = buf[pos:pos+n]
+            pos += n
+        else:
+            assert False
+        res.append((field, value))
+    return res
+
+
+class TestPerfetto(object):
+
+    def test_varint(self):
+        assert export.encode_varint(0) == '\x00'
+        assert export.encode_varint(1) == '\x01'
+        assert export.encode_varint(300) == '\xac\x02'
+        assert decode_varint(export.encode_varint(2**40 + 3), 0) == (
+            2**40 + 3, 6)
+        assert len(export.encode_varint(-1)) == 10
+
+    def test_annotation(self):
+        msg = export.encode_annotation('x', 1.5)
+        [(field, ann)] = decode(msg)
+        assert field == export.EVENT_DEBUG_ANNOTATIONS
+        assert decode(ann) == [(export.ANNOTATION_NAME, 'x'),
+                               (export.ANNOTATION_DOUBLE, 1.5)]
+
+    def test_export(self, fname):
+        f = StringIO()
+        export.export(fname, f, 'proto', freq=1e6)
+        packets = decode(f.getvalue())
+        assert set(field for field, _ in packets) == {export.TRACE_PACKET}
+        packets = [dict(decode(p)) for _, p in packets]
+        for p in packets:
+            assert p[export.PACKET_SEQUENCE_ID] == export.SEQUENCE_ID
+        descriptors = [dict(decode(p[export.PACKET_TRACK_DESCRIPTOR]))
+                       for p in packets[:3]]
+        assert descriptors[0] == {export.TRACK_UUID: 1,
+                                  export.TRACK_NAME: 'sections'}
+        #
+        events = [(p[export.PACKET_TIMESTAMP],
+                   decode(p[export.PACKET_TRACK_EVENT]))
+                  for p in packets[3:]]
+        assert len(events) == 8
+        ts, begin = events[2]
+        assert ts == 0
+        assert begin[:4] == [
+            (export.EVENT_TYPE, export.TYPE_SLICE_BEGIN),
+            (export.EVENT_TRACK_UUID, 1),
+            (export.EVENT_NAME, 'gc-minor'),
+            (export.EVENT_CATEGORIES, 'gc'),
+        ]
+        ann = decode(begin[4][1])
+        assert ann == [(export.ANNOTATION_NAME, 'memory'),
+                       (export.ANNOTATION_INT, 1000)]
+        ts, end = events[3]
+        assert ts == 4000 # ns
+        assert end == [(export.EVENT_TYPE, export.TYPE_SLICE_END),
+                       (export.EVENT_TRACK_UUID, 1)]
+
+    def test_overlapping_derived_sections(self):
+        # a major cycle which overlaps a loop without nesting: they must be
+        # on different tracks, else the SLICE_ENDs close the wrong slices
+        f = StringIO()
+        writer = export.PerfettoWriter(f, scale=1)
+        writer.add_event(Event('a', 'gc-major-cycle', 10, 30))
+        writer.add_event(JitLoop('b', 'jit-loop', 20, 40, number='0'))
+        packets = [dict(decode(p)) for _, p in decode(f.getvalue())]
+        events = []
+        for p in packets:
+            if export.PACKET_TRACK_EVENT in p:
+                ev = dict(decode(p[export.PACKET_TRACK_EVENT]))
+                events.append((p[export.PACKET_TIMESTAMP],
+                               ev[export.EVENT_TYPE] == export.TYPE_SLICE_END,
+                               ev[export.EVENT_TRACK_UUID],
+                               ev.get(export.EVENT_NAME)))
+        # replay the slices as trace processor does, with a stack per track
+        stacks = {}
+        slices = []
+        for ts, is_end, track, name in sorted(events):
+            stack = stacks.setdefault(track, [])
+            if is_end:
+                name, start = stack.pop()
+                slices.append((name, start, ts))
+            else:
+                stack.append((name, ts))
+        assert sorted(slices) == [('gc-major-cycle', 10, 30),
+                                  ('jit-loop', 20, 40)]
@@ -0,0 +1,69 @@
+import numpy as np
+from pypytools.pypylog import lod
+
+def test_minmax_per_bucket():
+    Y = np.array([5, 1, 7, 3, 2, 9, 4], dtype=float)
+    indices = np.arange(7)
+    keys = np.array([0, 0, 0, 1, 1, 1, 2])
+    res = lod.minmax_per_bucket(keys, Y, indices)
+    assert sorted(res) == [1, 2, 4, 5, 6]
+
+
+class TestMinMaxPyramid(object):
+
+    def test_levels(self):
+        Y = [5, 1, 7, 3, 2]
+        p = lod.MinMaxPyramid(range(5), Y)
+        mins, maxs = p.levels[1]
+        assert list(mins) == [1, 3, 4]
+        assert list(maxs) == [0, 2, 4]
+        mins, maxs = p.levels[2]
+        assert list(mins) == [1, 4]
+        assert list(maxs) == [2, 4]
+        assert len(p.levels) == 4
+        assert list(p.levels[3][0]) == [1]
+        assert list(p.levels[3][1]) == [2]
+
+    def test_query_few_points(self):
+        p = lod.MinMaxPyramid([0, 1, 2, 3, 4], [5, 1, 7, 3, 2])
+        assert list(p.query(0, 4, 100)) == [0, 1, 2, 3, 4]
+        assert list(p.query(1, 3, 100)) == [1, 2, 3]
+        assert list(p.query(10, 20, 100)) == []
+
+    def test_query_decimate(self):
+        n = 100000
+        rnd = np.random.RandomState(42)
+        X = np.arange(n, dtype=float)
+        Y = rnd.uniform(0, 1, n)
+        Y[12345] = 10   # global max
+        Y[54321] = -10  # global min
+        p = lod.MinMaxPyramid(X, Y)
+        idx = p.query(0, n, 500)
+        assert len(idx) <= 2 * 500 + 2
+        assert 12345 in idx
+        assert 54321 in idx
+        assert (np.diff(idx) > 0).all()
+        #
+        # zoom in: we get all the points
+        idx = p.query(1000, 1500, 500)
+        assert list(idx) == range(1000, 1501)
+        #
+        # zoom in a bit less
+        idx = p.query(10000, 20000, 100)
+        assert 12345 in idx
+        assert 54321 not in idx
+        assert len(idx) <= 2 * 100 + 2
+        assert X[idx].min() >= 10000
+        assert X[idx].max() <= 20000
+
+    def test_unsorted(self):
+        X = [3, 1, 2, 0]
+        Y = [30, 10, 20, 0]
+        p = lod.MinMaxPyramid(X, Y)
+        idx = p.query(1, 3, 100)
+        # indices refer to the original arrays
+        assert list(idx) == [0, 1, 2]
+
+    def test_empty(self):
+        p = lod.MinMaxPyramid([], [])
+        assert list(p.query(0, 1, 100)) == []
@@ -1,4 +1,7 @@
+import pytest
+import numpy as np
 from pypytools.pypylog import model
+from pypytools.pypylog.model import Event, GcMinor, GcCollectStep
 
 class TestEvent(object):
 
@@ -28,6 +31,148 @@ class TestSeries(object):
         s[1] = (2, 2)
         assert s[1] == (2, 2)
 
+    def test_from_points_empty(self):
+        s = model.Series.from_points([])
+        assert len(s) == 0
+
+    def test_dtype(self):
+        # with float32, we lose precision on big timestamps
+        points = [(123456789.25, 1)]
+        s = model.Series.from_points(points)
+        assert s.X.dtype == np.float32
+        assert s[0] != points[0]
+        s = model.Series.from_points(points, dtype='d')
+        assert s.X.dtype == np.float64
+        assert s[0] == points[0]
+
+    def test_from_events(self):
+        events = [Event('a', 'foo', 5, 15), Event('b', 'foo', 20, 21)]
+        s = model.Series.from_events(events)
+        assert list(s) == [(5, 10), (20, 1)]
+
+    def test_from_events_columns(self):
+        log = model.ColumnarPyPyLog()
+        log.add_event(Event('a', 'foo', 5, 15))
+        log.add_event(Event('b', 'foo', 20, 21))
+        s = model.Series.from_events(log.sections['foo'])
+        assert list(s) == [(5, 10), (20, 1)]
+
+
+class TestGrowableArray(object):
+
+    def test_append(self):
+        class MyArray(model.GrowableArray):
+            CHUNK_SIZE = 2
+        a = MyArray(np.int32)
+        assert len(a) == 0
+        for i in range(5):
+            a.append(i)
+        assert len(a) == 5
+        assert list(a.data) == [0, 1, 2, 3, 4]
+        assert len(a._buf) == 8
+
+    def test_data_is_a_view(self):
+        a = model.GrowableArray(np.float64)
+        a.append(1)
+        a.data[0] = 42
+        assert a.data[0] == 42
+
+    def test_existing_data(self):
+        a = model.GrowableArray(np.float64, np.array([1.0, 2.0]))
+        a.append(3)
+        assert list(a.data) == [1, 2, 3]
+
+
+class TestColumn(object):
+
+    def test_int(self):
+        col = model.Column()
+        col.append(None)
+        col.append(42)
+        col.append(None)
+        assert col.kind == 'int'
+        assert len(col) == 3
+        assert col[0] is None
+        assert col[1] == 42
+        assert type(col[1]) is int
+        assert col[2] is None
+        assert col.data.dtype == np.float64
+
+    def test_str(self):
+        col = model.Column()
+        for x in ['SCANNING', 'MARKING', None, 'SCANNING']:
+            col.append(x)
+        assert col.kind == 'str'
+        assert col.categories == ['SCANNING', 'MARKING']
+        assert list(col.data) == [0, 1, -1, 0]
+        assert [col[i] for i in range(4)] == ['SCANNING', 'MARKING', None,
+                                              'SCANNING']
+
+    def test_all_none(self):
+        col = model.Column()
+        col.append(None)
+        col.append(None)
+        assert col.kind is None
+        assert col[1] is None
+        assert len(col.data) == 2
+
+
+class TestColumnarPyPyLog(object):
+
+    def make_log(self):
+        log = model.ColumnarPyPyLog()
+        log.add_event(GcMinor('a0', 'gc-minor', 0, 10, memory=100))
+        log.add_event(GcCollectStep('b0', 'gc-collect-step', 5, 20,
+                                    phase='SCANNING'))
+        log.add_event(GcMinor('a1', 'gc-minor', 30, 35, memory=None))
+        log.add_event(Event('c0', 'jit-tracing', 40, 50))
+        return log
+
+    def test_sections(self):
+        log = self.make_log()
+        assert sorted(log.sections) == ['gc-collect-step', 'gc-minor',
+                                        'jit-tracing']
+        minors = log.sections['gc-minor']
+        assert len(minors) == 2
+        assert list(minors.tsid) == ['a0', 'a1']
+        assert list(minors.start) == [0, 30]
+        assert list(minors.end) == [10, 35]
+        assert list(minors.duration) == [10, 5]
+        assert minors.column('memory')[0] == 100
+        assert np.isnan(minors.column('memory')[1])
+        assert np.isnan(minors.column('phase')).all()
+
+    def test_rows(self):
+        log = self.make_log()
+        minors = log.sections['gc-minor']
+        assert minors[0] == GcMinor('a0', 'gc-minor', 0, 10, memory=100)
+        assert minors[-1] == GcMinor('a1', 'gc-minor', 30, 35, memory=None)
+        assert minors == [
+            GcMinor('a0', 'gc-minor', 0, 10, memory=100),
+            GcMinor('a1', 'gc-minor', 30, 35, memory=None),
+        ]
+        assert log.sections['gc-collect-step'][0].phase == 'SCANNING'
+
+    def test_missing_section(self):
+        log = self.make_log()
+        assert len(log.sections['foo']) == 0
+        assert list(log.sections['foo']) == []
+
+    def test_all_events(self):
+        log = self.make_log()
+        assert list(log.section_id.data) == [0, 1, 0, 2]
+        assert log.all_events() == [
+            GcMinor('a0', 'gc-minor', 0, 10, memory=100),
+            GcCollectStep('b0', 'gc-collect-step', 5, 20, phase='SCANNING'),
+            GcMinor('a1', 'gc-minor', 30, 35, memory=None),
+            Event('c0', 'jit-tracing', 40, 50),
+        ]
+
+    def test_mixed_event_classes(self):
+        log = model.ColumnarPyPyLog()
+        log.add_event(Event('a', 'foo', 0, 1))
+        pytest.raises(TypeError, "log.add_event(GcMinor('b', 'foo', 0, 1))")
+
 
 def test_make_step_chart():
     events = [
@@ -55,3 +200,134 @@ def test_make_step_chart():
         (135, 5),
         (135, 0),
     ]
+
+def test_make_step_chart_columns():
+    events = [
+        model.Event('123abc', 'gc', 100000000.5, 100000000.75),
+        model.Event('123abc', 'gc', 100000001.5, 100000002.0),
+    ]
+    log = model.ColumnarPyPyLog()
+    for ev in events:
+        log.add_event(ev)
+    s1 = model.make_step_chart(events, dtype='d')
+    s2 = model.make_step_chart(log.sections['gc'], dtype='d')
+    assert s1.X.dtype == np.float64
+    assert list(s1) == list(s2)
+    assert list(s1)[:6] == [
+        (100000000.5, 0),
+        (100000000.5, 0.25),
+        (100000000.5, 0.25),
+        (100000000.75, 0.25),
+        (100000000.75, 0.25),
+        (100000000.75, 0),
+    ]
+
+def test_make_step_chart_empty():
+    s = model.make_step_chart([])
+    assert len(s) == 0
+
+def test_print_summary(capsys):
+    log = model.GroupedPyPyLog()
+    log.add_event(model.Event('a', 'foo', 0, 1))
+    log.add_event(model.Event('b', 'foo', 2, 5))
+    log.add_event(model.Event('c', 'bar', 2, 3))
+    log.print_summary()
+    out, err = capsys.readouterr()
+    lines = out.splitlines()
+    assert lines[0].split() == ['section', 'n', 'total']
+    assert lines[2].split() == ['bar', '1', '1.0000']
+    assert lines[3].split() == ['foo', '2', '4.0000']
+
+
+class TestQuery(object):
+
+    def make_log(self, cls):
+        log = cls()
+        log.add_event(GcMinor('a', 'gc-minor', 0, 1, memory=10))
+        log.add_event(GcMinor('b', 'gc-minor', 2, 3, memory=20))
+        log.add_event(GcMinor('c', 'gc-minor', 4, 9, memory=30))
+        log.add_event(GcMinor('d', 'gc-minor', 6, 6.5, memory=40))
+        log.add_event(GcMinor('e', 'gc-minor', 10, 11, memory=50))
+        log.add_event(Event('f', 'jit-tracing', 5, 7))
+        return log
+
+    def tsids(self, events):
+        return [ev.tsid for ev in events]
+
+    @pytest.mark.parametrize('cls', [model.GroupedPyPyLog,
+                                     model.ColumnarPyPyLog])
+    def test_query(self, cls):
+        log = self.make_log(cls)
+        res = log.query()
+        assert sorted(res) == ['gc-minor', 'jit-tracing']
+        assert self.tsids(res['gc-minor']) == ['a', 'b', 'c', 'd', 'e']
+        #
+        res = log.query(sections=['gc-minor', 'foo'], start=2.5, end=6)
+        assert sorted(res) == ['gc-minor']
+        assert self.tsids(res['gc-minor']) == ['b', 'c', 'd']
+        #
+        # c starts before 7 and ends after it
+        res = log.query(start=7, end=9.5)
+        assert self.tsids(res['gc-minor']) == ['c']
+        assert self.tsids(res['jit-tracing']) == ['f']
+        #
+        res = log.query(start=1.5, min_duration=1)
+        assert self.tsids(res['gc-minor']) == ['b', 'c', 'e']
+        assert self.tsids(res['jit-tracing']) == ['f']
+        #
+        res = log.query(end=-1)
+        assert self.tsids(res['gc-minor']) == []
+
+    def test_query_columns(self):
+        log = self.make_log(model.ColumnarPyPyLog)
+        res = log.query(sections=['gc-minor'], start=3.5, end=7)
+        minors = res['gc-minor']
+        assert isinstance(minors, model.EventColumns)
+        assert list(minors.column('memory')) == [30, 40]
+        assert minors[0] == GcMinor('c', 'gc-minor', 4, 9, memory=30)
+        # it's a view
+        assert minors.start.base is not None
+        #
+        # the index is updated when we add events
+        log.add_event(GcMinor('g', 'gc-minor', 12, 13, memory=60))
+        res = log.query(start=11.5)
+        assert self.tsids(res['gc-minor']) == ['g']
+
+
+class TestSectionIndex(object):
+
+    def test_lookup_slice(self):
+        index = model.SectionIndex([0, 2, 4, 6], [1, 3, 5, 7])
+        assert index.lookup() == slice(0, 4)
+        assert index.lookup(2, 4) == slice(1, 3)
+        assert index.lookup(2.5, 4) == slice(1, 3)
+        assert index.lookup(3.5, 3.8) == slice(2, 2)
+
+    def test_lookup_long_event(self):
+        # the event 0 is long, so it overlaps with [5, 6] but the event 1
+        # doesn't
+        index = model.SectionIndex([0, 1, 5], [10, 2, 6])
+        assert list(index.lookup(5, 6)) == [0, 2]
+        assert index.max_duration == 10
+
+    def test_unsorted(self):
+        # nested sections are closed, and thus added, in reverse order
+        index = model.SectionIndex([5, 0, 20], [6, 10, 21])
+        assert list(index.lookup(4, 7)) == [1, 0]
+        assert list(index.lookup(min_duration=2)) == [1]
+
+    def test_empty(self):
+        index = model.SectionIndex([], [])
+        assert index.lookup(0, 1) == slice(0, 0)
+
+
+def test_print_summary_range(capsys):
+    log = model.ColumnarPyPyLog()
+    log.add_event(model.Event('a', 'foo', 0, 1))
+    log.add_event(model.Event('b', 'foo', 2, 5))
+    log.add_event(model.Event('c', 'bar', 2, 3))
+    log.print_summary(start=1.5)
+    out, err = capsys.readouterr()
+    lines = out.splitlines()
+    assert lines[2].split() == ['bar', '1', '1.0000']
+    assert lines[3].split() == ['foo', '1', '3.0000']
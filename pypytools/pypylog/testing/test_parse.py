@@ -72,6 +72,78 @@ class TestFlatParser(object):
             Event('ff500', 'bar', 0x500, 0x600)
         ]
 
+    def test_stop_without_start(self):
+        log = """
+        [ff000] foo}
+        """
+        pytest.raises(parse.ParseError, "self.parse(log)")
+
+    def test_iter_events(self):
+        text = textwrap.dedent("""
+        [ff000] {foo
+        [ff200] {bar
+        [ff300] bar}
+        [ff400] foo}
+        """)
+        events = parse.iter_flat(StringIO(text))
+        assert next(events) == Event('ff200', 'bar', 0x200, 0x300)
+        assert next(events) == Event('ff000', 'foo', 0x000, 0x400)
+        pytest.raises(StopIteration, "next(events)")
+
+
+class TestFlatParserMmap(TestFlatParser):
+
+    @pytest.fixture(autouse=True)
+    def setup_tmpdir(self, tmpdir):
+        self.tmpdir = tmpdir
+
+    def parse(self, text, log=None):
+        fname = self.tmpdir.join('log')
+        fname.write(textwrap.dedent(text))
+        return parse.flat(str(fname), log)
+
+    def test_payload(self):
+        log = self.parse("""
+        [ff000] {foo
+        [p0, p1]
+        [ff] not a marker
+        [ff123] foo}
+        [ff456] {bar
+        [ff789] bar}""")
+        assert log.all_events() == [
+            Event('ff000', 'foo', 0x000, 0x123),
+            Event('ff456', 'bar', 0x456, 0x789)
+        ]
+
+    def test_empty_file(self):
+        log = self.parse("")
+        assert log.all_events() == []
+
+    def test_colored(self):
+        text = ("\x1b[1m\x1b[32m[ff000] {foo\x1b[0m\n"
+                "\x1b[1m\x1b[32m[ff123] foo}\x1b[0m\n")
+        log = self.parse(text)
+        assert log.all_events() == [
+            Event('ff000', 'foo', 0x000, 0x123),
+        ]
+
+    def test_colored_after_long_preamble(self):
+        preamble = 'some output of the program\n' * 1000
+        text = (preamble +
+                "\x1b[1m\x1b[32m[ff000] {foo\x1b[0m\n"
+                "\x1b[1m\x1b[32m[ff123] foo}\x1b[0m\n")
+        assert len(preamble) > 4096
+        assert parse.is_colored(text)
+        log = self.parse(text)
+        assert log.all_events() == [
+            Event('ff000', 'foo', 0x000, 0x123),
+        ]
+
+    def test_is_colored(self):
+        assert not parse.is_colored('')
+        assert not parse.is_colored('[ff000] {foo\n\x1b[1m[ff123] foo}\n')
+        assert parse.is_colored('[not a marker\n\x1b[1m[ff000] {foo\n')
+
 
 class TestGcParser(object):
     
@@ -97,6 +169,26 @@ class TestGcParser(object):
         """
         log = self.parse(text, model.GroupedPyPyLog())
         assert log.sections['gc-minor'] == [
+            GcMinor('ff000', 'gc-minor', 0x000, 0x100, memory=1000,
+                    pinned_objects=0),
+            GcMinor('ff200', 'gc-minor', 0x200, 0x300, memory=2000,
+                    pinned_objects=0),
+        ]
+
+    def test_columnar(self):
+        text = """
+        [ff000] {gc-minor
+        minor collect, total memory used: 1000
+        [ff100] gc-minor}
+        [ff200] {gc-minor
+        minor collect, total memory used: 2000
+        [ff300] gc-minor}
+        """
+        log = self.parse(text, model.ColumnarPyPyLog())
+        minors = log.sections['gc-minor']
+        assert list(minors.start) == [0x000, 0x200]
+        assert list(minors.column('memory')) == [1000, 2000]
+        assert minors == [
             GcMinor('ff000', 'gc-minor', 0x000, 0x100, memory=1000),
             GcMinor('ff200', 'gc-minor', 0x200, 0x300, memory=2000),
         ]
@@ -111,9 +203,513 @@ class TestGcParser(object):
         log = self.parse(text)
         assert log.all_events() == [
             GcCollectStep('ff000', 'gc-collect-step', 0x000, 0x100,
-                          phase='SCANNING')
+                          phase='SCANNING', end_phase='MARKING')
+            ]
+
+    def test_gc_minor_payload(self):
+        text = """
+        [ff000] {gc-minor
+        minor collect, total memory used: 1000
+        number of pinned objects: 3
+        total size of surviving objects: 456
+        [ff100] gc-minor}
+        """
+        log = self.parse(text)
+        assert log.all_events() == [
+            GcMinor('ff000', 'gc-minor', 0x000, 0x100, memory=1000,
+                    pinned_objects=3, surviving_size=456)
             ]
 
+    def test_gc_collect_done(self):
+        text = """
+        [ff000] {gc-collect-done
+        arenas:                12 => 7
+        bytes used in arenas:  123456
+        bytes raw-malloced:    2000 => 1500
+        next major collection threshold: 999999
+        [ff100] gc-collect-done}
+        [ff200] {gc-hardware
+        L2cache = 262144
+        [ff300] gc-hardware}
+        """
+        log = self.parse(text)
+        assert log.all_events() == [
+            model.GcCollectDone('ff000', 'gc-collect-done', 0x000, 0x100,
+                                arenas_before=12, arenas_after=7,
+                                arenas_bytes=123456, rawmalloced_before=2000,
+                                rawmalloced_after=1500,
+                                next_threshold=999999),
+            model.GcHardware('ff200', 'gc-hardware', 0x200, 0x300,
+                             l2cache=262144),
+            ]
+
+    def test_major_cycle(self):
+        text = """
+        [ff000] {gc-minor
+        minor collect, total memory used: 1000
+        [ff010] gc-minor}
+        [ff100] {gc-collect-step
+        starting gc state:  SCANNING
+        [ff101] {gc-minor
+        minor collect, total memory used: 1100
+        [ff102] gc-minor}
+        stopping, now in gc state:  MARKING
+        [ff110] gc-collect-step}
+        [ff200] {gc-collect-step
+        starting gc state:  MARKING
+        stopping, now in gc state:  SWEEPING
+        [ff220] gc-collect-step}
+        [ff300] {gc-collect-step
+        starting gc state:  SWEEPING
+        stopping, now in gc state:  FINALIZING
+        [ff330] gc-collect-step}
+        [ff400] {gc-collect-step
+        starting gc state:  FINALIZING
+        stopping, now in gc state:  SCANNING
+        [ff440] gc-collect-step}
+        [ff500] {gc-minor
+        minor collect, total memory used: 500
+        [ff510] gc-minor}
+        """
+        log = self.parse(text)
+        events = log.all_events()
+        cycle = events[-2]
+        assert cycle == model.MajorCycle(
+            'ff100', 'gc-major-cycle', 0x100, 0x440,
+            n_steps=4, step_time=0x10+0x20+0x30+0x40,
+            scanning_time=0x10, marking_time=0x20, sweeping_time=0x30,
+            finalizing_time=0x40, mem_before=1000, mem_after=500)
+        # the cycle is emitted when we know mem_after
+        assert events[-1].section == 'gc-minor'
+        assert [ev.section for ev in events].count('gc-major-cycle') == 1
+
+    def test_major_cycle_no_end_phase(self):
+        # without the "stopping" lines, the end of a cycle is detected when
+        # a new one starts, and the last one is discarded because we don't
+        # know whether it is complete
+        text = """
+        [ff100] {gc-collect-step
+        starting gc state:  SCANNING
+        [ff110] gc-collect-step}
+        [ff200] {gc-collect-step
+        starting gc state:  MARKING
+        [ff220] gc-collect-step}
+        [ff300] {gc-collect-step
+        starting gc state:  SCANNING
+        [ff301] {gc-minor
+        minor collect, total memory used: 700
+        [ff302] gc-minor}
+        [ff310] gc-collect-step}
+        [ff400] {gc-collect-step
+        starting gc state:  MARKING
+        [ff420] gc-collect-step}
+        """
+        log = self.parse(text)
+        cycles = [ev for ev in log.all_events()
+                  if ev.section == 'gc-major-cycle']
+        assert cycles == [
+            model.MajorCycle('ff100', 'gc-major-cycle', 0x000, 0x120,
+                             n_steps=2, step_time=0x30, scanning_time=0x10,
+                             marking_time=0x20, mem_after=700)
+        ]
+
+    def test_iter_events(self, tmpdir):
+        text = textwrap.dedent("""
+        [ff000] {gc-minor
+        minor collect, total memory used: 1000
+        [ff100] gc-minor}
+        [ff200] {gc-collect-step
+        starting gc state:  SCANNING
+        [ff300] gc-collect-step}
+        """)
+        fname = tmpdir.join('log')
+        fname.write(text)
+        events = list(parse.iter_events(str(fname)))
+        assert events == [
+            GcMinor('ff000', 'gc-minor', 0x000, 0x100, memory=1000),
+            GcCollectStep('ff200', 'gc-collect-step', 0x200, 0x300,
+                          phase='SCANNING'),
+        ]
+
+    def test_old_handlers(self):
+        # the subclasses which override or call on_gc_minor and
+        # on_gc_collect_step still work
+        class MyParser(parse.GcParser):
+            def on_gc_minor(self, s):
+                ev = parse.GcParser.on_gc_minor(self, s)
+                ev.memory *= 2
+                return ev
+        text = textwrap.dedent("""
+        [ff000] {gc-minor
+        minor collect, total memory used: 1000
+        [ff100] gc-minor}
+        [ff200] {gc-collect-step
+        starting gc state:  SCANNING
+        [ff300] gc-collect-step}
+        """)
+        events = list(MyParser.iter_file(StringIO(text)))
+        assert events[:2] == [
+            GcMinor('ff000', 'gc-minor', 0x000, 0x100, memory=2000),
+            GcCollectStep('ff200', 'gc-collect-step', 0x200, 0x300,
+                          phase='SCANNING'),
+        ]
+        p = MyParser(None)
+        assert p._scan_for_regex(p.RE_STEP, ['foo\n',
+                                             'starting gc state: X\n']) == 'X'
+
+    def test_collect_only_needed_lines(self):
+        sections = []
+        class MyParser(parse.GcParser):
+            def section(self, s):
+                sections.append(s)
+                return parse.GcParser.section(self, s)
+
+        text = textwrap.dedent("""
+        [ff000] {jit-log-opt-loop
+        # Loop 0 : loop with 1 ops
+        i1 = int_add(i0, 1)
+        [ff100] jit-log-opt-loop}
+        [ff200] {gc-minor
+        minor collect, total memory used: 1000
+        [ff300] gc-minor}
+        """)
+        list(MyParser.iter_file(StringIO(text)))
+        opt, minor = sections
+        assert opt.lines is None
+        assert minor.lines == ['minor collect, total memory used: 1000\n']
+
+class TestGcParserMmap(TestGcParser):
+
+    @pytest.fixture(autouse=True)
+    def setup_tmpdir(self, tmpdir):
+        self.tmpdir = tmpdir
+
+    def parse(self, text, log=None):
+        fname = self.tmpdir.join('log')
+        fname.write(textwrap.dedent(text))
+        return parse.gc(str(fname), log)
+
+
+class TestJitParser(object):
+
+    TEXT = """
+    [1000] {jit-tracing
+    [1010] {jit-optimize
+    [1040] jit-optimize}
+    [1040] {jit-backend
+    [1041] {jit-backend-addr
+    Loop 0 (f;loop at line 3) has address 0x7f0000001000 to 0x7f0000001400 (bootstrap 0x7f0000000ff0)
+    [1042] jit-backend-addr}
+    [1060] jit-backend}
+    [1060] {jit-log-opt-loop
+    # Loop 0 (f;loop at line 3) : loop with 3 ops
+    [p0, i1]
+    i2 = int_add(i1, 1)
+    jump(p0, i2)
+    [1070] jit-log-opt-loop}
+    [1080] jit-tracing}
+    [2000] {jit-tracing
+    [2001] {jit-abort
+    [2002] jit-abort}
+    [2010] jit-tracing}
+    [3000] {jit-tracing
+    [3010] {jit-optimize
+    [3020] jit-optimize}
+    [3020] {jit-backend
+    [3021] {jit-backend-addr
+    bridge out of Guard 0x7f0000001234 has address 0x7f0000002000 to 0x7f0000002100
+    [3022] jit-backend-addr}
+    [3030] jit-backend}
+    [3030] {jit-log-opt-bridge
+    # bridge out of Guard 0x7f0000001234 with 12 ops
+    [3031] jit-log-opt-bridge}
+    [3040] jit-tracing}
+    [4000] {jit-backend
+    [4001] {jit-backend-addr
+    Loop 1 (<f>) has address 0x7f0000003000 to 0x7f0000003050 (bootstrap 0x7f0000003000)
+    [4002] jit-backend-addr}
+    [4010] jit-backend}
+    """
+
+    def parse(self, text):
+        return parse.JitParser.iter_file(StringIO(textwrap.dedent(text)))
+
+    def test_loops(self):
+        loops = [ev for ev in self.parse(self.TEXT)
+                 if ev.section == 'jit-loop']
+        assert loops == [
+            model.JitLoop('1000', 'jit-loop', 0x0, 0x80, kind='loop',
+                          number='0', n_ops=3, tracing_time=0x30,
+                          optimize_time=0x30, backend_time=0x20,
+                          asm_size=0x400),
+            model.JitLoop('3000', 'jit-loop', 0x2000, 0x2040, kind='bridge',
+                          number='0x7f0000001234', n_ops=12,
+                          tracing_time=0x20, optimize_time=0x10,
+                          backend_time=0x10, asm_size=0x100),
+            # compiled outside jit-tracing
+            model.JitLoop('4000', 'jit-loop', 0x3000, 0x3010, number='1',
+                          backend_time=0x10, asm_size=0x50),
+        ]
+        assert loops[0].compile_time == 0x80
+
+    def test_compilations_outside_tracing(self):
+        # two independent compilations between two jit-tracing: each of them
+        # is a loop of its own
+        text = """
+        [1000] {jit-optimize
+        [1001] {jit-log-opt-loop
+        # Loop 0 : loop with 3 ops
+        [1002] jit-log-opt-loop}
+        [1010] jit-optimize}
+        [1010] {jit-backend
+        [1011] {jit-backend-addr
+        Loop 0 (<f>) has address 0x7f0000001000 to 0x7f0000001100 (bootstrap 0x7f0000001000)
+        [1012] jit-backend-addr}
+        [1020] jit-backend}
+        [1100] {jit-backend
+        [1101] {jit-backend-addr
+        Loop 1 (<g>) has address 0x7f0000002000 to 0x7f0000002040 (bootstrap 0x7f0000002000)
+        [1102] jit-backend-addr}
+        [1130] jit-backend}
+        [1130] {jit-log-opt-loop
+        # Loop 1 : entry bridge with 5 ops
+        [1131] jit-log-opt-loop}
+        [2000] {jit-tracing
+        [2001] {jit-abort
+        [2002] jit-abort}
+        [2010] jit-tracing}
+        """
+        loops = [ev for ev in self.parse(text) if ev.section == 'jit-loop']
+        assert loops == [
+            model.JitLoop('1000', 'jit-loop', 0x0, 0x20, kind='loop',
+                          number='0', n_ops=3, optimize_time=0x10,
+                          backend_time=0x10, asm_size=0x100),
+            model.JitLoop('1100', 'jit-loop', 0x100, 0x131,
+                          kind='entry bridge', number='1', n_ops=5,
+                          backend_time=0x30, asm_size=0x40),
+        ]
+
+    def test_sections(self):
+        events = list(self.parse(self.TEXT))
+        opt = [ev for ev in events if ev.section == 'jit-log-opt-loop']
+        assert opt == [model.JitLogOpt('1060', 'jit-log-opt-loop', 0x60, 0x70,
+                                       kind='loop', number='0', n_ops=3)]
+        # the loop is emitted after its jit-tracing
+        names = [ev.section for ev in events]
+        i = names.index('jit-loop')
+        assert names[i-1] == 'jit-tracing'
+
+    def test_columnar(self):
+        log = model.ColumnarPyPyLog()
+        for ev in self.parse(self.TEXT):
+            log.add_event(ev)
+        loops = log.sections['jit-loop']
+        assert list(loops.column('n_ops')[:2]) == [3, 12]
+        assert list(loops.column('asm_size')) == [0x400, 0x100, 0x50]
+
+
+class TestParallel(object):
+
+    TEXT = textwrap.dedent("""
+    [ff000] {gc-minor
+    [ff001] {gc-minor-walkroots
+    [ff002] gc-minor-walkroots}
+    minor collect, total memory used: 1000
+    number of pinned objects: 0
+    [ff100] gc-minor}
+    [ff200] {gc-collect-step
+    starting gc state:  SCANNING
+    [ff201] {gc-minor
+    [ff202] {gc-minor-walkroots
+    [ff203] gc-minor-walkroots}
+    minor collect, total memory used: 2000
+    [ff204] gc-minor}
+    stopping, now in gc state:  MARKING
+    [ff300] gc-collect-step}
+    [ff400] {jit-tracing
+    [ff401] {jit-optimize
+    [ff402] {jit-log-opt-loop
+    # Loop 0 : loop with 1 ops
+    [p0, p1]
+    i1 = int_add(i0, 1)
+    [ff403] jit-log-opt-loop}
+    [ff404] jit-optimize}
+    [ff405] jit-tracing}
+    [ff500] {gc-collect-step
+    starting gc state:  MARKING
+    [ff600] gc-collect-step}
+    [ff700] {gc-collect-step
+    starting gc state:  FINALIZING
+    stopping, now in gc state:  SCANNING
+    [ff800] gc-collect-step}
+    [ff900] {gc-minor
+    minor collect, total memory used: 3000
+    [ffa00] gc-minor}
+    """)
+
+    @pytest.fixture
+    def fname(self, tmpdir):
+        fname = tmpdir.join('log')
+        fname.write(self.TEXT)
+        return str(fname)
+
+    def test_split_buffer(self):
+        buf = 'aaa\nbbb\nccc\n'
+        assert parse.split_buffer(buf, 1) == [(0, 12)]
+        assert parse.split_buffer(buf, 2) == [(0, 8), (8, 12)]
+        assert parse.split_buffer(buf, 3) == [(0, 8), (8, 12)]
+        assert parse.split_buffer(buf, 12) == [(0, 4), (4, 8), (8, 12)]
+        # all the chunks start at the beginning of a line
+        for n in range(1, 20):
+            chunks = parse.split_buffer(self.TEXT, n)
+            assert chunks[0][0] == 0
+            assert chunks[-1][1] == len(self.TEXT)
+            for start, end in chunks:
+                assert self.TEXT[start-1:start] in ('', '\n')
+
+    def test_same_as_serial(self, fname):
+        expected = parse.gc(fname, freq=4.0).all_events()
+        assert len(expected) == 12
+        assert expected[-2].section == 'gc-major-cycle'
+        for workers in range(1, 8):
+            log = parse.parallel(fname, freq=4.0, workers=workers)
+            assert log.all_events() == expected
+
+    def test_merge_chunks(self, fname):
+        # check all the possible ways to split the file in two chunks,
+        # without using multiprocessing
+        buf = self.TEXT
+        expected = parse.gc(fname).all_events()
+        eols = [i+1 for i, ch in enumerate(buf) if ch == '\n']
+        for mid in eols:
+            chunks = [(0, mid), (mid, len(buf))]
+            zero_ts = parse.GcParser(None).find_zero_ts(buf)
+            results = [parse.GcParser(None).parse_chunk(fname, zero_ts,
+                                                         start, end)
+                       for (start, end) in chunks]
+            p = parse.GcParser(None)
+            assert list(p.postprocess(p.merge_chunks(results))) == expected
+            assert p.stack == []
+
+    def test_GroupedPyPyLog(self, fname):
+        log = parse.parallel(fname, model.GroupedPyPyLog(), workers=3)
+        assert log.sections['gc-minor'] == [
+            GcMinor('ff000', 'gc-minor', 0x000, 0x100, memory=1000,
+                    pinned_objects=0),
+            GcMinor('ff201', 'gc-minor', 0x201, 0x204, memory=2000),
+            GcMinor('ff900', 'gc-minor', 0x900, 0xa00, memory=3000),
+        ]
+        cycle, = log.sections['gc-major-cycle']
+        assert cycle.n_steps == 3
+        assert cycle.mem_before == 1000
+        assert cycle.mem_after == 3000
+
+    def test_mismatch(self, tmpdir):
+        fname = tmpdir.join('log')
+        fname.write(textwrap.dedent("""
+        [123] {foo
+        [789] {bar
+        [456] foo}
+        [0ab] bar}
+        """))
+        with pytest.raises(parse.ParseError):
+            parse.parallel(str(fname), workers=2)
+
+
+class TestFollower(object):
+
+    def test_follow(self, tmpdir):
+        fname = tmpdir.join('log')
+        fname.write('')
+        events = []
+        f = parse.Follower(str(fname), events.append)
+        assert f.poll() == 0
+        fname.write('[ff000] {gc-minor\n'
+                    'minor collect, total memory', mode='a')
+        assert f.poll() == 0
+        assert f.partial == 'minor collect, total memory'
+        fname.write(' used: 1000\n'
+                    '[ff100] gc-minor}\n'
+                    '[ff200] {gc-collect-step\n'
+                    'starting gc state:  SCAN', mode='a')
+        assert f.poll() == 1
+        assert events == [
+            GcMinor('ff000', 'gc-minor', 0x000, 0x100, memory=1000)
+        ]
+        assert [s.name for s in f.parser.stack] == ['gc-collect-step']
+        fname.write('NING\n'
+                    '[ff300] gc-collect-step}', mode='a')
+        assert f.poll() == 0 # the stop marker is not complete yet
+        fname.write('\n', mode='a')
+        assert f.poll() == 1
+        assert events[1] == GcCollectStep('ff200', 'gc-collect-step',
+                                          0x200, 0x300, phase='SCANNING')
+        assert f.poll() == 0
+
+    def test_small_blocks(self, tmpdir):
+        text = textwrap.dedent("""
+        [ff000] {foo
+        [ff200] {bar
+        [ff300] bar}
+        [ff400] foo}
+        """)
+        fname = tmpdir.join('log')
+        fname.write(text)
+        events = []
+        f = parse.Follower(str(fname), events.append, parser=parse.FlatParser)
+        f.BLOCK_SIZE = 3
+        assert f.poll() == 2
+        assert events == parse.flat(str(fname)).all_events()
+
+    def test_truncated(self, tmpdir):
+        fname = tmpdir.join('log')
+        fname.write('[ff000] {foo\n[ff100] foo}\n')
+        events = []
+        f = parse.Follower(str(fname), events.append)
+        assert f.poll() == 1
+        fname.write('[aa] {bar\n[bb] bar}\n')
+        assert f.poll() == 1
+        assert events == [
+            Event('ff000', 'foo', 0, 0x100),
+            Event('aa', 'bar', 0, 0x11),
+        ]
+
+    def test_follow_stop(self, tmpdir):
+        fname = tmpdir.join('log')
+        fname.write('[ff000] {foo\n[ff100] foo}\n')
+        events = []
+        calls = []
+        def stop():
+            calls.append(None)
+            return len(calls) > 2
+        parse.follow(str(fname), events.append, interval=0, stop=stop)
+        assert len(events) == 1
+
+
+def test_PayloadParser():
+    p = parse.PayloadParser(model.Event, [
+        (r'foo: (\d+)', [('foo', int)]),
+        (r'bar: (\w+) (\w+)', [('bar1', str), ('bar2', str)]),
+        (r'baz: (\d+)', [('baz', float)]),
+    ])
+    assert p.parse(['foo: 42\n', 'bar: a b\n', 'hello\n', 'baz: 3\n']) == {
+        'foo': 42, 'bar1': 'a', 'bar2': 'b', 'baz': 3.0}
+    assert p.parse(['bar: x y\n']) == {'bar1': 'x', 'bar2': 'y'}
+    assert p.parse([]) == {}
+
+def test_parse_marker():
+    pm = parse.parse_marker
+    assert pm('[ff000] {gc-minor') == ('start', 'ff000', 'gc-minor')
+    assert pm('[ff000] gc-minor}') == ('stop', 'ff000', 'gc-minor')
+    assert pm('[ABCdef] {foo_bar') == ('start', 'ABCdef', 'foo_bar')
+    assert pm('[p0, p1]') is None
+    assert pm('[] {foo') is None
+    assert pm('[xyz] {foo') is None
+    assert pm('[ff000] {') is None
+    assert pm('[ff000] foo') is None
+    assert pm('[ff000] {foo bar') is None
+    assert pm('ff000] {foo') is None
+
 def test_parse_frequency():
     pf = parse.parse_frequency
     assert pf('40') == 40
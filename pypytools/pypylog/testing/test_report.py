@@ -0,0 +1,120 @@
+import json
+import textwrap
+from cStringIO import StringIO
+from pytest import approx
+from pypytools.pypylog import report
+from pypytools.pypylog import cli
+from pypytools.pypylog.model import Event, GcMinor, MajorCycle, JitLoop
+
+
+class TestReport(object):
+
+    def test_sections(self):
+        r = report.Report()
+        r.add_event(GcMinor('0', 'gc-minor', 0.0, 0.1))
+        r.add_event(GcMinor('1', 'gc-minor', 1.0, 1.3))
+        r.add_event(Event('2', 'jit-tracing', 2.0, 2.5))
+        r.add_event(Event('3', 'jit-backend', 3.0, 3.25))
+        summary = r.summary()
+        assert summary['duration'] == 3.25
+        assert summary['gc_time'] == approx(0.4)
+        minor = summary['gc']['gc-minor']
+        assert minor['count'] == 2
+        assert minor['total'] == approx(0.4)
+        assert minor['max'] == approx(0.3)
+        assert minor['p50'] == approx(0.1, rel=0.02)
+        assert sorted(summary['jit']) == ['jit-backend', 'jit-tracing']
+        assert summary['jit']['jit-tracing']['total'] == 0.5
+
+    def test_worst_pauses(self):
+        r = report.Report(worst=3)
+        for i in range(10):
+            r.add_event(GcMinor(str(i), 'gc-minor', i, i + i/10.0))
+        r.add_event(Event('x', 'jit-tracing', 20, 30)) # not a GC pause
+        worst = r.summary()['worst_pauses']
+        assert [p['start'] for p in worst] == [9, 8, 7]
+        assert worst[0] == {'section': 'gc-minor', 'start': 9,
+                            'duration': approx(0.9)}
+
+    def test_major_cycles(self):
+        r = report.Report()
+        r.add_event(MajorCycle('0', 'gc-major-cycle', 0, 9, n_steps=5,
+                               step_time=5))
+        r.add_event(MajorCycle('1', 'gc-major-cycle', 10, 14, n_steps=2,
+                               step_time=3))
+        summary = r.summary()
+        assert 'gc-major-cycle' not in summary['gc']
+        majors = summary['major_cycles']
+        assert majors['duration']['count'] == 2
+        assert majors['duration']['total'] == 9 + 4
+        assert majors['step_time']['total'] == 8
+        assert majors['steps']['max'] == 5
+
+    def test_jit_loops(self):
+        r = report.Report(worst=2)
+        r.add_event(JitLoop('0', 'jit-loop', 0, 1, number='0', kind='loop',
+                            tracing_time=1))
+        r.add_event(JitLoop('1', 'jit-loop', 2, 5, number='1', kind='loop',
+                            tracing_time=1, backend_time=2))
+        r.add_event(JitLoop('2', 'jit-loop', 6, 8, number='0x12',
+                            kind='bridge', optimize_time=2))
+        loops = r.summary()['jit_loops']
+        assert [(l['number'], l['compile_time']) for l in loops] == [
+            ('1', 3), ('0x12', 2)]
+
+
+def write_log(tmpdir):
+    fname = tmpdir.join('log')
+    fname.write(textwrap.dedent("""\
+        [0] {gc-minor
+        minor collect, total memory used: 1000
+        [2] gc-minor}
+        [3] {gc-collect-step
+        starting gc state:  SCANNING
+        stopping, now in gc state:  SCANNING
+        [5] gc-collect-step}
+        [6] {jit-tracing
+        [7] {jit-log-opt-loop
+        # Loop 0 (f) : loop with 5 ops
+        [8] jit-log-opt-loop}
+        [a] jit-tracing}
+    """))
+    return fname
+
+def test_make_report(tmpdir):
+    fname = write_log(tmpdir)
+    summary = report.make_report(str(fname)).summary()
+    assert summary['duration'] == 10
+    assert summary['gc']['gc-minor']['count'] == 1
+    assert summary['gc']['gc-collect-step']['count'] == 1
+    assert summary['major_cycles']['duration']['count'] == 1
+    assert summary['jit']['jit-tracing']['total'] == 4
+    loop, = summary['jit_loops']
+    assert loop['number'] == '0'
+    assert loop['n_ops'] == 5
+    assert loop['tracing_time'] == 4
+
+def test_write_text(tmpdir):
+    summary = report.make_report(str(write_log(tmpdir))).summary()
+    f = StringIO()
+    report.write_text(summary, f)
+    text = f.getvalue()
+    assert 'GC time: 4.000000 (40.00%)' in text
+    assert 'Worst pauses' in text
+    assert 'jit-tracing' in text
+    assert 'loop 0 ' in text
+
+def test_main(tmpdir, capsys):
+    fname = write_log(tmpdir)
+    ret = cli.main(['report', str(fname), '--tsc-freq=1', '--format=json',
+                    '--worst=1'])
+    assert ret == 0
+    out, err = capsys.readouterr()
+    summary = json.loads(out)
+    assert summary['worst_pauses'] == [
+        {'section': 'gc-collect-step', 'start': 3, 'duration': 2}]
+
+def test_cli_unknown_command(capsys):
+    assert cli.main(['foo']) == 1
+    out, err = capsys.readouterr()
+    assert 'Usage: pypylog' in err
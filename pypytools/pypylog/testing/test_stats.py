@@ -0,0 +1,178 @@
+import json
+import pytest
+import numpy as np
+from cStringIO import StringIO
+from pytest import approx
+from pypytools.pypylog import stats
+from pypytools.pypylog import model
+from pypytools.pypylog.model import Event, GcMinor, GcCollectStep
+
+def make_log(cls=model.ColumnarPyPyLog):
+    log = cls()
+    log.add_event(GcMinor('0', 'gc-minor', 0.0, 0.1, memory=100))
+    log.add_event(GcMinor('1', 'gc-minor', 0.5, 0.6, memory=300))
+    log.add_event(GcMinor('2', 'gc-minor', 1.2, 1.5, memory=200))
+    # a gc-minor nested inside a gc-collect-step
+    log.add_event(GcMinor('3', 'gc-minor', 2.0, 2.2, memory=700))
+    log.add_event(GcCollectStep('4', 'gc-collect-step', 1.9, 2.4,
+                                phase='SCANNING'))
+    log.add_event(Event('5', 'jit-tracing', 3.0, 3.5))
+    return log
+
+
+def test_section_stats():
+    events = [Event(str(i), 'foo', i, i + (i+1)) for i in range(100)]
+    st = stats.section_stats(events)
+    assert st['count'] == 100
+    assert st['total'] == sum(range(1, 101))
+    assert st['mean'] == 50.5
+    assert st['p50'] == 50.5
+    assert st['p90'] == approx(90.1)
+    assert st['max'] == 100
+    assert stats.STAT_NAMES == ['count', 'total', 'mean', 'p50', 'p90',
+                                'p99', 'p99.9', 'max']
+
+def test_section_stats_empty():
+    st = stats.section_stats([])
+    assert st['count'] == 0
+    assert st['max'] == 0
+
+def test_pause_histogram():
+    events = [Event('0', 'foo', 0, 0.5), Event('1', 'foo', 0, 1.5),
+              Event('2', 'foo', 0, 1.7)]
+    counts, edges = stats.pause_histogram(events, bins=[0, 1, 2])
+    assert list(counts) == [1, 2]
+
+def test_merge_intervals():
+    start = np.array([5.0, 0, 1, 10, 6])
+    end = np.array([7.0, 2, 1.5, 11, 6.5])
+    s, e = stats.merge_intervals(start, end)
+    assert list(s) == [0, 5, 10]
+    assert list(e) == [2, 7, 11]
+
+def test_busy_time():
+    start = np.array([1.0, 5.0])
+    end = np.array([2.0, 8.0])
+    t = np.array([0, 1, 1.5, 3, 6, 10])
+    assert list(stats.busy_time(start, end, t)) == [0, 0, 0.5, 1, 2, 4]
+
+@pytest.mark.parametrize('cls', [model.GroupedPyPyLog, model.ColumnarPyPyLog])
+def test_gc_overhead(cls):
+    log = make_log(cls)
+    times, overhead = stats.gc_overhead(log, window=1.0)
+    assert list(times) == [0, 1, 2]
+    # [0, 1]: 0.1 + 0.1
+    # [1, 2]: 0.3 + 0.1 (the gc-collect-step starts at 1.9)
+    # [2, 3]: 0.4 (the nested gc-minor is not counted twice)
+    assert overhead == approx([0.2, 0.4, 0.4])
+
+def test_gc_overhead_empty():
+    times, overhead = stats.gc_overhead(model.GroupedPyPyLog())
+    assert len(times) == 0
+
+def test_minor_throughput():
+    log = make_log()
+    times, minors, growth = stats.minor_throughput(log, window=1.0)
+    assert list(times) == [0, 1, 2]
+    assert list(minors) == [2, 1, 1]
+    assert list(growth) == [200, 0, 500]
+
+def test_summarize_json():
+    log = make_log()
+    summary = stats.summarize(log)
+    f = StringIO()
+    stats.write_json(summary, f)
+    data = json.loads(f.getvalue())
+    assert sorted(data['sections']) == ['gc-collect-step', 'gc-minor',
+                                        'jit-tracing']
+    assert data['sections']['gc-minor']['count'] == 4
+    assert sorted(data['histograms']) == ['gc-collect-step', 'gc-minor']
+    assert sum(data['histograms']['gc-minor']['counts']) == 4
+    assert data['gc_overhead']['overhead'] == approx([0.2, 0.4, 0.4])
+
+def test_write_csv():
+    summary = stats.summarize(make_log())
+    f = StringIO()
+    stats.write_csv(summary, f)
+    lines = f.getvalue().splitlines()
+    assert lines[0] == 'section,count,total,mean,p50,p90,p99,p99.9,max'
+    assert len(lines) == 4
+    assert lines[3].startswith('jit-tracing,1,0.5,0.5,')
+
+def test_write_text():
+    summary = stats.summarize(make_log())
+    f = StringIO()
+    stats.write_text(summary, f)
+    text = f.getvalue()
+    assert 'gc-minor' in text
+    assert 'GC overhead (window 1.0s): mean 33.33%, max 40.00%' in text
+
+def test_main(tmpdir, capsys):
+    fname = tmpdir.join('log')
+    fname.write('[0] {gc-minor\n'
+                'minor collect, total memory used: 1000\n'
+                '[2] gc-minor}\n')
+    ret = stats.main([str(fname), '--tsc-freq=1', '--format=csv',
+                      '--no-cache'])
+    assert ret == 0
+    out, err = capsys.readouterr()
+    assert out.splitlines()[1] == 'gc-minor,1,2.0,2.0,2.0,2.0,2.0,2.0,2.0'
+
+
+class TestLogHistogram(object):
+
+    def test_percentile(self):
+        h = stats.LogHistogram(precision=0.01)
+        values = np.random.RandomState(42).lognormal(-6, 2, 10000)
+        for x in values:
+            h.add(x)
+        assert h.count == 10000
+        assert h.min == values.min()
+        assert h.max == values.max()
+        for p in stats.PERCENTILES:
+            expected = np.percentile(values, p)
+            assert h.percentile(p) == approx(expected, rel=0.02)
+        assert h.percentile(100) == values.max()
+
+    def test_small_values(self):
+        h = stats.LogHistogram()
+        h.add(0)
+        h.add(0)
+        h.add(1.0)
+        assert h.percentile(50) == 0.0
+        assert h.percentile(100) == approx(1.0, rel=0.01)
+        assert len(h.buckets) == 2
+
+    def test_empty(self):
+        h = stats.LogHistogram()
+        assert h.percentile(50) == 0.0
+
+
+def test_rankdata():
+    ranks, ties = stats.rankdata([3, 1, 2, 2])
+    assert list(ranks) == [4, 1, 2.5, 2.5]
+    assert list(ties) == [1, 2, 1]
+
+class TestMannWhitney(object):
+
+    def test_separated(self):
+        u, p = stats.mann_whitney([1, 2, 3, 4, 5], [6, 7, 8, 9, 10])
+        assert u == 0
+        assert p == approx(0.0122, rel=0.01)
+        u, p = stats.mann_whitney([6, 7, 8, 9, 10], [1, 2, 3, 4, 5])
+        assert u == 25
+        assert p == approx(0.0122, rel=0.01)
+
+    def test_same_distribution(self):
+        rnd = np.random.RandomState(42)
+        u, p = stats.mann_whitney(rnd.exponential(1, 1000),
+                                  rnd.exponential(1, 1000))
+        assert p > 0.01
+        u, p = stats.mann_whitney(rnd.exponential(1, 1000),
+                                  rnd.exponential(1.2, 1000))
+        assert p < 0.01
+
+    def test_degenerate(self):
+        assert stats.mann_whitney([], [1, 2]) == (0, 1)
+        u, p = stats.mann_whitney([1, 1, 1], [1, 1])
+        assert p == 1
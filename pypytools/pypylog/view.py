@@ -6,17 +6,19 @@ Options:
   --step            Plot the events as steps
   --tsc-freq=FREQ   Convert the TSC counter to seconds with the specified
                     frequency [default: auto]
+  --no-cache        Don't use the cache of the parsed log
 """
 
 import sys
 from collections import defaultdict
 import docopt
-import cpuinfo
 from pyqtgraph.Qt import QtGui, QtCore
 import numpy as np
 import pyqtgraph as pg
 from pypytools.pypylog import parse
 from pypytools.pypylog import model
+from pypytools.pypylog import cache
+from pypytools.pypylog import lod
 
 def make_palette(n):
     """
@@ -49,6 +51,9 @@ COLORS = {
     'jit-tracing': PALETTE[5],
     'jit-mem-collect': PALETTE[6],
 
+    # drawn by make_gc_collect_step
+    'gc-major-cycle': None,
+
     # uninteresting sections
     'gc-collect-done': None,
     'gc-hardware': None,
@@ -83,12 +88,34 @@ COLORS.update({
     })
 
 
+class LodScatter(object):
+    """
+    A scatter plot which contains only the points which are visible at the
+    current zoom level, as computed by lod.MinMaxPyramid
+    """
+
+    def __init__(self, item, events, X, Y):
+        self.item = item
+        self.events = events
+        self.X = X
+        self.Y = Y
+        self.pyramid = lod.MinMaxPyramid(X, Y)
+        self.indices = np.arange(0) # indices of the currently drawn events
+
+    def update(self, x0, x1, npixels):
+        self.indices = self.pyramid.query(x0, x1, npixels)
+        self.item.setData(x=self.X[self.indices], y=self.Y[self.indices])
+
+    def get_event(self, point):
+        return self.events[self.indices[point.index()]]
+
+
 class LogViewer(QtCore.QObject):
 
-    def __init__(self, fname, chart_type, freq):
+    def __init__(self, fname, chart_type, freq, use_cache=True):
         QtCore.QObject.__init__(self)
         self.global_config()
-        self.log = parse.gc(fname, model.GroupedPyPyLog(), freq)
+        self.log = cache.load(fname, freq, use_cache=use_cache)
         self.chart_type = chart_type
         self.log.print_summary()
         self.app = pg.mkQApp()
@@ -118,9 +145,15 @@ class LogViewer(QtCore.QObject):
         #
         self.time_legend = self.time_plot.addLegend()
         self.mem_legend = self.mem_plot.addLegend(offset=(-30, 30))
+        self.scatters = {} # PlotDataItem -> LodScatter
         self.make_charts()
         self.add_legend_handlers()
         self.set_axes()
+        self.update_scatters()
+        self.time_plot.sigXRangeChanged.connect(self.update_scatters)
+        # the level of detail depends on the width of the plot, so we need
+        # to recompute it when the window is resized
+        self.time_plot.getViewBox().sigResized.connect(self.update_scatters)
 
     @staticmethod
     def global_config():
@@ -133,13 +166,24 @@ class LogViewer(QtCore.QObject):
         self.remove_legend_handlers()
 
     def show(self):
+        self.win.show()
+        # the width of the plot is known only after the window has been
+        # laid out: render the scatter plots again at the right resolution
+        self.app.processEvents()
+        vb = self.time_plot.getViewBox()
+        self.update_scatters(vb)
         self.app.exec_()
 
     def eventFilter(self, source, event):
-        # press ESC to quit
+        # press ESC to quit, S to print the summary of the visible range
         if event.type() == QtCore.QEvent.KeyPress:
             if event.key() in (QtCore.Qt.Key_Escape, ord('Q')):
                 self.app.quit()
+            elif event.key() == ord('S'):
+                x0, x1 = self.time_plot.getViewBox().viewRange()[0]
+                print
+                print 'Summary of [%.6f, %.6f]' % (x0, x1)
+                self.log.print_summary(x0, x1)
         return False
 
     def set_axes(self):
@@ -166,33 +210,28 @@ class LogViewer(QtCore.QObject):
         name = 'gc-minor memory'
         color = COLORS[name]
         events = self.log.sections['gc-minor']
-        s = model.Series(len(events))
-        for i, ev in enumerate(events):
-            s[i] = ev.start, ev.memory
+        s = model.Series(len(events), dtype='d')
+        s.X[:] = events.start
+        s.Y[:] = events.column('memory')
         #print 'Max memory:', s.Y.max()
         self.mem_plot.plot(name=name, x=s.X, y=s.Y, pen=pg.mkPen(color))
 
     def make_gc_collect_step(self, name, color):
         # draw a plot of gc-collect-step, making sure that each major
-        # collection is disconnected from the other ones. We consider a major
-        # collection done when we see a transition from FINALIZING to
-        # SCANNING.
+        # collection is disconnected from the other ones: the cycles are
+        # reconstructed by the parser, see parse.MajorCycleBuilder
         pen = pg.mkPen(color)
         steps = self.log.sections['gc-collect-step']
-        NaN = float('NaN')
-        points = []
-        last_ev = None
+        cycles = self.log.sections.get('gc-major-cycle', [])
+        s = model.Series.from_events(steps, dtype='d')
+        _, cycle_end = model.event_arrays(cycles)
+        breaks = np.searchsorted(s.X, cycle_end, 'right')
+        X = np.insert(s.X, breaks, cycle_end)
+        Y = np.insert(s.Y, breaks, np.nan)
+        self.time_plot.plot(name=name, x=X, y=Y, pen=pen, connect='finite')
         phases = defaultdict(list)
         for ev in steps:
-            if (last_ev and last_ev.phase == 'FINALIZING' and
-                ev.phase == 'SCANNING'):
-                points.append((last_ev.start, NaN))
-                points.append((ev.start, NaN))
-            points.append(ev.as_point())
-            last_ev = ev
             phases[ev.phase].append(ev)
-        s = model.Series.from_points(points)
-        self.time_plot.plot(name=name, x=s.X, y=s.Y, pen=pen, connect='finite')
         #
         # draw points of different colors for each distinct phase
         size = 3
@@ -204,7 +243,7 @@ class LogViewer(QtCore.QObject):
         if name == 'gc-collect-step':
             self.make_gc_collect_step(name, color)
         elif t == 'step':
-            step_chart = model.make_step_chart(events)
+            step_chart = model.make_step_chart(events, dtype='d')
             pen = pg.mkPen(color, width=3)
             self.time_plot.plot(name=name,
                                 x=step_chart.X,
@@ -221,16 +260,32 @@ class LogViewer(QtCore.QObject):
         pen = pg.mkPen(color)
         brush = pg.mkBrush(color)
         size = 2
-        s = model.Series.from_events(events)
-        item = self.time_plot.scatterPlot(name=name, x=s.X, y=s.Y, size=size,
+        s = model.Series.from_events(events, dtype='d')
+        # the actual points are set by update_scatters
+        item = self.time_plot.scatterPlot(name=name, x=[], y=[], size=size,
                                           pen=pen, brush=brush)
-        for ev, p in zip(events, item.scatter.points()):
-            p.event = ev
+        self.scatters[item] = LodScatter(item, events, s.X, s.Y)
         item.sigPointsClicked.connect(self.on_points_clicked)
 
+    def update_scatters(self, *args):
+        # re-render the scatter plots at screen resolution, for the visible
+        # range only
+        vb = self.time_plot.getViewBox()
+        npixels = max(int(vb.width()), 1)
+        for scatter in self.scatters.values():
+            if len(scatter.pyramid) == 0:
+                continue
+            if args:
+                x0, x1 = vb.viewRange()[0]
+            else:
+                # first rendering: show everything
+                x0, x1 = scatter.pyramid.X[0], scatter.pyramid.X[-1]
+            scatter.update(x0, x1, npixels)
+
     def on_points_clicked(self, item, points):
+        scatter = self.scatters[item]
         for p in points:
-            print getattr(p, 'event', None)
+            print scatter.get_event(p)
 
     def add_legend_handlers(self):
         # toggle visibility of plot by clicking on the legend
@@ -277,20 +332,14 @@ class LogViewer(QtCore.QObject):
             label.setOpacity(0.5)
             curve.hide()
 
-def get_frequency(freq):
-    if freq == 'auto':
-        freq = cpuinfo.get_cpu_info()['hz_advertised_raw'][0] # Hz
-        return float(freq)
-    else:
-        return parse.parse_frequency(freq)
-
 def main(argv=None):
     args = docopt.docopt(__doc__, argv=argv)
     chart_type = 'dot'
     if args['--step']:
         chart_type = 'step'
-    freq = get_frequency(args['--tsc-freq'])
-    viewer = LogViewer(args['FILE'], chart_type, freq)
+    freq = parse.get_frequency(args['--tsc-freq'])
+    viewer = LogViewer(args['FILE'], chart_type, freq,
+                       use_cache=not args['--no-cache'])
     viewer.show()
 
 if __name__ == '__main__':
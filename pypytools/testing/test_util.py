@@ -10,3 +10,14 @@ def test_clonefunc():
     assert foo.__code__.co_code is foo2.__code__.co_code
     assert foo2.__name__ == 'foo'
     assert foo2(40, 2) == 42
+
+def test_clock():
+    import sys, time
+    from pypytools import IS_PYPY
+    from pypytools.util import clock, CLOCK_IS_MONOTONIC
+    a = clock()
+    time.sleep(0.01)
+    assert clock() > a
+    if ((IS_PYPY and sys.platform.startswith('linux')) or
+        hasattr(time, 'perf_counter')):
+        assert CLOCK_IS_MONOTONIC
@@ -3,6 +3,25 @@ from sys import version_info
 
 PY3 = version_info.major == 3
 
+# clock() measures the time in seconds; CLOCK_IS_MONOTONIC tells whether it
+# is guaranteed not to jump when the system time is adjusted
+try:
+    from time import perf_counter as clock
+    CLOCK_IS_MONOTONIC = True
+except ImportError:
+    try:
+        # Python 2 has no monotonic clock in the stdlib, but PyPy2 exposes
+        # clock_gettime() on the platforms which support it
+        from __pypy__.time import clock_gettime, CLOCK_MONOTONIC
+    except ImportError:
+        # last resort: the wall clock
+        from time import time as clock
+        CLOCK_IS_MONOTONIC = False
+    else:
+        def clock():
+            return clock_gettime(CLOCK_MONOTONIC)
+        CLOCK_IS_MONOTONIC = True
+
 def clonefunc(f):
     """Deep clone the given function to create a new one.
 
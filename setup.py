@@ -2,6 +2,13 @@
 
 from setuptools import setup
 
+# the dependencies of pypytools.pypylog and of the pypylog command: install
+# them with pip install pypytools[pypylog]. The interactive viewer needs also
+# the pypylog-view extra
+PYPYLOG_REQUIRES = ["numpy", "attrs", "docopt", "py-cpuinfo"]
+PYPYLOG_VIEW_REQUIRES = PYPYLOG_REQUIRES + ["pyqtgraph", "matplotlib",
+                                            "seaborn"]
+
 desc = "A collection of useful tools to use PyPy-specific features, with CPython fallbacks"
 
 
@@ -14,7 +21,14 @@ setup(
     license="MIT X11 style",
     description=desc,
     packages=["pypytools", "pypytools.compat", "pypytools.gc",
-              "pypytools.compat.micronumpy"],
+              "pypytools.compat.micronumpy", "pypytools.pypylog"],
     long_description=desc,
     install_requires=["py"],
+    extras_require={
+        "pypylog": PYPYLOG_REQUIRES,
+        "pypylog-view": PYPYLOG_VIEW_REQUIRES,
+    },
+    entry_points={
+        'console_scripts': ['pypylog=pypytools.pypylog.cli:main [pypylog]'],
+    },
 )